@@ -5,37 +5,58 @@ import os
 import sys  # Importar sys para usar en os.execv
 import pandas as pd
 from supabase import create_client, Client
-import hashlib
 from datetime import datetime
 import time
-import re
 from dotenv import load_dotenv
 import logging
 
+# Asegura que el path raíz esté en sys.path
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from mi_app.ingesta_transferencias import (
+    hashes_en_ventana, insertar_transferencias, resultado_vacio, acumular_resultado, resumen_ingesta
+)
+from mi_app.normalizacion_bancaria import (
+    normalizar_fechas, normalizar_montos, montos_para_hash, normalizar_ruts, extraer_ruts,
+    facturacion_por_numero, calcular_hashes
+)
+from mi_app.lector_cartolas import leer_excel_por_bloques
+from mi_app.resolutor_ruts import obtener_resolutor
+
 # --------------------------------------------------------------------------------
 # Configurar el logging para escribir en archivo y consola
 # --------------------------------------------------------------------------------
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)  # DEBUG para archivo, pero solo INFO en consola
+logger = logging.getLogger(__name__)
+
+def configurar_logging():
+    """
+    Configura el logger raíz con archivo y consola. Solo se usa al ejecutar el script
+    directamente, para no reemplazar los handlers de la aplicación al importarlo.
+    """
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG)  # DEBUG para archivo, pero solo INFO en consola
 
-# Crear un formateador
-formatter = logging.Formatter('%(asctime)s:%(levelname)s:%(message)s')
+    # Crear un formateador
+    formatter = logging.Formatter('%(asctime)s:%(levelname)s:%(message)s')
 
-# Handler para el archivo de log
-file_handler = logging.FileHandler('flujo_san_cristobal.log')
-file_handler.setLevel(logging.DEBUG)
-file_handler.setFormatter(formatter)
+    # Handler para el archivo de log
+    file_handler = logging.FileHandler('flujo_san_cristobal.log')
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(formatter)
 
-# Handler para la consola
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)  # Solo INFO o superior en consola
-console_handler.setFormatter(formatter)
+    # Handler para la consola
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)  # Solo INFO o superior en consola
+    console_handler.setFormatter(formatter)
 
-# Limpiar handlers previos y añadir los nuevos
-if logger.hasHandlers():
-    logger.handlers.clear()
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+    # Limpiar handlers previos y añadir los nuevos
+    if root.hasHandlers():
+        root.handlers.clear()
+    root.addHandler(file_handler)
+    root.addHandler(console_handler)
 
 # --------------------------------------------------------------------------------
 # Cargar variables de entorno directamente en el código
@@ -45,8 +66,6 @@ SUPABASE_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJpc3MiOiJzdXBhYmFzZSIsInJ
 CARPETA_ARCHIVOS = "Santander_archivos"
 # En este caso, no se procesan montos negativos, por lo que no se permite su procesamiento.
 
-logger.info("Inicio del script.")
-
 # Obtener el directorio del script actual
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Construir la ruta completa a la carpeta de archivos (ahora en uploads)
@@ -55,11 +74,6 @@ CARPETA_ARCHIVOS = os.path.join(SCRIPT_DIR, "uploads", "transferencias", "upload
 # Después de cargar las variables de entorno
 # logger.info(f"Buscando archivos en la carpeta: {CARPETA_ARCHIVOS}")
 
-# Verificar si la carpeta existe
-if not os.path.exists(CARPETA_ARCHIVOS):
-    # logger.error(f"La carpeta {CARPETA_ARCHIVOS} no existe")
-    sys.exit(0)
-
 # Listar archivos en la carpeta para debug
 # logger.info("Archivos encontrados en la carpeta:")
 # for archivo in os.listdir(CARPETA_ARCHIVOS):
@@ -72,8 +86,8 @@ try:
     supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
     # logger.info("Cliente de Supabase inicializado correctamente.")
 except Exception as e:
-    # logger.error(f"Error al inicializar el cliente de Supabase: {e}")
-    sys.exit(0)
+    logger.error(f"Error al inicializar el cliente de Supabase: {e}")
+    supabase = None
 
 # --------------------------------------------------------------------------------
 # Diccionario que mapea cada cadena a su empresa o banco (usado en SANTANDER)
@@ -89,6 +103,11 @@ MAPEO_EMPRESAS = {
 # --------------------------------------------------------------------------------
 CADENAS = list(MAPEO_EMPRESAS.keys())
 
+# --------------------------------------------------------------------------------
+# Columnas usadas de la cartola (el resto no se lee)
+# --------------------------------------------------------------------------------
+COLUMNAS_SANTANDER = ["MONTO", "DESCRIPCIÓN MOVIMIENTO", "FECHA"]
+
 # --------------------------------------------------------------------------------
 # Lista de RUTs a eliminar
 # --------------------------------------------------------------------------------
@@ -104,81 +123,9 @@ RUTS_A_ELIMINAR = [
 archivos_procesados = set()
 
 # --------------------------------------------------------------------------------
-# Funciones de Normalización
+# Funciones de Normalización: ver normalizacion_bancaria.py (vectorizadas)
 # --------------------------------------------------------------------------------
 
-def normalizar_fecha(fecha_str):
-    """
-    Normaliza la fecha al formato 'YYYY-MM-DD'.
-    """
-    try:
-        dt = pd.to_datetime(fecha_str, errors='coerce', dayfirst=True)
-        if pd.isna(dt):
-            return None
-        return dt.strftime("%Y-%m-%d")
-    except Exception as e:
-        logger.error(f"Error al normalizar fecha '{fecha_str}': {e}")
-        return None
-
-def normalizar_monto(valor):
-    """
-    Normaliza el monto asegurando que sea un entero positivo.
-    Retorna el valor como entero o None si no es válido.
-    """
-    try:
-        num = float(valor)
-        if num.is_integer() and num > 0:
-            return int(num)
-        else:
-            raise ValueError(f"Valor de monto inválido: {valor}")
-    except ValueError as e:
-        # logger.error(f"Error al normalizar monto '{valor}': {e}")
-        return None
-
-def normalizar_rut(rut_str):
-    """
-    Normaliza el RUT eliminando puntos y convirtiéndolo a mayúsculas.
-    """
-    try:
-        rut = str(rut_str).replace(".", "").upper().strip()
-        return rut
-    except Exception as e:
-        logger.error(f"Error al normalizar RUT '{rut_str}': {e}")
-        return rut_str
-
-# --------------------------------------------------------------------------------
-# Función para determinar si es persona o empresa
-# --------------------------------------------------------------------------------
-def determinar_facturacion(rut_str):
-    """
-    Determina si un RUT corresponde a 'persona' o 'empresa' basándose en su parte numérica.
-    Ejemplo: si el número del RUT < 50000000 -> persona, si no -> empresa.
-    Ajusta la lógica según tu regla real.
-    """
-    try:
-        partes = rut_str.split("-")
-        numero = partes[0] if len(partes) > 0 else rut_str
-        rut_int = int(numero)
-        if rut_int < 50000000:
-            return "persona"
-        else:
-            return "empresa"
-    except Exception as e:
-        # logger.warning(f"No se pudo determinar facturación para el RUT '{rut_str}'. Error: {e}")
-        return "persona"
-
-# --------------------------------------------------------------------------------
-# Función para calcular el hash único
-# --------------------------------------------------------------------------------
-def calcular_hash(row):
-    """
-    Genera un hash MD5 a partir de (monto, fecha, rut) normalizados.
-    Se registra en DEBUG la cadena base para confirmar que sea la esperada.
-    """
-    data = f"{row['monto']}_{row['fecha']}_{row['rut']}"
-    # logger.debug(f"Calculando hash para: {data}")
-    return hashlib.md5(data.encode('utf-8')).hexdigest()
-
 # --------------------------------------------------------------------------------
 # FUNCIÓN: manejar_respuesta
 # --------------------------------------------------------------------------------
@@ -199,25 +146,80 @@ def manejar_respuesta(response, contexto):
     return response.data
 
 # --------------------------------------------------------------------------------
-# FUNCIÓN: get_all_hashes
+# FUNCIÓN: cadena_de_archivo
+# --------------------------------------------------------------------------------
+def cadena_de_archivo(nombre_archivo):
+    """Devuelve la cadena (cuenta) de MAPEO_EMPRESAS presente en el nombre del archivo, o None"""
+    for cadena in CADENAS:
+        if cadena in nombre_archivo:
+            return cadena
+    return None
+
+# --------------------------------------------------------------------------------
+# FUNCIÓN: normalizar_bloque_santander
 # --------------------------------------------------------------------------------
-def get_all_hashes(supabase_client, batch_size=1000):
+def normalizar_bloque_santander(columnas_relevantes, cadena_encontrada):
     """
-    Recupera todos los hashes existentes en la tabla 'transferencias' paginando la consulta.
+    Normaliza un bloque de una cartola Santander.
+    Returns:
+        DataFrame con [monto, fecha, rut, facturación, hash, empresa, rs] (puede quedar vacío)
     """
-    all_hashes = []
-    offset = 0
-    while True:
-        response = supabase_client.table('transferencias').select('hash').range(offset, offset + batch_size - 1).execute()
-        batch = manejar_respuesta(response, "recuperar hashes existentes (paginado)")
-        if not batch or len(batch) == 0:
-            break
-        all_hashes.extend(batch)
-        if len(batch) < batch_size:
-            break
-        offset += batch_size
-    # logger.info(f"Se recuperaron {len(all_hashes)} hashes en total de la base de datos.")
-    return set(item['hash'] for item in all_hashes if item.get('hash') is not None)
+    # Normalizar 'monto' y eliminar filas donde la normalización falló
+    columnas_relevantes = columnas_relevantes.copy()
+    columnas_relevantes["MONTO"] = normalizar_montos(columnas_relevantes["MONTO"])
+    columnas_relevantes = columnas_relevantes[columnas_relevantes["MONTO"].notna()]
+
+    # Asignar la cadena (para identificar de dónde proviene si hay múltiples empresas)
+    columnas_relevantes["CADENA"] = cadena_encontrada
+
+    # Extraer RUT de la descripción usando regex y eliminar filas donde no se encontró
+    columnas_relevantes["rut"] = extraer_ruts(columnas_relevantes["DESCRIPCIÓN MOVIMIENTO"])
+    columnas_relevantes = columnas_relevantes.dropna(subset=["rut"])
+
+    # Normalizar RUT
+    columnas_relevantes["rut"] = normalizar_ruts(columnas_relevantes["rut"])
+
+    # Eliminar filas con RUTs a eliminar (COMENTADO TEMPORALMENTE)
+    # columnas_relevantes = columnas_relevantes[~columnas_relevantes['rut'].isin(RUTS_A_ELIMINAR)]
+
+    # Normalizar fechas a 'YYYY-MM-DD' y eliminar registros con fecha inválida
+    columnas_relevantes["fecha"] = normalizar_fechas(columnas_relevantes["FECHA"])
+    columnas_relevantes = columnas_relevantes[columnas_relevantes["fecha"].notna()]
+
+    # Renombrar columnas para estandarizar
+    columnas_relevantes = columnas_relevantes.rename(columns={"MONTO": "monto"})
+
+    # Determinar si es empresa o persona
+    columnas_relevantes["facturación"] = facturacion_por_numero(columnas_relevantes["rut"])
+
+    # Asignar la empresa basada en la cadena
+    empresa = MAPEO_EMPRESAS.get(cadena_encontrada, "Desconocida")
+    columnas_relevantes["empresa"] = empresa
+
+    # Calcular el hash con la fecha ya normalizada. Cadena base: monto_fecha_rut
+    columnas_relevantes["hash"] = calcular_hashes(
+        columnas_relevantes.assign(monto=montos_para_hash(columnas_relevantes["monto"], con_decimal=True)),
+        ["monto", "fecha", "rut"]
+    )
+
+    # Añadir la columna 'rs' con valores nulos inicialmente
+    columnas_relevantes["rs"] = None
+
+    # Reorganizar columnas para mayor claridad
+    return columnas_relevantes[["monto", "fecha", "rut", "facturación", "hash", "empresa", "rs"]]
+
+# --------------------------------------------------------------------------------
+# FUNCIÓN: leer_archivo_santander
+# --------------------------------------------------------------------------------
+def leer_archivo_santander(ruta_archivo, cadena_encontrada):
+    """
+    Lee una cartola Santander por bloques (solo MONTO, DESCRIPCIÓN MOVIMIENTO y FECHA;
+    el encabezado está en la fila 12) y entrega cada bloque ya normalizado.
+    Yields:
+        (DataFrame normalizado, filas leídas en el bloque)
+    """
+    for bloque in leer_excel_por_bloques(ruta_archivo, COLUMNAS_SANTANDER, fila_encabezado=11):
+        yield normalizar_bloque_santander(bloque, cadena_encontrada), len(bloque)
 
 # --------------------------------------------------------------------------------
 # FUNCIÓN: SANTANDER
@@ -227,117 +229,34 @@ def SANTANDER():
     dataframes = []
     archivos_encontrados = 0
 
-    # Definir la expresión regular para extraer el RUT
-    rut_regex = re.compile(r'\b0*([1-9]\d{6,7})[-.]?([0-9Kk])\b')
-
     for archivo in os.listdir(CARPETA_ARCHIVOS):
         # Evitar archivos temporales o repetidos
         if archivo.startswith("~$") or archivo in archivos_procesados:
             continue
 
-        cadena_encontrada = None
-        for cadena in CADENAS:
-            if cadena in archivo:
-                cadena_encontrada = cadena
-                break
+        cadena_encontrada = cadena_de_archivo(archivo)
 
         if cadena_encontrada:
             archivos_encontrados += 1
             logger.info(f"Archivo encontrado: {archivo}. Procesando...")
             ruta_archivo = os.path.join(CARPETA_ARCHIVOS, archivo)
+            inicio_archivo = time.perf_counter()
             try:
-                df = pd.read_excel(ruta_archivo, engine="openpyxl", skiprows=11)
-                
-                # Eliminar o comentar logs de depuración masiva
-                # logger.info(f"\nContenido del archivo {archivo}:")
-                # logger.info("\nPrimeras 5 filas del archivo original:")
-                # logger.info(df.head().to_string())
-                
-                columnas_relevantes = df[["MONTO", "DESCRIPCIÓN MOVIMIENTO", "FECHA"]].copy()
-                
-                # Eliminar o comentar logs de depuración masiva
-                # logger.info("\nColumnas relevantes seleccionadas:")
-                # logger.info(columnas_relevantes.head().to_string())
-                
-                # Eliminar o comentar logs de depuración masiva
-                # logger.info("\nDatos procesados (después de normalización):")
-                # logger.info(columnas_relevantes.head().to_string())
-
-                # Normalizar 'monto'
-                columnas_relevantes["MONTO"] = columnas_relevantes["MONTO"].apply(normalizar_monto)
-                # Eliminar filas donde la normalización de monto falló
-                columnas_relevantes = columnas_relevantes[columnas_relevantes["MONTO"].notna()]
-
-                # Asignar la cadena (para identificar de dónde proviene si hay múltiples empresas)
-                columnas_relevantes["CADENA"] = cadena_encontrada
-
-                # Extraer RUT de la descripción usando regex
-                def extraer_rut(descripcion):
-                    # Eliminar puntos para normalizar el formato del RUT
-                    descripcion_limpia = descripcion.replace('.', '')
-                    # logger.info(f"Buscando RUT en descripción: {descripcion_limpia}")
-                    matches = rut_regex.findall(descripcion_limpia)
-                    if matches:
-                        numero, verificador = matches[0]
-                        rut_completo = f"{numero}-{verificador.upper()}"
-                        # logger.info(f"RUT encontrado: {rut_completo}")
-                        return rut_completo
-                    else:
-                        # logger.warning(f"RUT no encontrado en la descripción: {descripcion}")
-                        return None
-
-                columnas_relevantes["rut"] = columnas_relevantes["DESCRIPCIÓN MOVIMIENTO"].apply(extraer_rut)
-                # Eliminar filas donde el RUT no fue encontrado
-                columnas_relevantes = columnas_relevantes.dropna(subset=["rut"])
-
-                # Normalizar RUT
-                columnas_relevantes["rut"] = columnas_relevantes["rut"].apply(normalizar_rut)
-
-                # Eliminar filas con RUTs a eliminar (COMENTADO TEMPORALMENTE)
-                # columnas_relevantes = columnas_relevantes[~columnas_relevantes['rut'].isin(RUTS_A_ELIMINAR)]
+                bloques = list(leer_archivo_santander(ruta_archivo, cadena_encontrada))
+                filas_leidas = sum(n for _, n in bloques)
+                columnas_relevantes = pd.concat([b for b, _ in bloques]) if bloques else pd.DataFrame()
+                archivos_procesados.add(archivo)
                 if columnas_relevantes.empty:
                     logger.info(
                         f"Todos los registros en el archivo {archivo} están en la lista de RUTs a eliminar o no hay datos válidos. Omitiendo archivo.")
-                    archivos_procesados.add(archivo)
                     continue
 
-                # Eliminar o comentar logs de depuración masiva
-                # logger.info(f"Primeras fechas originales en {archivo}:")
-                # logger.info(columnas_relevantes["FECHA"].head().to_string())
-
-                # Normalizar fechas a 'YYYY-MM-DD'
-                columnas_relevantes["fecha"] = columnas_relevantes["FECHA"].apply(normalizar_fecha)
-
-                # Eliminar registros con fecha inválida
-                columnas_relevantes = columnas_relevantes[columnas_relevantes["fecha"].notna()]
-
-                # Eliminar o comentar logs de depuración masiva
-                # logger.info(f"Primeras fechas procesadas en {archivo}:")
-                # logger.info(columnas_relevantes["fecha"].head().to_string())
-
-                # Renombrar columnas para estandarizar
-                columnas_relevantes = columnas_relevantes.rename(columns={"MONTO": "monto"})
-
-                # Determinar si es empresa o persona
-                columnas_relevantes["facturación"] = columnas_relevantes["rut"].apply(determinar_facturacion)
-
-                # Asignar la empresa basada en la cadena
-                empresa = MAPEO_EMPRESAS.get(cadena_encontrada, "Desconocida")
-                columnas_relevantes["empresa"] = empresa
-
-                # Calcular el hash con la fecha ya normalizada
-                columnas_relevantes["hash"] = columnas_relevantes.apply(calcular_hash, axis=1)
-
-                # Añadir la columna 'rs' con valores nulos inicialmente
-                columnas_relevantes["rs"] = None
-
-                # Reorganizar columnas para mayor claridad
-                columnas_relevantes = columnas_relevantes[
-                    ["monto", "fecha", "rut", "facturación", "hash", "empresa", "rs"]]
-
                 dataframes.append(columnas_relevantes)
-                archivos_procesados.add(archivo)
-                logger.info(f"Archivo procesado exitosamente: {archivo}")
+                logger.info(
+                    f"Archivo procesado exitosamente: {archivo} "
+                    f"(filas_leidas={filas_leidas}, validas={len(columnas_relevantes)}, "
+                    f"descartadas={filas_leidas - len(columnas_relevantes)}, "
+                    f"lectura={time.perf_counter() - inicio_archivo:.2f}s)")
                 
                 # Borrar el archivo después de procesarlo exitosamente
                 try:
@@ -361,18 +280,85 @@ def SANTANDER():
         logger.info("No se procesaron datos en SANTANDER.")
         return None
 
+# --------------------------------------------------------------------------------
+# Datos de referencia de un archivo (hashes existentes y 'rs' de empresas)
+# Un archivo se inserta por bloques; el contexto guarda lo ya consultado para
+# que cada fecha y cada RUT se busquen una sola vez por archivo y no una vez
+# por bloque.
+# --------------------------------------------------------------------------------
+
+# RUTs por consulta a datos_faltantes
+RUTS_POR_CONSULTA = 200
+
+def nuevo_contexto_archivo():
+    """Contexto vacío para la carga de un archivo (ver BASE_DE_DATOS)"""
+    return {"hashes": set(), "desde": None, "hasta": None, "rs": {}}
+
+def ampliar_ventana_hashes(supabase_client, contexto, fechas):
+    """
+    Agrega a contexto['hashes'] los hashes existentes en las fechas que aún no se consultaron.
+    Args:
+        fechas: Fechas (YYYY-MM-DD) de los registros del bloque
+    """
+    if not fechas:
+        return
+    desde, hasta = min(fechas), max(fechas)
+    if contexto["desde"] is None:
+        tramos = [(desde, hasta)]
+    else:
+        # Solo lo que queda fuera del rango ya consultado (el día del borde se repite)
+        tramos = []
+        if desde < contexto["desde"]:
+            tramos.append((desde, contexto["desde"]))
+        if hasta > contexto["hasta"]:
+            tramos.append((contexto["hasta"], hasta))
+    for tramo_desde, tramo_hasta in tramos:
+        logger.info(f"Recuperando hashes existentes entre {tramo_desde} y {tramo_hasta}...")
+        contexto["hashes"].update(hashes_en_ventana(
+            supabase_client, [{"fecha": tramo_desde}, {"fecha": tramo_hasta}], batch_size=1000))
+    contexto["desde"] = desde if contexto["desde"] is None else min(desde, contexto["desde"])
+    contexto["hasta"] = hasta if contexto["hasta"] is None else max(hasta, contexto["hasta"])
+
+def resolver_rs_empresas(supabase_client, contexto, ruts):
+    """Completa contexto['rs'] con la razón social de los RUTs de empresa aún no consultados"""
+    pendientes = [rut for rut in ruts if rut not in contexto["rs"]]
+    if not pendientes:
+        return
+    logger.info(f"Consultando 'rs' para {len(pendientes)} RUT(s) de empresa en bloque...")
+    for i in range(0, len(pendientes), RUTS_POR_CONSULTA):
+        lote = pendientes[i:i + RUTS_POR_CONSULTA]
+        try:
+            consulta_rs = supabase_client.table('datos_faltantes').select("rut, rs").in_("rut", lote).execute()
+            rs_data = manejar_respuesta(consulta_rs, f"consultar 'rs' en bloque para {len(lote)} RUT(s)") or []
+        except Exception as e:
+            logger.warning(f"Error consultando 'rs' para {len(lote)} RUT(s): {e}")
+            rs_data = []
+        for rut_emp in lote:
+            contexto["rs"].setdefault(rut_emp, None)
+        for fila in rs_data:
+            # Primera fila de cada RUT, como la consulta por RUT anterior
+            if contexto["rs"].get(fila["rut"]) is None:
+                contexto["rs"][fila["rut"]] = fila.get("rs")
+
 # --------------------------------------------------------------------------------
 # FUNCIÓN: BASE_DE_DATOS
 # --------------------------------------------------------------------------------
-def BASE_DE_DATOS(df_resultado, supabase_client):
+def BASE_DE_DATOS(df_resultado, supabase_client, contexto=None):
     """
     Inserta los datos procesados en la tabla 'transferencias' en Supabase,
     asegurando que solo se agreguen nuevos registros basados en el 'hash'.
     No se actualizan registros existentes.
+    Args:
+        contexto: Contexto del archivo (nuevo_contexto_archivo) compartido entre sus
+                  bloques; None = el DataFrame es el archivo completo
+    Returns:
+        dict con los conteos de insertados/duplicados/rechazados (None si no hay datos)
     """
     if df_resultado is None or df_resultado.empty:
         logger.info("No se encontraron datos nuevos para agregar a la base de datos.")
-        return
+        return None
+    contexto = contexto if contexto is not None else nuevo_contexto_archivo()
+    total_recibidos = len(df_resultado)
 
     logger.info(f"Cantidad de registros a revisar: {df_resultado.shape[0]}")
     logger.info("Primeras filas a insertar en la base de datos:")
@@ -388,26 +374,26 @@ def BASE_DE_DATOS(df_resultado, supabase_client):
         logger.info("Duplicados eliminados del DataFrame a insertar (manteniendo la primera ocurrencia).")
 
     # --------------------------------------------------------------------------------
-    # Recuperar todos los hashes existentes en la base de datos mediante paginación
+    # Recuperar solo los hashes existentes en las fechas que cubre el archivo
     # --------------------------------------------------------------------------------
     try:
-        logger.info("Recuperando hashes existentes en la base de datos (paginado)...")
-        hashes_existentes = get_all_hashes(supabase_client, batch_size=1000)
-        logger.debug(f"Hashes existentes: {hashes_existentes}")
+        ampliar_ventana_hashes(supabase_client, contexto, df_resultado['fecha'].dropna().tolist())
     except Exception as e:
         logger.error(f"Error al interactuar con Supabase al recuperar hashes existentes: {e}")
-        hashes_existentes = set()
+    ya_existentes = df_resultado['hash'].isin(contexto["hashes"])
 
     # Depuración: Mostrar los hashes del DataFrame antes de filtrar
     logger.debug(f"Hashes en DataFrame a insertar: {df_resultado['hash'].tolist()}")
 
     # Filtrar el DataFrame para excluir registros con hashes existentes
-    df_nuevos = df_resultado[~df_resultado['hash'].isin(hashes_existentes)]
+    df_nuevos = df_resultado[~ya_existentes]
     logger.info(f"Registros nuevos después de filtrar por hash: {df_nuevos.shape[0]}")
 
     if df_nuevos.empty:
         logger.info("No hay registros nuevos para insertar en la base de datos.")
-        return
+        resultado = resultado_vacio(total_recibidos)
+        resultado["duplicados"] = total_recibidos
+        return resultado
     else:
         logger.info(f"Se insertarán {df_nuevos.shape[0]} registros nuevos en la base de datos.")
 
@@ -420,21 +406,9 @@ def BASE_DE_DATOS(df_resultado, supabase_client):
     # Preparar 'rs' en bloque para las empresas
     # --------------------------------------------------------------------------------
     df_empresas = df_nuevos[df_nuevos["facturación"] == "empresa"]
-    rs_dict = {}
     if not df_empresas.empty:
-        ruts_empresas_unicos = df_empresas["rut"].unique().tolist()
-        logger.info(f"Consultando 'rs' para {len(ruts_empresas_unicos)} RUT(s) de empresa en bloque...")
-        for rut_emp in ruts_empresas_unicos:
-            try:
-                consulta_rs = supabase_client.table('datos_faltantes').select("rs").eq("rut", rut_emp).execute()
-                rs_data = manejar_respuesta(consulta_rs, f"consultar 'rs' en bloque para rut {rut_emp}")
-                if rs_data is not None and len(rs_data) > 0:
-                    rs_dict[rut_emp] = rs_data[0].get("rs", None)
-                else:
-                    rs_dict[rut_emp] = None
-            except Exception as e:
-                logger.warning(f"Error consultando 'rs' para {rut_emp}: {e}")
-                rs_dict[rut_emp] = None
+        resolver_rs_empresas(supabase_client, contexto, df_empresas["rut"].unique().tolist())
+    rs_dict = contexto["rs"]
 
     # Función auxiliar para determinar fecha_detec
     def determinar_fecha_detec(fecha_str):
@@ -446,9 +420,8 @@ def BASE_DE_DATOS(df_resultado, supabase_client):
         fecha_actual = datetime.now()
         return fecha_transaccion if fecha_actual > fecha_transaccion else fecha_actual
 
-    registros_agregados = 0
     datos_insertar = []
-    for _, row in df_nuevos.iterrows():
+    for row in df_nuevos.to_dict("records"):
         fecha_detec = determinar_fecha_detec(row["fecha"])
         if row["facturación"] == "persona":
             rs_value = row["rut"]
@@ -465,27 +438,26 @@ def BASE_DE_DATOS(df_resultado, supabase_client):
             "enviada": 0,
             "fecha_detec": fecha_detec.strftime("%Y-%m-%d %H:%M:%S")
         })
-        print(f"Nuevo hash insertado: {row['hash']} (monto={row['monto']}, fecha={row['fecha']}, rut={row['rut']})")
+        logger.debug(f"Nuevo hash a insertar: {row['hash']} (monto={row['monto']}, fecha={row['fecha']}, rut={row['rut']})")
 
     if datos_insertar:
         logger.info("Primeras filas con 'rs' asignado a insertar:")
         logger.info(pd.DataFrame(datos_insertar).head().to_string())
         logger.info("Insertando nuevos registros en la base de datos...")
-        try:
-            response_insert = supabase_client.table('transferencias').insert(datos_insertar).execute()
-            insert_data = manejar_respuesta(response_insert, "insertar nuevos registros")
-            if insert_data is not None:
-                registros_insertados = len(insert_data)
-                logger.info(f"Registros insertados exitosamente: {registros_insertados}.")
-                registros_agregados += registros_insertados
-            else:
-                logger.error("No se pudieron insertar los nuevos registros. Verifica la respuesta de Supabase.")
-        except Exception as e:
-            if "duplicate key value violates unique constraint" in str(e):
-                logger.warning("Registros duplicados encontrados. Se omiten registros duplicados.")
-            else:
-                logger.error(f"Error al interactuar con la base de datos en Supabase: {e}")
+        # Inserción por lotes con upsert on_conflict=hash: un hash repetido ya no hace fallar el lote completo
+        # El cliente se completa en memoria según el RUT del pagador
+        resultado = insertar_transferencias(supabase_client, datos_insertar, resolutor=obtener_resolutor(supabase_client))
+        # Los bloques siguientes del archivo ya no consultan estas fechas: sus hashes quedan conocidos
+        contexto["hashes"].update(d["hash"] for d in datos_insertar)
+        resultado["recibidos"] = total_recibidos
+        resultado["duplicados"] += total_recibidos - len(df_nuevos)
+        registros_agregados = resultado["insertados"]
+        logger.info(resumen_ingesta("SANTANDER", resultado))
+        if resultado["rechazados"]:
+            logger.warning(f"{resultado['rechazados']} registros rechazados por la base de datos o por datos faltantes.")
     else:
+        resultado = resultado_vacio(total_recibidos)
+        registros_agregados = 0
         logger.info("No hay datos para insertar después de asignar 'rs'.")
 
     if registros_agregados > 0:
@@ -494,14 +466,84 @@ def BASE_DE_DATOS(df_resultado, supabase_client):
         logger.info("No se agregaron registros nuevos a la base de datos.")
 
     # Mostrar hashes duplicados (omitidos)
-    df_duplicados = df_resultado[df_resultado['hash'].isin(hashes_existentes)]
+    df_duplicados = df_resultado[ya_existentes]
     for _, row in df_duplicados.iterrows():
         print(f"Hash duplicado (omitido): {row['hash']} (monto={row['monto']}, fecha={row['fecha']}, rut={row['rut']})")
 
+    return resultado
+
+# --------------------------------------------------------------------------------
+# FUNCIÓN: procesar_archivo_santander
+# --------------------------------------------------------------------------------
+def procesar_archivo_santander(ruta_archivo, supabase_client=None):
+    """
+    Procesa una sola cartola Santander y la inserta en 'transferencias'.
+    Pensada para llamarse desde el worker de ingesta sin lanzar un proceso nuevo.
+    Returns:
+        dict con los conteos de la carga (None si el archivo no tenía datos válidos).
+        Si la lectura falla después de insertar bloques, el dict trae además 'error'
+        con el motivo y el archivo no se borra.
+    """
+    supabase_client = supabase_client or supabase
+    archivo = os.path.basename(ruta_archivo)
+    cadena_encontrada = cadena_de_archivo(archivo)
+    if not cadena_encontrada:
+        raise ValueError(f"El archivo {archivo} no corresponde a ninguna cuenta Santander conocida")
+
+    # Cada bloque se inserta apenas se normaliza, sin esperar a leer el archivo completo;
+    # los hashes y 'rs' ya consultados se reutilizan entre bloques
+    resultado = resultado_vacio()
+    contexto = nuevo_contexto_archivo()
+    filas_leidas = 0
+    tiempo_lectura = 0.0
+    bloques = leer_archivo_santander(ruta_archivo, cadena_encontrada)
+    while True:
+        inicio = time.perf_counter()
+        try:
+            df_bloque, filas_bloque = next(bloques)
+        except StopIteration:
+            break
+        except Exception as e:
+            if filas_leidas == 0:
+                raise
+            # Los bloques anteriores ya quedaron insertados: se informan sus conteos y no se borra el archivo
+            logger.error(f"Error al leer el archivo {archivo} después de {filas_leidas} filas: {e}")
+            resultado["rechazados"] += filas_leidas - resultado["recibidos"]
+            resultado["error"] = f"Error al leer el archivo: {e}"
+            return resultado
+        tiempo_lectura += time.perf_counter() - inicio
+        filas_leidas += filas_bloque
+        parcial = BASE_DE_DATOS(df_bloque, supabase_client, contexto)
+        if parcial is not None:
+            acumular_resultado(resultado, parcial)
+
+    if resultado["recibidos"] == 0:
+        logger.info(f"Todos los registros en el archivo {archivo} están en la lista de RUTs a eliminar o no hay datos válidos.")
+        return None
+    resultado["rechazados"] += filas_leidas - resultado["recibidos"]
+    logger.info(resumen_ingesta(archivo, resultado, filas_leidas, tiempo_lectura))
+
+    # Borrar el archivo después de procesarlo exitosamente
+    try:
+        os.remove(ruta_archivo)
+        logger.info(f"Archivo borrado exitosamente: {archivo}")
+    except Exception as e:
+        logger.error(f"Error al borrar el archivo {archivo}: {e}")
+
+    return resultado
+
 # --------------------------------------------------------------------------------
 # Bloque principal de ejecución
 # --------------------------------------------------------------------------------
 if __name__ == "__main__":
+    configurar_logging()
+    logger.info("Inicio del script.")
+
+    # Verificar si la carpeta existe
+    if not os.path.exists(CARPETA_ARCHIVOS) or supabase is None:
+        # logger.error(f"La carpeta {CARPETA_ARCHIVOS} no existe")
+        sys.exit(0)
+
     try:
         logger.info("Iniciando procesamiento de datos de Santander...")
         # Silenciar logs de httpx, httpcore y supabase a WARNING o superior
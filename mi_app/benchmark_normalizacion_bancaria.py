@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Script para comparar la normalización vectorizada (normalizacion_bancaria.py) con las
+funciones fila por fila de bci.py y Santander.py sobre una cartola sintética de 50.000 filas.
+Verifica que ambos caminos produzcan los mismos valores (y los mismos hashes) y mide el tiempo.
+"""
+
+import os
+import sys
+import re
+import time
+import random
+import hashlib
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# Asegura que el path raíz esté en sys.path
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from mi_app.normalizacion_bancaria import (
+    normalizar_fechas, normalizar_montos, montos_para_hash, normalizar_ruts, extraer_ruts,
+    facturacion_por_numero, facturacion_por_prefijo, calcular_fechas_detec, calcular_hashes
+)
+
+FILAS = int(os.getenv("FILAS_BENCHMARK", "50000"))
+
+# -----------------------------------------------------------------------------
+# Funciones fila por fila originales (copiadas tal cual para comparar)
+# -----------------------------------------------------------------------------
+def normalizar_fecha(fecha_str):
+    try:
+        dt = pd.to_datetime(fecha_str, errors='coerce', dayfirst=True)
+        if pd.isna(dt):
+            return None
+        return dt.strftime("%Y-%m-%d")
+    except Exception:
+        return None
+
+def normalizar_monto(valor):
+    try:
+        num = float(valor)
+        if num.is_integer() and num > 0:
+            return int(num)
+        else:
+            raise ValueError(f"Valor de monto inválido: {valor}")
+    except ValueError:
+        return None
+
+def normalizar_rut(rut_str):
+    try:
+        return str(rut_str).replace(".", "").upper().strip()
+    except Exception:
+        return rut_str
+
+def determinar_facturacion(rut_str):
+    try:
+        partes = rut_str.split("-")
+        numero = partes[0] if len(partes) > 0 else rut_str
+        return "persona" if int(numero) < 50000000 else "empresa"
+    except Exception:
+        return "persona"
+
+def calcular_fecha_detec(fecha, hora):
+    try:
+        if len(hora.split(':')) == 2:
+            hora = f"{hora}:00"
+        dt = datetime.strptime(f"{fecha} {hora}", "%Y-%m-%d %H:%M:%S")
+        return dt.strftime("%Y-%m-%d %H:%M:%S")
+    except Exception:
+        return None
+
+def calcular_hash_fila(datos_fila):
+    data = f"{datos_fila['monto']}_{datos_fila['Fecha']}_{datos_fila['rut']}_{datos_fila['codigo_transaccion']}_{datos_fila['hora_transaccion']}"
+    return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+def calcular_hash(row):
+    data = f"{row['monto']}_{row['fecha']}_{row['rut']}"
+    return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+rut_regex = re.compile(r'\b0*([1-9]\d{6,7})[-.]?([0-9Kk])\b')
+
+def extraer_rut(descripcion):
+    descripcion_limpia = descripcion.replace('.', '')
+    matches = rut_regex.findall(descripcion_limpia)
+    if matches:
+        numero, verificador = matches[0]
+        return f"{numero}-{verificador.upper()}"
+    return None
+
+# -----------------------------------------------------------------------------
+# Cartolas sintéticas
+# -----------------------------------------------------------------------------
+def rut_aleatorio(rnd):
+    numero = rnd.randint(5000000, 79999999)
+    dv = rnd.choice("0123456789K")
+    return f"{numero:,}".replace(",", ".") + f"-{dv}"
+
+def generar_bci(filas, semilla=1):
+    rnd = random.Random(semilla)
+    inicio = datetime(2025, 1, 1)
+    datos = []
+    for i in range(filas):
+        fecha = inicio + timedelta(days=rnd.randint(0, 120))
+        datos.append({
+            # Solo formatos día/mes: con fechas ISO la versión fila por fila puede intercambiar día y mes
+            "Fecha": fecha.strftime("%d/%m/%Y") if rnd.random() < 0.9 else fecha.strftime("%d-%m-%Y"),
+            # Filas sin ingreso (egresos) como en las cartolas reales
+            "monto": rnd.choice([rnd.randint(1, 5000) * 1000, rnd.randint(1, 5000) * 1000, None]),
+            "rut": rut_aleatorio(rnd).lower() if rnd.random() < 0.1 else rut_aleatorio(rnd),
+            "rs": f"Cliente {rnd.randint(1, 500)}",
+            "codigo_transaccion": rnd.randint(100000, 999999),
+            "hora_transaccion": f"{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}" + (f":{rnd.randint(0, 59):02d}" if rnd.random() < 0.5 else "")
+        })
+    return pd.DataFrame(datos)
+
+def generar_santander(filas, semilla=2):
+    rnd = random.Random(semilla)
+    inicio = datetime(2025, 1, 1)
+    datos = []
+    for i in range(filas):
+        fecha = inicio + timedelta(days=rnd.randint(0, 120))
+        rut = rut_aleatorio(rnd)
+        descripcion = rnd.choice([
+            f"Transf de {rut} Cliente {i}",
+            f"TRANSFERENCIA DE 0{rut.replace('.', '')} SPA",
+            "Cargo por comisión mantención",
+        ])
+        datos.append({
+            "MONTO": rnd.choice([rnd.randint(1, 5000) * 1000, -rnd.randint(1, 5000) * 1000]),
+            "DESCRIPCIÓN MOVIMIENTO": descripcion,
+            "FECHA": fecha.strftime("%d/%m/%Y") if rnd.random() < 0.8 else fecha.strftime("%d-%m-%Y")
+        })
+    return pd.DataFrame(datos)
+
+# -----------------------------------------------------------------------------
+# Pipelines
+# -----------------------------------------------------------------------------
+def bci_fila_por_fila(df):
+    df = df[df["monto"].notna()].copy()
+    df["Fecha"] = df["Fecha"].apply(normalizar_fecha)
+    df = df[df["Fecha"].notnull()]
+    df["monto"] = df["monto"].apply(normalizar_monto)
+    df = df[df["monto"].notna()]
+    df["rut"] = df["rut"].apply(normalizar_rut)
+    df["facturación"] = df["rut"].apply(lambda x: "empresa" if str(x).startswith("7") else "persona")
+    df["fecha_detec"] = df.apply(lambda row: calcular_fecha_detec(row["Fecha"], row["hora_transaccion"]), axis=1)
+    df["hash"] = df.apply(lambda row: calcular_hash_fila({
+        "monto": row["monto"],
+        "Fecha": row["Fecha"],
+        "rut": row["rut"],
+        "codigo_transaccion": row["codigo_transaccion"],
+        "hora_transaccion": row["hora_transaccion"]
+    }), axis=1)
+    return df
+
+def bci_vectorizado(df):
+    df = df[df["monto"].notna()].copy()
+    df["Fecha"] = normalizar_fechas(df["Fecha"])
+    df = df[df["Fecha"].notnull()]
+    df["monto"] = normalizar_montos(df["monto"])
+    df = df[df["monto"].notna()]
+    df["rut"] = normalizar_ruts(df["rut"])
+    df["facturación"] = facturacion_por_prefijo(df["rut"])
+    df["fecha_detec"] = calcular_fechas_detec(df["Fecha"], df["hora_transaccion"])
+    df["hash"] = calcular_hashes(
+        df.assign(monto=montos_para_hash(df["monto"], con_decimal=False)),
+        ["monto", "Fecha", "rut", "codigo_transaccion", "hora_transaccion"]
+    )
+    return df
+
+def santander_fila_por_fila(df):
+    df = df.copy()
+    df["MONTO"] = df["MONTO"].apply(normalizar_monto)
+    df = df[df["MONTO"].notna()]
+    df["rut"] = df["DESCRIPCIÓN MOVIMIENTO"].apply(extraer_rut)
+    df = df.dropna(subset=["rut"])
+    df["rut"] = df["rut"].apply(normalizar_rut)
+    df["fecha"] = df["FECHA"].apply(normalizar_fecha)
+    df = df[df["fecha"].notna()]
+    df = df.rename(columns={"MONTO": "monto"})
+    df["facturación"] = df["rut"].apply(determinar_facturacion)
+    df["hash"] = df.apply(calcular_hash, axis=1)
+    return df
+
+def santander_vectorizado(df):
+    df = df.copy()
+    df["MONTO"] = normalizar_montos(df["MONTO"])
+    df = df[df["MONTO"].notna()]
+    df["rut"] = extraer_ruts(df["DESCRIPCIÓN MOVIMIENTO"])
+    df = df.dropna(subset=["rut"])
+    df["rut"] = normalizar_ruts(df["rut"])
+    df["fecha"] = normalizar_fechas(df["FECHA"])
+    df = df[df["fecha"].notna()]
+    df = df.rename(columns={"MONTO": "monto"})
+    df["facturación"] = facturacion_por_numero(df["rut"])
+    df["hash"] = calcular_hashes(df.assign(monto=montos_para_hash(df["monto"], con_decimal=True)), ["monto", "fecha", "rut"])
+    return df
+
+def comparar(nombre, generar, fila_por_fila, vectorizado, columnas):
+    df = generar(FILAS)
+
+    inicio = time.perf_counter()
+    esperado = fila_por_fila(df)
+    tiempo_original = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    obtenido = vectorizado(df)
+    tiempo_vectorizado = time.perf_counter() - inicio
+
+    print(f"\n📄 {nombre}: {len(df):,} filas leídas, {len(esperado):,} válidas")
+    print(f"   ⏱️  Fila por fila: {tiempo_original:.2f}s")
+    print(f"   ⏱️  Vectorizado:   {tiempo_vectorizado:.2f}s")
+    print(f"   🚀 Aceleración:   {tiempo_original / max(tiempo_vectorizado, 1e-9):.1f}x")
+
+    if list(esperado.index) != list(obtenido.index):
+        print(f"   ❌ Las filas válidas no coinciden ({len(esperado)} vs {len(obtenido)})")
+        return False
+    ok = True
+    for columna in columnas:
+        if columna == "monto":
+            # El dtype puede variar (int64/float64); se compara el valor
+            diferentes = (esperado[columna].astype(float) != obtenido[columna].astype(float)).sum()
+        else:
+            diferentes = (esperado[columna].astype(object).astype(str) != obtenido[columna].astype(object).astype(str)).sum()
+        if diferentes:
+            ok = False
+            print(f"   ❌ Columna '{columna}': {diferentes} valores distintos")
+    if ok:
+        print(f"   ✅ Mismos valores en {', '.join(columnas)}")
+    return ok
+
+def benchmark_normalizacion():
+    print("🔍 NORMALIZACIÓN DE CARTOLAS: FILA POR FILA vs VECTORIZADA")
+    print("=" * 60)
+    ok_bci = comparar("BCI", generar_bci, bci_fila_por_fila, bci_vectorizado,
+                      ["Fecha", "monto", "rut", "facturación", "fecha_detec", "hash"])
+    ok_santander = comparar("Santander", generar_santander, santander_fila_por_fila, santander_vectorizado,
+                            ["monto", "fecha", "rut", "facturación", "hash"])
+    return ok_bci and ok_santander
+
+if __name__ == "__main__":
+    sys.exit(0 if benchmark_normalizacion() else 1)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Script para medir la resolución de RUT pagador -> cliente con el índice en memoria
+(resolutor_ruts.py) frente a la búsqueda recorriendo las columnas pagador1..pagador200.
+Usa datos sintéticos: no consulta Supabase.
+"""
+
+import os
+import sys
+import time
+import random
+
+# Asegura que el path raíz esté en sys.path
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from mi_app.resolutor_ruts import ResolutorRuts, cuerpo_rut
+
+CLIENTES = int(os.getenv("CLIENTES_BENCHMARK", "300"))
+RUTS_POR_CLIENTE = int(os.getenv("RUTS_POR_CLIENTE_BENCHMARK", "40"))
+CONSULTAS = int(os.getenv("CONSULTAS_BENCHMARK", "100000"))
+# La búsqueda por columnas es lenta: se mide con menos consultas y se extrapola
+CONSULTAS_COLUMNAS = int(os.getenv("CONSULTAS_COLUMNAS_BENCHMARK", "500"))
+
+def digito_verificador(numero):
+    suma, multiplo = 0, 2
+    for d in reversed(str(numero)):
+        suma += int(d) * multiplo
+        multiplo = 2 if multiplo == 7 else multiplo + 1
+    resto = 11 - suma % 11
+    return "0" if resto == 11 else "K" if resto == 10 else str(resto)
+
+def generar_pagadores():
+    """Filas de cliente_pagadores sintéticas y su equivalente en columnas anchas"""
+    random.seed(14)
+    numeros = random.sample(range(5_000_000, 30_000_000), CLIENTES * RUTS_POR_CLIENTE)
+    filas = []
+    anchas = []
+    for c in range(CLIENTES):
+        cliente = f"Cliente {c:04d}"
+        fila_ancha = {"cliente": cliente}
+        for i in range(RUTS_POR_CLIENTE):
+            numero = numeros[c * RUTS_POR_CLIENTE + i]
+            rut = f"{numero}-{digito_verificador(numero)}"
+            filas.append({"id": len(filas) + 1, "cliente": cliente, "rut": rut})
+            fila_ancha[f"pagador{i + 1}"] = rut
+        for i in range(RUTS_POR_CLIENTE, 200):
+            fila_ancha[f"pagador{i + 1}"] = "EMPTY"
+        anchas.append(fila_ancha)
+    return filas, anchas
+
+def buscar_en_columnas(anchas, rut):
+    """Búsqueda anterior: recorre cada cliente y sus 200 columnas de pagador"""
+    for fila in anchas:
+        for i in range(1, 201):
+            if fila[f"pagador{i}"] == rut:
+                return fila["cliente"]
+    return None
+
+def benchmark_resolutor():
+    print("🔍 RESOLUCIÓN RUT -> CLIENTE: COLUMNAS pagadorN vs ÍNDICE EN MEMORIA")
+    print("=" * 60)
+    filas, anchas = generar_pagadores()
+    print(f"📊 {CLIENTES} clientes, {len(filas)} RUT de pagadores")
+
+    resolutor = ResolutorRuts(None)
+    inicio = time.perf_counter()
+    resolutor.cargar(filas)
+    print(f"   ⏱️  Construcción del índice: {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+    # Mitad de RUT conocidos (con puntos o ceros a la izquierda) y mitad desconocidos
+    random.seed(41)
+    consultas = []
+    for _ in range(CONSULTAS):
+        if random.random() < 0.5:
+            fila = random.choice(filas)
+            numero, dv = fila["rut"].split("-")
+            rut = random.choice([fila["rut"], f"{int(numero):,}".replace(",", ".") + f"-{dv}", f"00{numero}-{dv}"])
+            consultas.append((rut, fila["cliente"]))
+        else:
+            numero = random.randrange(30_000_000, 40_000_000)
+            consultas.append((f"{numero}-{digito_verificador(numero)}", None))
+
+    inicio = time.perf_counter()
+    resueltos = [resolutor.resolver(rut) for rut, _ in consultas]
+    tiempo_indice = time.perf_counter() - inicio
+    errores = sum(1 for (rut, esperado), obtenido in zip(consultas, resueltos) if obtenido != esperado)
+
+    registros = [{"rut": rut} for rut, _ in consultas]
+    inicio = time.perf_counter()
+    asignados = resolutor.asignar_clientes(registros)
+    tiempo_lote = time.perf_counter() - inicio
+
+    muestra = [(rut.replace(".", "").lstrip("0"), esperado) for rut, esperado in consultas[:CONSULTAS_COLUMNAS]]
+    inicio = time.perf_counter()
+    errores_columnas = sum(1 for rut, esperado in muestra if buscar_en_columnas(anchas, rut) != esperado)
+    tiempo_columnas = (time.perf_counter() - inicio) * CONSULTAS / len(muestra)
+
+    print(f"   ⏱️  Columnas pagadorN (extrapolado): {tiempo_columnas:.2f}s ({CONSULTAS / tiempo_columnas:,.0f} consultas/s)")
+    print(f"   ⏱️  Índice, resolver():              {tiempo_indice:.3f}s ({CONSULTAS / tiempo_indice:,.0f} consultas/s)")
+    print(f"   ⏱️  Índice, asignar_clientes():      {tiempo_lote:.3f}s ({CONSULTAS / tiempo_lote:,.0f} registros/s)")
+    print(f"   🚀 Aceleración: {tiempo_columnas / max(tiempo_indice, 1e-9):.0f}x")
+
+    ok = True
+    if errores or errores_columnas:
+        ok = False
+        print(f"   ❌ Resultados incorrectos: índice={errores}, columnas={errores_columnas}")
+    esperados = sum(1 for _, esperado in consultas if esperado is not None)
+    if asignados != esperados:
+        ok = False
+        print(f"   ❌ asignar_clientes asignó {asignados} de {esperados} registros conocidos")
+
+    # Un RUT en dos clientes no se asigna automáticamente
+    resolutor.registrar(filas[0]["rut"], "Otro cliente")
+    if resolutor.resolver(filas[0]["rut"]) is not None:
+        ok = False
+        print("   ❌ Un RUT de dos clientes se resolvió a uno de ellos")
+    if cuerpo_rut("12.345.678-5") != 12345678 or cuerpo_rut("12345678") is not None:
+        ok = False
+        print("   ❌ cuerpo_rut no normaliza como se espera")
+
+    if ok:
+        print("   ✅ Mismos clientes que la búsqueda por columnas; RUT ambiguos sin asignar")
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if benchmark_resolutor() else 1)
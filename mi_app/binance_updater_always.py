@@ -65,6 +65,21 @@ def cargar_variables_entorno():
 # Cargar variables de entorno antes de importar módulos
 cargar_variables_entorno()
 
+def avisar_compras_actualizadas(registros):
+    """
+    Toca la marca de compras de cada fecha de los registros para que la web
+    recalcule sus totales diarios (ver compras_del_dia en totales_diarios.py).
+    Este proceso no tiene aplicación Flask: no puede invalidar el cache directamente.
+    """
+    try:
+        from mi_app.mi_app.cache_compartido import tocar_marca
+        fechas = {str(r['createtime'])[:10] for r in registros if r.get('createtime')}
+        for fecha in fechas:
+            tocar_marca(f"compras:{fecha}")
+    except Exception as e:
+        # Sin la marca, la web ve las órdenes nuevas al vencer su cache
+        logging.error(f"Error al marcar compras actualizadas: {e}")
+
 def ejecutar_escaneo_binance(fecha_escaneo=None):
     """Función principal para escanear datos de Binance"""
     try:
@@ -180,6 +195,7 @@ def ejecutar_escaneo_binance(fecha_escaneo=None):
                     if records_to_upsert:
                         logging.info(f"Realizando upsert de {len(records_to_upsert)} registros.")
                         supabase.table('compras').upsert(records_to_upsert, on_conflict='ordernumber').execute()
+                        avisar_compras_actualizadas(records_to_upsert)
                     else:
                         logging.info("No hay registros nuevos o actualizados.")
             except Exception as e:
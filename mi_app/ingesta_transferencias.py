@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Inserción masiva de transferencias bancarias (BCI / Santander).
+Deduplica por 'hash' y escribe en lotes con upsert on_conflict=hash,
+en lugar de consultar e insertar fila por fila.
+"""
+
+import os
+import time
+
+# Tamaño de lote para los upsert en 'transferencias'
+TAMANO_LOTE = 500
+
+# Campos mínimos que debe tener un registro para enviarse a la base de datos
+CAMPOS_REQUERIDOS = ["monto", "fecha", "rut", "hash", "empresa", "fecha_detec"]
+
+def _es_vacio(valor):
+    """True si el valor es None, NaN o texto vacío"""
+    if valor is None:
+        return True
+    if isinstance(valor, float) and valor != valor:
+        return True
+    return isinstance(valor, str) and valor.strip() == ""
+
+def _insertar_lote(supabase_client, lote):
+    """
+    Inserta un lote ignorando los hashes que ya existen.
+    Returns:
+        (insertados, duplicados, rechazados)
+    """
+    try:
+        response = supabase_client.table("transferencias").upsert(
+            lote, on_conflict="hash", ignore_duplicates=True
+        ).execute()
+        insertados = len(response.data or [])
+        return insertados, len(lote) - insertados, 0
+    except Exception:
+        # Si el lote falla completo, reintentar fila por fila para aislar los registros inválidos
+        insertados = duplicados = rechazados = 0
+        for registro in lote:
+            try:
+                response = supabase_client.table("transferencias").upsert(
+                    [registro], on_conflict="hash", ignore_duplicates=True
+                ).execute()
+                if response.data:
+                    insertados += 1
+                else:
+                    duplicados += 1
+            except Exception:
+                rechazados += 1
+        return insertados, duplicados, rechazados
+
+def resultado_vacio(recibidos=0):
+    """Conteos y tiempos en cero para una carga"""
+    return {
+        "recibidos": recibidos,
+        "insertados": 0,
+        "duplicados": 0,
+        "rechazados": 0,
+        "clientes_asignados": 0,
+        "tiempo_dedup": 0.0,
+        "tiempo_insercion": 0.0,
+        "tiempo_total": 0.0
+    }
+
+def acumular_resultado(total, parcial):
+    """Suma los conteos y tiempos de una carga parcial (por ejemplo, un bloque) al total"""
+    for clave, valor in parcial.items():
+        total[clave] = total.get(clave, 0) + valor
+    return total
+
+def hashes_en_ventana(supabase_client, registros, batch_size=1000):
+    """
+    Recupera los hashes existentes solo en el rango de fechas que cubren los registros.
+    Como la fecha forma parte del hash, un registro repetido siempre cae dentro de ese rango.
+    Args:
+        supabase_client: Cliente de Supabase
+        registros: Lista de dicts con 'fecha' (YYYY-MM-DD)
+        batch_size: Filas por página
+    Returns:
+        set de hashes ya presentes en 'transferencias' para esas fechas
+    """
+    fechas = [r["fecha"] for r in registros if not _es_vacio(r.get("fecha"))]
+    if not fechas:
+        return set()
+    fecha_min, fecha_max = min(fechas), max(fechas)
+    hashes = set()
+    offset = 0
+    while True:
+        batch = supabase_client.table("transferencias").select("hash").gte("fecha", fecha_min).lte("fecha", fecha_max).range(offset, offset + batch_size - 1).execute().data or []
+        hashes.update(item["hash"] for item in batch if item.get("hash") is not None)
+        if len(batch) < batch_size:
+            break
+        offset += batch_size
+    return hashes
+
+def insertar_transferencias(supabase_client, registros, hashes_existentes=None, tamano_lote=TAMANO_LOTE, resolutor=None):
+    """
+    Inserta registros en 'transferencias' en lotes, omitiendo hashes repetidos.
+    Args:
+        supabase_client: Cliente de Supabase
+        registros: Lista de dicts listos para insertar (deben incluir 'hash')
+        hashes_existentes: Set opcional de hashes ya conocidos en la base de datos
+        tamano_lote: Registros por upsert
+        resolutor: ResolutorRuts opcional para completar 'cliente' según el RUT
+    Returns:
+        dict con 'recibidos', 'insertados', 'duplicados', 'rechazados' y tiempos en segundos
+    """
+    inicio = time.perf_counter()
+    resultado = resultado_vacio(len(registros))
+
+    # Validar campos requeridos y deduplicar dentro del propio archivo
+    vistos = set()
+    nuevos = []
+    for registro in registros:
+        if any(_es_vacio(registro.get(campo)) for campo in CAMPOS_REQUERIDOS):
+            resultado["rechazados"] += 1
+            continue
+        if registro["hash"] in vistos or (hashes_existentes and registro["hash"] in hashes_existentes):
+            resultado["duplicados"] += 1
+            continue
+        vistos.add(registro["hash"])
+        nuevos.append(registro)
+    # Cliente por RUT del pagador, en memoria y solo para los registros nuevos
+    if resolutor is not None:
+        resultado["clientes_asignados"] = resolutor.asignar_clientes(nuevos)
+    resultado["tiempo_dedup"] = time.perf_counter() - inicio
+
+    # Upsert por lotes (on_conflict=hash descarta los que ya existen en la tabla)
+    inicio_insercion = time.perf_counter()
+    for i in range(0, len(nuevos), tamano_lote):
+        insertados, duplicados, rechazados = _insertar_lote(supabase_client, nuevos[i:i + tamano_lote])
+        resultado["insertados"] += insertados
+        resultado["duplicados"] += duplicados
+        resultado["rechazados"] += rechazados
+    resultado["tiempo_insercion"] = time.perf_counter() - inicio_insercion
+    resultado["tiempo_total"] = time.perf_counter() - inicio
+    return resultado
+
+def resumen_ingesta(nombre_archivo, resultado, filas_leidas=None, tiempo_lectura=None):
+    """Arma una línea de resumen con conteos y tiempos para el log"""
+    partes = [f"archivo={nombre_archivo}"]
+    if filas_leidas is not None:
+        partes.append(f"filas_leidas={filas_leidas}")
+    partes.append(f"insertados={resultado['insertados']}")
+    partes.append(f"duplicados={resultado['duplicados']}")
+    partes.append(f"rechazados={resultado['rechazados']}")
+    if resultado.get("clientes_asignados"):
+        partes.append(f"con_cliente={resultado['clientes_asignados']}")
+    if tiempo_lectura is not None:
+        partes.append(f"lectura={tiempo_lectura:.2f}s")
+    partes.append(f"dedup={resultado['tiempo_dedup']:.2f}s")
+    partes.append(f"insercion={resultado['tiempo_insercion']:.2f}s")
+    partes.append(f"total={resultado['tiempo_total'] + (tiempo_lectura or 0):.2f}s")
+    return "[INGESTA] " + " ".join(partes)
+
+# -----------------------------------------------------------------------------
+# Despacho de archivos bancarios (usado por el worker de ingesta y el monitor)
+# -----------------------------------------------------------------------------
+
+# Palabras clave en nombre de archivo
+BCI_KEYWORD = 'Movimientos_Detallado_Cuenta'
+SANTANDER_KEYWORD = 'CartolaMovimiento-'
+
+def detectar_banco(nombre_archivo):
+    """Devuelve 'BCI', 'Santander' o None según el nombre del archivo"""
+    if BCI_KEYWORD in nombre_archivo:
+        return "BCI"
+    if SANTANDER_KEYWORD in nombre_archivo:
+        return "Santander"
+    return None
+
+def procesar_archivo_bancario(ruta_archivo, nombre_original=None):
+    """
+    Procesa una cartola BCI o Santander en el proceso actual.
+    Los parsers se importan una sola vez (pandas, openpyxl y el cliente de Supabase quedan cargados).
+    Returns:
+        (exito, mensaje, resultado)
+    """
+    nombre = nombre_original or os.path.basename(ruta_archivo)
+    banco = detectar_banco(nombre)
+    if banco is None:
+        return False, "Archivo no reconocido (no es BCI ni Santander)", None
+
+    if banco == "BCI":
+        from mi_app import bci
+        resultado = bci.process_and_store_excel(ruta_archivo)
+    else:
+        from mi_app import Santander
+        resultado = Santander.procesar_archivo_santander(ruta_archivo)
+
+    if resultado is None:
+        return False, f"El archivo {banco} no tiene registros válidos o no se pudo leer", None
+    conteos = (
+        f"{resultado['insertados']} insertados, "
+        f"{resultado['duplicados']} duplicados, {resultado['rechazados']} rechazados"
+    )
+    if resultado.get("error"):
+        # Lectura interrumpida: los bloques anteriores ya quedaron insertados
+        return False, f"Archivo {banco} procesado parcialmente ({conteos}): {resultado['error']}", resultado
+    return True, f"Archivo {banco} procesado: {conteos}", resultado
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lectura por bloques de cartolas Excel (.xlsx) con openpyxl en modo read_only.
+Solo se extraen las columnas pedidas y se entregan DataFrames de tamano_bloque filas,
+así la memoria no crece con el tamaño del archivo y la inserción puede empezar antes
+de terminar de leerlo.
+"""
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# Filas por bloque entregado a la normalización
+TAMANO_BLOQUE = 5000
+
+def _fila_vacia(valores):
+    return all(v is None or (isinstance(v, str) and v.strip() == "") for v in valores)
+
+def leer_excel_por_bloques(ruta_archivo, columnas, fila_encabezado=0, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Lee la primera hoja de un .xlsx y entrega bloques con las columnas pedidas.
+    Args:
+        ruta_archivo: Ruta del archivo
+        columnas: Nombres de columna a extraer (según la fila de encabezado)
+        fila_encabezado: Índice (desde 0) de la fila con los nombres de columna;
+                         equivale a skiprows=fila_encabezado en pd.read_excel
+        tamano_bloque: Filas por bloque
+    Yields:
+        DataFrame (dtype object, con los valores tal como vienen en las celdas).
+        El índice continúa entre bloques (posición de la fila de datos en el archivo).
+    Raises:
+        ValueError: Si falta alguna columna en el encabezado
+    """
+    wb = load_workbook(ruta_archivo, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        filas = ws.iter_rows(values_only=True)
+
+        encabezado = None
+        for i, fila in enumerate(filas):
+            if i == fila_encabezado:
+                encabezado = list(fila)
+                break
+        if encabezado is None:
+            raise ValueError(f"El archivo no tiene fila de encabezado en la posición {fila_encabezado}")
+
+        faltantes = [c for c in columnas if c not in encabezado]
+        if faltantes:
+            raise ValueError(f"Columnas faltantes en el archivo: {faltantes}")
+        posiciones = [encabezado.index(c) for c in columnas]
+
+        bloque = []
+        indices = []
+        for n, fila in enumerate(filas):
+            valores = [fila[p] if p < len(fila) else None for p in posiciones]
+            if _fila_vacia(valores):
+                continue
+            bloque.append(valores)
+            indices.append(n)
+            if len(bloque) >= tamano_bloque:
+                yield pd.DataFrame(bloque, columns=columnas, index=indices, dtype=object)
+                bloque = []
+                indices = []
+        if bloque:
+            yield pd.DataFrame(bloque, columns=columnas, index=indices, dtype=object)
+    finally:
+        wb.close()
@@ -47,7 +47,8 @@ from mi_app.mi_app.blueprints.cierre import cierre_bp
 from mi_app.mi_app.blueprints.cuentas_activas import cuentas_activas_bp
 from mi_app.mi_app.blueprints.margen import margen_bp
 
-from mi_app.mi_app.extensions import cache
+from mi_app.mi_app.extensions import cache, obtener_permisos
+from mi_app.mi_app.cache_compartido import configuracion_cache
 
 # -----------------------------------------------------------------------------
 # Configuración de logging
@@ -94,10 +95,8 @@ def adjust_datetime(dt):
 app = Flask(__name__)
 print("Rutas de templates:", app.jinja_loader.searchpath)
 app.secret_key = os.getenv('SECRET_KEY', 'mi_clave_secreta')
-cache.init_app(app, config={
-    "CACHE_TYPE": os.getenv('CACHE_TYPE', 'SimpleCache'),
-    "CACHE_DEFAULT_TIMEOUT": int(os.getenv('CACHE_DEFAULT_TIMEOUT', 300))
-})
+# Cache compartido entre workers (CACHE_BACKEND=filesystem|sqlite|simple, ver cache_compartido.py)
+cache.init_app(app, config=configuracion_cache())
 
 # Inicializar cache para el dashboard
 init_cache(cache)
@@ -140,14 +139,8 @@ supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 # -----------------------------------------------------------------------------
 @app.context_processor
 def inject_user_permissions():
-    is_superuser = False
-    if "email" in session:
-        try:
-            response = supabase.table("superusuarios").select("email").eq("email", session["email"]).execute()
-            is_superuser = bool(response.data)  # True si el email está en superusuarios
-        except Exception as e:
-            logging.error("Error al verificar permisos de superusuario: %s", e)
-    return dict(is_superuser=is_superuser)
+    # Reutiliza los permisos ya resueltos en set_is_superuser (sin consultar de nuevo)
+    return dict(is_superuser=obtener_permisos()["is_superuser"])
 
 # -----------------------------------------------------------------------------
 # Función para generar hash único para cada transferencia
@@ -427,13 +420,8 @@ def format_currency(value):
 
 @app.before_request
 def set_is_superuser():
-    g.is_superuser = False
-    if "email" in session:
-        try:
-            response = supabase.table("superusuarios").select("email").eq("email", session["email"]).execute()
-            g.is_superuser = bool(response.data)
-        except Exception as e:
-            logging.error("Error al verificar permisos de superusuario: %s", e)
+    # Carga los permisos de la sesión en g (g.permisos, g.is_superuser, g.is_allowed)
+    obtener_permisos()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5001, debug=True)
\ No newline at end of file
@@ -11,6 +11,10 @@ from supabase import create_client, Client
 import pytz
 from mi_app.mi_app.usdt_ves import obtener_valor_usdt_por_banco
 from mi_app.mi_app.blueprints.pedidos import registrar_movimiento_cuenta
+from mi_app.mi_app.extensions import obtener_permisos, invalidar_permisos
+from mi_app.mi_app.consultas_paralelas import consultar_en_paralelo
+from mi_app.mi_app.totales_diarios import compras_del_dia, invalidar_compras_dia
+from mi_app.mi_app.saldos_clientes import reparacion_pendiente, reparar_saldos_clientes
 
 # Configuración de zona horaria
 chile_tz = pytz.timezone('America/Santiago')
@@ -61,19 +65,15 @@ def user_allowed(f):
         if not email:
             flash("Debes iniciar sesión.")
             return redirect(url_for("login"))
-        try:
-            # SOLO verificar si es superusuario
-            logging.info(f"Consultando tabla superusuarios para: {email}")
-            superuser_response = supabase.table("superusuarios").select("email").eq("email", email).execute()
-            logging.info(f"Respuesta de superusuarios: {superuser_response.data}")
-            if not superuser_response.data:
-                flash("Acceso denegado. Solo superusuarios pueden acceder al módulo administrativo.")
-                return redirect(url_for("index"))
-            logging.info(f"Acceso permitido para superusuario: {email}")
-        except Exception as e:
-            logging.error("Error al verificar superusuario: %s", e)
+        # SOLO verificar si es superusuario (permisos cacheados por sesión)
+        permisos = obtener_permisos()
+        if permisos["error"]:
             flash("Error interno al verificar permisos.")
             return redirect(url_for("index"))
+        if not permisos["is_superuser"]:
+            flash("Acceso denegado. Solo superusuarios pueden acceder al módulo administrativo.")
+            return redirect(url_for("index"))
+        logging.info(f"Acceso permitido para superusuario: {email}")
         return f(*args, **kwargs)
     return wrapper
 
@@ -85,15 +85,13 @@ def superuser_required(f):
         if not email:
             flash("Debes iniciar sesión.")
             return redirect(url_for("login"))
-        try:
-            response = supabase.table("superusuarios").select("email").eq("email", email).execute()
-            if not response.data:
-                flash("Acceso denegado. Solo superusuarios pueden acceder a esta función.")
-                return redirect(url_for("index"))
-        except Exception as e:
-            logging.error("Error al verificar superusuario: %s", e)
+        permisos = obtener_permisos()
+        if permisos["error"]:
             flash("Error interno al verificar permisos.")
             return redirect(url_for("index"))
+        if not permisos["is_superuser"]:
+            flash("Acceso denegado. Solo superusuarios pueden acceder a esta función.")
+            return redirect(url_for("index"))
         return f(*args, **kwargs)
     return wrapper
 
@@ -241,6 +239,7 @@ def ingresar_usdt():
                 "orderstatus": orderstatus,
                 "ordernumber": ordernumber
             }).execute()
+            invalidar_compras_dia(createtime)
             flash("Compra de USDT ingresada con éxito.")
             return redirect(url_for("admin.ingresar_usdt"))
         except Exception as e:
@@ -265,11 +264,20 @@ def ingresar_usdt():
 @user_allowed
 def tasa_actual():
     try:
+        fecha_hoy = datetime.now().strftime("%Y-%m-%d")
+        fecha_ayer = (datetime.strptime(fecha_hoy, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+        
+        # Las consultas son independientes: se ejecutan en paralelo
+        respuestas = consultar_en_paralelo({
+            "costo": supabase.table("vista_compras_fifo").select("costo_no_vendido, createtime")
+                .order("createtime", desc=True)
+                .limit(1),
+            "stock_ayer": supabase.table("stock_diario").select("usdt_stock").eq("fecha", fecha_ayer),
+            "compras": lambda: compras_del_dia(fecha_hoy),
+        }, etiqueta="TASA_ACTUAL")
+        
         # Obtener el costo_no_vendido de la vista_compras_fifo (para mostrar como referencia)
-        query = supabase.table("vista_compras_fifo").select("costo_no_vendido, createtime") \
-            .order("createtime", desc=True) \
-            .limit(1)
-        response = query.execute()
+        response = respuestas["costo"]
         if response.data and len(response.data) > 0:
             record = response.data[0]
             costo_no_vendido = record.get("costo_no_vendido")
@@ -279,26 +287,21 @@ def tasa_actual():
         
         # Calcular el stock USDT usando la misma lógica exacta del módulo de márgenes
         # SIEMPRE usar cálculo dinámico, NO depender de stock_diario de hoy
-        fecha_hoy = datetime.now().strftime("%Y-%m-%d")
-        fecha_ayer = (datetime.strptime(fecha_hoy, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
-        
         # 1. Obtener saldo anterior USDT (de stock_diario del día anterior)
-        row_anterior = supabase.table("stock_diario").select("usdt_stock").eq("fecha", fecha_ayer).execute().data
+        row_anterior = respuestas["stock_ayer"].data
         usdt_anterior = float(row_anterior[0]["usdt_stock"]) if row_anterior and row_anterior[0].get("usdt_stock") is not None else 0
         
+        # Totales de compras de hoy (los mismos que usa el módulo de márgenes)
+        totales_compras = respuestas["compras"]
+        
         # 2. Obtener USDT COMPRADOS hoy (costo_real de compras CLP BUY)
-        inicio = fecha_hoy + "T00:00:00"
-        fin = fecha_hoy + "T23:59:59"
-        compras_usdt = supabase.table("compras").select("costo_real, unitprice").eq("fiat", "CLP").eq("tradetype", "BUY").gte("createtime", inicio).lte("createtime", fin).execute().data
-        usdt_comprados = sum(float(c["costo_real"]) for c in compras_usdt) if compras_usdt else 0
+        usdt_comprados = totales_compras["usdt_comprados"]
         
         # 3. Obtener USDT VENDIDOS hoy (amount de compras CLP SELL) - ¡IMPORTANTE! Usar 'amount', no 'costo_real'
-        ventas_usdt_clp = supabase.table("compras").select("amount").eq("fiat", "CLP").eq("tradetype", "SELL").gte("createtime", inicio).lte("createtime", fin).execute().data
-        usdt_vendidos_clp = sum(float(c["amount"]) for c in ventas_usdt_clp) if ventas_usdt_clp else 0
+        usdt_vendidos_clp = totales_compras["usdt_vendidos_clp"]
 
         # 3.1. Obtener USDT VENDIDOS hoy en VES (amount + commission de compras VES SELL) - ¡IMPORTANTE! Usar amount + commission como en márgenes
-        ventas_usdt_ves = supabase.table("compras").select("amount, commission").eq("fiat", "VES").eq("tradetype", "SELL").gte("createtime", inicio).lte("createtime", fin).execute().data
-        usdt_vendidos_ves = sum(float(c["amount"]) + float(c.get("commission", 0)) for c in ventas_usdt_ves) if ventas_usdt_ves else 0
+        usdt_vendidos_ves = totales_compras["usdt_vendidos"]
 
         # 4. Calcular stock USDT actual: Saldo Anterior + USDT COMPRADOS - USDT VENDIDOS (CLP + VES)
         stock_usdt = usdt_anterior + usdt_comprados - usdt_vendidos_clp - usdt_vendidos_ves
@@ -309,12 +312,8 @@ def tasa_actual():
             # Esto incluye: stock anterior + compras de hoy - ventas de hoy
             valor_clp_stock_anterior = usdt_anterior * costo_no_vendido
             
-            # Calcular valor CLP de las compras de hoy
-            valor_clp_compras_hoy = 0
-            if compras_usdt:
-                for compra in compras_usdt:
-                    # Usar costo_real * unitprice para obtener el valor CLP total
-                    valor_clp_compras_hoy += float(compra.get("costo_real", 0)) * float(compra.get("unitprice", 0))
+            # Calcular valor CLP de las compras de hoy (suma de costo_real * unitprice)
+            valor_clp_compras_hoy = totales_compras["valor_clp_compras"]
             
             # Calcular valor CLP de las ventas de hoy (para restar)
             valor_clp_ventas_clp_hoy = usdt_vendidos_clp * costo_no_vendido
@@ -345,12 +344,13 @@ def tasa_actual():
     if costo_no_vendido is not None and stock_usdt is not None and stock_usdt > 0:
         try:
             async def obtener_valores():
-                logging.info("Intentando obtener valor de Banesco...")
-                banesco_val = await obtener_valor_usdt_por_banco("Banesco")
-                logging.info(f"Valor de Banesco obtenido: {banesco_val}")
-                logging.info("Intentando obtener valor de BANK...")
-                bank_val = await obtener_valor_usdt_por_banco("BANK")
-                logging.info(f"Valor de BANK obtenido: {bank_val}")
+                # Ambos bancos a la vez
+                logging.info("Intentando obtener valores de Banesco y BANK...")
+                banesco_val, bank_val = await asyncio.gather(
+                    obtener_valor_usdt_por_banco("Banesco"),
+                    obtener_valor_usdt_por_banco("BANK")
+                )
+                logging.info(f"Valores obtenidos - Banesco: {banesco_val}, BANK: {bank_val}")
                 return banesco_val, bank_val
             banesco_val, bank_val = asyncio.run(obtener_valores())
             if banesco_val and bank_val:
@@ -517,7 +517,7 @@ def resumen_ventas_usdt():
 def eliminar_transaccion_usdt(transaccion_id):
     try:
         # Obtener la transacción para verificar paymethodname
-        response = supabase.table("compras").select("id, paymethodname").eq("id", transaccion_id).single().execute()
+        response = supabase.table("compras").select("id, paymethodname, createtime").eq("id", transaccion_id).single().execute()
         if not response.data:
             flash("Transacción no encontrada.", "danger")
             return redirect(url_for("admin.resumen_compras_usdt"))
@@ -526,6 +526,8 @@ def eliminar_transaccion_usdt(transaccion_id):
             return redirect(url_for("admin.resumen_compras_usdt"))
         # Eliminar físicamente
         supabase.table("compras").delete().eq("id", transaccion_id).execute()
+        if response.data.get("createtime"):
+            invalidar_compras_dia(response.data["createtime"])
         flash("Transacción eliminada correctamente.", "success")
     except Exception as e:
         logging.error(f"Error al eliminar transacción USDT: {e}")
@@ -557,12 +559,28 @@ def configuracion_inicial():
         
         return render_template('admin/configuracion_inicial.html', 
                              active_page='admin',
-                             config=config_data)
+                             config=config_data,
+                             saldos_pendientes=reparacion_pendiente())
     except Exception as e:
         logging.error(f"Error al cargar configuración inicial: {e}")
         flash("Error al cargar la configuración")
         return redirect(url_for('admin.index'))
 
+@admin_bp.route('/reconstruir-saldos-clientes', methods=['POST'])
+@login_required
+@user_allowed
+def reconstruir_saldos_clientes():
+    """Reconstruye el libro diario de saldos de clientes e informa qué saldos cambiaron"""
+    resultado = reparar_saldos_clientes()
+    if resultado is None:
+        flash("Error al reconstruir los saldos de clientes.", "danger")
+        return redirect(url_for('admin.configuracion_inicial'))
+    flash(f"Saldos de clientes reconstruidos ({resultado['filas']} días).", "success")
+    if resultado["diferencias"]:
+        detalle = "; ".join(f"{d['cliente']}: {d['antes']:,.0f} → {d['despues']:,.0f}" for d in resultado["diferencias"])
+        flash(f"{len(resultado['diferencias'])} clientes corregidos: {detalle}", "info")
+    return redirect(url_for('admin.configuracion_inicial'))
+
 @admin_bp.route('/guardar-configuracion-inicial', methods=['POST'])
 @login_required
 def guardar_configuracion_inicial():
@@ -683,6 +701,7 @@ def agregar_superusuario():
         response = supabase.table("superusuarios").insert(superusuario_data).execute()
         
         if response.data:
+            invalidar_permisos()
             logging.info(f"Superusuario agregado: {email} por {session.get('email')}")
             return jsonify({'success': True, 'message': 'Superusuario agregado exitosamente'})
         else:
@@ -714,6 +733,7 @@ def eliminar_superusuario(superusuario_id):
         response = supabase.table("superusuarios").delete().eq("id", superusuario_id).execute()
         
         if response.data:
+            invalidar_permisos()
             logging.info(f"Superusuario eliminado: {superusuario_email} por {current_email}")
             return jsonify({'success': True, 'message': 'Superusuario eliminado exitosamente'})
         else:
@@ -753,6 +773,7 @@ def migrar_usuario_a_superusuario(user_id):
         response = supabase.table("superusuarios").insert(superusuario_data).execute()
         
         if response.data:
+            invalidar_permisos()
             logging.info(f"Usuario migrado a superusuario: {email} por {session.get('email')}")
             return jsonify({'success': True, 'message': 'Usuario migrado a superusuario exitosamente'})
         else:
@@ -3,6 +3,8 @@ from flask import Blueprint, render_template, request, jsonify
 from flask import session, redirect, url_for, flash
 from mi_app.mi_app.blueprints.admin import login_required
 from mi_app.mi_app.extensions import supabase
+from mi_app.mi_app.consultas_paralelas import consultar_en_paralelo
+from mi_app.mi_app.totales_diarios import compras_del_dia, pedidos_del_dia
 import json
 import logging
 
@@ -186,8 +188,18 @@ def index():
     # Formato para mostrar en el header (DD-MMM)
     fecha_mostrar = fecha_dt.strftime('%d-%b').lower()
     
+    # Consultas independientes de la página en paralelo (cada una maneja su error)
+    respuestas = consultar_en_paralelo({
+        "saldo_margen": lambda: obtener_saldo_inicial_desde_margen(fecha),
+        "gastos": lambda: obtener_gastos_desde_margen(fecha),
+        "config": obtener_configuracion_inicial,
+        "compras": lambda: compras_del_dia(fecha),
+        "pedidos": lambda: pedidos_del_dia(fecha),
+        "cierre": supabase.table("cierre_caja").select("*").eq("fecha", fecha),
+    }, etiqueta="CIERRE", tolerar_errores=True)
+    
     # Obtener saldo inicial desde el módulo de Márgenes (BRS del día anterior)
-    saldo_inicial_margen = obtener_saldo_inicial_desde_margen(fecha)
+    saldo_inicial_margen = respuestas["saldo_margen"]
     if saldo_inicial_margen is not None:
         saldo_inicial = saldo_inicial_margen
         logging.info(f"Usando saldo inicial desde Márgenes: {saldo_inicial}")
@@ -197,19 +209,12 @@ def index():
         logging.info(f"Usando saldo inicial inteligente (fallback): {saldo_inicial}")
     
     # Obtener gastos desde el módulo de Márgenes
-    gastos, pago_movil, envios_al_detal = obtener_gastos_desde_margen(fecha)
+    gastos, pago_movil, envios_al_detal = respuestas["gastos"]
     logging.info(f"Gastos obtenidos para fecha {fecha}: gastos={gastos}, pago_movil={pago_movil}, envios_al_detal={envios_al_detal}")
     
-    # Consulta ingresos (compras)
+    # Ingresos: BRS comprados del día (VES SELL) según los totales de compras
     try:
-        resp_ing = supabase.table("compras") \
-            .select("totalprice") \
-            .eq("fiat", "VES") \
-            .eq("tradetype", "SELL") \
-            .gte("createtime", f"{fecha}T00:00:00") \
-            .lte("createtime", f"{fecha}T23:59:59") \
-            .execute()
-        total_ingresos = sum(item.get("totalprice", 0) for item in resp_ing.data) if resp_ing.data else 0
+        total_ingresos = respuestas["compras"]["brs_comprados"]
         logging.info(f"Ingresos para fecha {fecha}: {total_ingresos}")
     except Exception as e:
         logging.error("Error al obtener ingresos: %s", e)
@@ -218,9 +223,9 @@ def index():
     
     # Consulta egresos (pedidos)
     try:
-        resp_ped = supabase.table("pedidos").select("brs,cliente").eq("fecha", fecha).eq("eliminado", False).execute()
-        egresos_no_detal = sum(item.get("brs", 0) for item in resp_ped.data if item.get("cliente") != "DETAL") if resp_ped.data else 0
-        egresos_detal = sum(item.get("brs", 0) for item in resp_ped.data if item.get("cliente") == "DETAL") if resp_ped.data else 0
+        totales_pedidos = respuestas["pedidos"]
+        egresos_no_detal = totales_pedidos["brs_mayor"]
+        egresos_detal = totales_pedidos["brs_detal"]
         logging.info(f"Egresos para fecha {fecha}: no_detal={egresos_no_detal}, detal={egresos_detal}")
     except Exception as e:
         logging.error("Error al obtener egresos: %s", e)
@@ -233,7 +238,7 @@ def index():
     # Buscar si ya existe un cierre guardado para la fecha seleccionada
     cierre_guardado = None
     try:
-        cierre_resp = supabase.table("cierre_caja").select("*").eq("fecha", fecha).execute()
+        cierre_resp = respuestas["cierre"]
         if cierre_resp.data:
             cierre_guardado = cierre_resp.data[0]
     except Exception as e:
@@ -275,7 +280,7 @@ def index():
             gastos_detalle = []
 
     # Obtener información de configuración para mostrar en la interfaz
-    config_info = obtener_configuracion_inicial()
+    config_info = respuestas["config"]
     
     # Formatear valores para mostrar en el template con separadores de miles
     # Convertir a entero primero para evitar problemas con decimales
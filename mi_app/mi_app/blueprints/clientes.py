@@ -3,10 +3,11 @@ from supabase import create_client
 import os
 import re
 from mi_app.mi_app.extensions import cache, user_allowed
+from mi_app.mi_app import cache_etiquetas
+from mi_app.resolutor_ruts import obtener_resolutor
 import secrets
 from postgrest.exceptions import APIError
 import logging
-import time
 import pytz
 
 SUPABASE_URL = os.getenv('SUPABASE_URL')
@@ -15,134 +16,151 @@ supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 clientes_bp = Blueprint("clientes", __name__, template_folder="../templates/clientes")
 
-# Caché simple para mejorar rendimiento
-_clientes_cache = {}
-_cache_timestamp = 0
+# Lista de clientes en el cache compartido (un solo worker la recalcula al vencer)
+CLIENTES_CACHE_KEY = "clientes:lista"
 CACHE_DURATION = 30  # segundos
 
 chile_tz = pytz.timezone('America/Santiago')
 
 def get_cached_clientes():
-    """Obtiene clientes del caché si está válido, sino de la base de datos"""
-    global _clientes_cache, _cache_timestamp
-    current_time = time.time()
-    
-    # Si el caché es válido, retornarlo
-    if current_time - _cache_timestamp < CACHE_DURATION and _clientes_cache:
-        return _clientes_cache
-    
-    # Si no, obtener de la base de datos
+    """Obtiene clientes del caché compartido si está válido, sino de la base de datos"""
     try:
-        response = supabase.table("clientes").select("id, cliente, clp_maximo").order("cliente").execute()
-        clientes = response.data if response.data else []
-        
-        # Obtener todos los pedidos en una sola consulta
-        pedidos_resp = supabase.table("pedidos").select("cliente, clp").eq("eliminado", False).execute()
-        pedidos = pedidos_resp.data if pedidos_resp.data else []
+        return cache_etiquetas.obtener_o_calcular(CLIENTES_CACHE_KEY, _consultar_clientes, CACHE_DURATION)
+    except Exception as e:
+        logging.error(f"Error al obtener clientes: {e}")
+        return []
 
-        # Obtener todos los pagos en una sola consulta
-        pagos_resp = supabase.table("pagos_realizados").select("cliente, monto_total, eliminado").eq("eliminado", False).execute()
-        pagos = pagos_resp.data if pagos_resp.data else []
-        
-        # Crear diccionario cliente -> suma de CLP (pedidos)
-        clp_por_cliente = {}
-        for pedido in pedidos:
-            cliente = pedido.get("cliente")
-            clp = float(pedido.get("clp", 0))
-            if cliente:
-                if cliente not in clp_por_cliente:
-                    clp_por_cliente[cliente] = 0
-                clp_por_cliente[cliente] += clp
+def _consultar_clientes():
+    """Consulta clientes con sus saldos, pedidos y pagadores"""
+    response = supabase.table("clientes").select("id, cliente, clp_maximo").order("cliente").execute()
+    clientes = response.data if response.data else []
+    
+    # Obtener todos los pedidos en una sola consulta
+    pedidos_resp = supabase.table("pedidos").select("cliente, clp").eq("eliminado", False).execute()
+    pedidos = pedidos_resp.data if pedidos_resp.data else []
 
-        # Crear diccionario cliente -> suma de pagos realizados
-        pagos_por_cliente = {}
-        for pago in pagos:
-            cliente = pago.get("cliente")
-            monto = float(pago.get("monto_total", 0))
-            if cliente:
-                if cliente not in pagos_por_cliente:
-                    pagos_por_cliente[cliente] = 0
-                pagos_por_cliente[cliente] += monto
-        
-        # Obtener pagadores en una sola consulta
-        pagador_fields = [f"pagador{i}" for i in range(1, 201)]
-        select_fields = ["id", "cliente"] + pagador_fields
-        select_str = ", ".join(select_fields)
-        pagadores_resp = supabase.table("pagadores").select(select_str).execute()
-        pagadores = pagadores_resp.data if pagadores_resp.data else []
-        
-        # Construir diccionario cliente -> set de RUTs únicos
-        cliente_ruts = {}
-        for p in pagadores:
-            cli = p.get("cliente")
-            if not cli:
-                continue
-            if cli not in cliente_ruts:
-                cliente_ruts[cli] = set()
-            for key in pagador_fields:
-                rut = p.get(key)
-                if rut and rut != "EMPTY":
-                    cliente_ruts[cli].add(rut)
-        
-        # Crear diccionario cliente -> cantidad de pedidos
-        pedidos_count = {}
-        for pedido in pedidos:
-            cliente = pedido.get("cliente")
-            if cliente:
-                if cliente not in pedidos_count:
-                    pedidos_count[cliente] = 0
-                pedidos_count[cliente] += 1
+    # Obtener todos los pagos en una sola consulta
+    pagos_resp = supabase.table("pagos_realizados").select("cliente, monto_total, eliminado").eq("eliminado", False).execute()
+    pagos = pagos_resp.data if pagos_resp.data else []
+    
+    # Crear diccionario cliente -> suma de CLP (pedidos)
+    clp_por_cliente = {}
+    for pedido in pedidos:
+        cliente = pedido.get("cliente")
+        clp = float(pedido.get("clp", 0))
+        if cliente:
+            if cliente not in clp_por_cliente:
+                clp_por_cliente[cliente] = 0
+            clp_por_cliente[cliente] += clp
+
+    # Crear diccionario cliente -> suma de pagos realizados
+    pagos_por_cliente = {}
+    for pago in pagos:
+        cliente = pago.get("cliente")
+        monto = float(pago.get("monto_total", 0))
+        if cliente:
+            if cliente not in pagos_por_cliente:
+                pagos_por_cliente[cliente] = 0
+            pagos_por_cliente[cliente] += monto
+    
+    # Cantidad de pagadores por cliente en una sola consulta
+    conteo_resp = supabase.table("cliente_pagadores_conteo").select("cliente, total_pagadores").execute()
+    total_pagadores = {c["cliente"]: c["total_pagadores"] for c in (conteo_resp.data or [])}
+    
+    # Crear diccionario cliente -> cantidad de pedidos
+    pedidos_count = {}
+    for pedido in pedidos:
+        cliente = pedido.get("cliente")
+        if cliente:
+            if cliente not in pedidos_count:
+                pedidos_count[cliente] = 0
+            pedidos_count[cliente] += 1
 
-        # Procesar cada cliente
-        for cliente in clientes:
-            clp_total = clp_por_cliente.get(cliente["cliente"], 0)
-            pagos_total = pagos_por_cliente.get(cliente["cliente"], 0)
-            saldo_final = clp_total - pagos_total
-            cliente["clp_total"] = clp_total
-            cliente["pagos_total"] = pagos_total
-            cliente["saldo_final"] = saldo_final
-            clp_maximo = float(cliente.get("clp_maximo", 0))
-            cliente["disponible"] = clp_maximo - saldo_final
-            # Cantidad de pedidos
-            cliente["cantidad_pedidos"] = pedidos_count.get(cliente["cliente"], 0)
-            # Score manual (si no existe, inicializar en 0)
-            if "score_manual" not in cliente or cliente["score_manual"] is None:
+    # Procesar cada cliente
+    for cliente in clientes:
+        clp_total = clp_por_cliente.get(cliente["cliente"], 0)
+        pagos_total = pagos_por_cliente.get(cliente["cliente"], 0)
+        saldo_final = clp_total - pagos_total
+        cliente["clp_total"] = clp_total
+        cliente["pagos_total"] = pagos_total
+        cliente["saldo_final"] = saldo_final
+        clp_maximo = float(cliente.get("clp_maximo", 0))
+        cliente["disponible"] = clp_maximo - saldo_final
+        # Cantidad de pedidos
+        cliente["cantidad_pedidos"] = pedidos_count.get(cliente["cliente"], 0)
+        # Score manual (si no existe, inicializar en 0)
+        if "score_manual" not in cliente or cliente["score_manual"] is None:
+            cliente["score_manual"] = 0
+        else:
+            try:
+                cliente["score_manual"] = int(cliente["score_manual"])
+            except Exception:
                 cliente["score_manual"] = 0
-            else:
-                try:
-                    cliente["score_manual"] = int(cliente["score_manual"])
-                except Exception:
-                    cliente["score_manual"] = 0
-            # Puntaje total
-            cliente["puntaje_total"] = cliente["cantidad_pedidos"] + cliente["score_manual"]
-            # Determinar si ha superado el límite
-            if clp_maximo > 0:
-                cliente["supera_limite"] = saldo_final > clp_maximo
-                cliente["exceso"] = saldo_final - clp_maximo if saldo_final > clp_maximo else 0
-            else:
-                cliente["supera_limite"] = False
-                cliente["exceso"] = 0
-            # Asignar total de pagadores
-            cliente["total_pagadores"] = len(cliente_ruts.get(cliente["cliente"], set()))
-        
-        # Ordenar clientes por puntaje_total descendente
-        clientes.sort(key=lambda c: c["puntaje_total"], reverse=True)
-        
-        # Actualizar caché
-        _clientes_cache = clientes
-        _cache_timestamp = current_time
-        
-        return clientes
-        
-    except Exception as e:
-        logging.error(f"Error al obtener clientes: {e}")
-        return []
+        # Puntaje total
+        cliente["puntaje_total"] = cliente["cantidad_pedidos"] + cliente["score_manual"]
+        # Determinar si ha superado el límite
+        if clp_maximo > 0:
+            cliente["supera_limite"] = saldo_final > clp_maximo
+            cliente["exceso"] = saldo_final - clp_maximo if saldo_final > clp_maximo else 0
+        else:
+            cliente["supera_limite"] = False
+            cliente["exceso"] = 0
+        # Asignar total de pagadores
+        cliente["total_pagadores"] = total_pagadores.get(cliente["cliente"], 0)
+    
+    # Ordenar clientes por puntaje_total descendente
+    clientes.sort(key=lambda c: c["puntaje_total"], reverse=True)
+    
+    return clientes
 
 def clear_clientes_cache():
-    """Limpia el caché de clientes"""
-    global _clientes_cache, _cache_timestamp
-    _clientes_cache = {}
-    _cache_timestamp = 0
+    """Limpia el caché de clientes (en todos los workers)"""
+    cache_etiquetas.invalidar(prefijo=CLIENTES_CACHE_KEY)
+
+# -----------------------------------------------------------------------------
+# Pagadores por cliente (tabla cliente_pagadores, ver scripts/CREAR_CLIENTE_PAGADORES.sql)
+# -----------------------------------------------------------------------------
+def ruts_de_cliente(cliente):
+    """Devuelve los RUT de pagadores del cliente en el orden en que se agregaron"""
+    resp = supabase.table("cliente_pagadores").select("rut").eq("cliente", cliente).order("id").execute()
+    return [p["rut"] for p in (resp.data or [])]
+
+def clientes_por_rut(rut):
+    """Devuelve los clientes que tienen asociado el RUT (consulta por índice)"""
+    resp = supabase.table("cliente_pagadores").select("cliente").eq("rut", rut).execute()
+    return sorted(set(p["cliente"] for p in (resp.data or [])))
+
+def agregar_rut_cliente(cliente, rut):
+    """
+    Asocia un RUT (ya normalizado) al cliente.
+    Mantiene la fila del cliente en pagadores, que se usa como lista de clientes.
+    Returns:
+        bool: False si el RUT ya estaba asociado a este cliente
+    """
+    if rut in ruts_de_cliente(cliente):
+        return False
+    supabase.table("cliente_pagadores").insert({"cliente": cliente, "rut": rut}).execute()
+    obtener_resolutor(supabase).registrar(rut, cliente)
+    existe = supabase.table("pagadores").select("id").eq("cliente", cliente).limit(1).execute()
+    if not existe.data:
+        supabase.table("pagadores").insert({"cliente": cliente}).execute()
+    return True
+
+def mensaje_error_pagador(e):
+    """Traduce el error de la base al agregar un pagador (trigger de RUT duplicado)"""
+    msg = getattr(e, 'message', None)
+    if not msg and hasattr(e, 'args') and e.args:
+        try:
+            import ast
+            err_dict = ast.literal_eval(e.args[0]) if isinstance(e.args[0], str) else e.args[0]
+            msg = err_dict.get('message', str(e))
+        except Exception:
+            msg = str(e)
+    if msg and 'ya está asociado al cliente' in msg:
+        return "RUT ya registrado por otro cliente"
+    elif msg and 'duplicad' in msg.lower():
+        return "RUT duplicado"
+    return msg or str(e)
 
 def login_required(f):
     from functools import wraps
@@ -322,19 +340,7 @@ def detalle(cliente_id):
     if not cliente:
         flash("Cliente no encontrado.")
         return redirect(url_for("clientes.index"))
-    # Construir lista de campos pagador1 a pagador200
-    pagador_fields = [f"pagador{i}" for i in range(1, 201)]
-    select_fields = ["id", "cliente"] + pagador_fields
-    select_str = ", ".join(select_fields)
-    pagadores_resp = supabase.table("pagadores").select(select_str).eq("cliente", cliente["cliente"]).execute()
-    pagadores = pagadores_resp.data if pagadores_resp.data else []
-    # Construir una lista de RUTs únicos para mostrar
-    ruts = []
-    for p in pagadores:
-        for key in pagador_fields:
-            rut = p.get(key)
-            if rut and rut != "EMPTY" and rut not in ruts:
-                ruts.append(rut)
+    ruts = ruts_de_cliente(cliente["cliente"])
     return render_template("clientes/detalle.html", cliente=cliente, ruts=ruts)
 
 @clientes_bp.route("/agregar_pagador/<int:cliente_id>", methods=["POST"])
@@ -362,37 +368,14 @@ def agregar_pagador(cliente_id):
         
         cliente_nombre = cliente_resp.data["cliente"]
         
-        # Verificar si ya existe un registro para este cliente en la tabla pagadores
-        pagador_fields = [f"pagador{i}" for i in range(1, 201)]
-        select_fields = ["id"] + pagador_fields
-        select_str = ", ".join(select_fields)
-        
-        pagadores_resp = supabase.table("pagadores").select(select_str).eq("cliente", cliente_nombre).execute()
-        
-        if pagadores_resp.data:
-            # Buscar la primera columna vacía
-            registro = pagadores_resp.data[0]
-            columna_vacia = None
-            
-            for field in pagador_fields:
-                valor = registro.get(field)
-                if not valor or valor == "" or valor == "EMPTY":
-                    columna_vacia = field
-                    break
-            
-            if not columna_vacia:
-                return jsonify({"success": False, "error": "No hay columnas disponibles. El cliente ya tiene 200 pagadores."})
-            
-            # Actualizar registro existente en la primera columna vacía
-            update_data = {columna_vacia: rut_normalizado}
-            supabase.table("pagadores").update(update_data).eq("cliente", cliente_nombre).execute()
-        else:
-            # Crear nuevo registro con el pagador en la primera columna
-            insert_data = {"cliente": cliente_nombre, "pagador1": rut_normalizado}
-            supabase.table("pagadores").insert(insert_data).execute()
+        if not agregar_rut_cliente(cliente_nombre, rut_normalizado):
+            return jsonify({"success": False, "error": "El RUT ya está registrado para este cliente"})
+        clear_clientes_cache()
         
         return jsonify({"success": True})
         
+    except APIError as e:
+        return jsonify({"success": False, "error": mensaje_error_pagador(e)})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
@@ -413,32 +396,11 @@ def eliminar_pagador(cliente_id):
         
         cliente_nombre = cliente_resp.data["cliente"]
         
-        # Buscar en qué columna está el RUT
-        pagador_fields = [f"pagador{i}" for i in range(1, 201)]
-        select_fields = ["id"] + pagador_fields
-        select_str = ", ".join(select_fields)
-        
-        pagadores_resp = supabase.table("pagadores").select(select_str).eq("cliente", cliente_nombre).execute()
-        
-        if not pagadores_resp.data:
-            return jsonify({"success": False, "error": "No se encontraron pagadores para este cliente"})
-        
-        # Encontrar la columna donde está el RUT
-        columna_encontrada = None
-        for p in pagadores_resp.data:
-            for field in pagador_fields:
-                if p.get(field) == rut:
-                    columna_encontrada = field
-                    break
-            if columna_encontrada:
-                break
-        
-        if not columna_encontrada:
+        resp = supabase.table("cliente_pagadores").delete().eq("cliente", cliente_nombre).eq("rut", rut).execute()
+        if not resp.data:
             return jsonify({"success": False, "error": "RUT no encontrado en este cliente"})
-        
-        # Eliminar el RUT de la columna (poner NULL o vacío)
-        update_data = {columna_encontrada: None}
-        supabase.table("pagadores").update(update_data).eq("cliente", cliente_nombre).execute()
+        obtener_resolutor(supabase).invalidar()
+        clear_clientes_cache()
         
         return jsonify({"success": True})
         
@@ -515,59 +477,14 @@ def agregar_pagador_publico(token):
             error = resultado['error']
         else:
             rut_normalizado = resultado['rut_normalizado']
-            # Buscar pagadores
-            pagador_fields = [f"pagador{i}" for i in range(1, 201)]
-            select_fields = ["id"] + pagador_fields
-            select_str = ", ".join(select_fields)
-            pagadores_resp = supabase.table("pagadores").select(select_str).eq("cliente", cliente["cliente"]).execute()
-            if pagadores_resp.data:
-                registro = pagadores_resp.data[0]
-                columna_vacia = None
-                for field in pagador_fields:
-                    valor = registro.get(field)
-                    if not valor or valor == "" or valor == "EMPTY":
-                        columna_vacia = field
-                        break
-                if not columna_vacia:
-                    error = "No hay columnas disponibles. El cliente ya tiene 200 pagadores."
-                else:
-                    try:
-                        supabase.table("pagadores").update({columna_vacia: rut_normalizado}).eq("cliente", cliente["cliente"]).execute()
-                        mensaje = f"Pagador {rut_normalizado} agregado con éxito."
-                    except APIError as e:
-                        msg = getattr(e, 'message', None)
-                        if not msg and hasattr(e, 'args') and e.args:
-                            try:
-                                import ast
-                                err_dict = ast.literal_eval(e.args[0]) if isinstance(e.args[0], str) else e.args[0]
-                                msg = err_dict.get('message', str(e))
-                            except Exception:
-                                msg = str(e)
-                        if msg and 'ya está asociado al cliente' in msg:
-                            error = "RUT ya registrado por otro cliente"
-                        elif msg and 'duplicad' in msg.lower():
-                            error = "RUT duplicado"
-                        else:
-                            error = msg or str(e)
-            else:
-                try:
-                    supabase.table("pagadores").insert({"cliente": cliente["cliente"], "pagador1": rut_normalizado}).execute()
+            try:
+                if agregar_rut_cliente(cliente["cliente"], rut_normalizado):
+                    clear_clientes_cache()
                     mensaje = f"Pagador {rut_normalizado} agregado con éxito."
-                except APIError as e:
-                    msg = getattr(e, 'message', None)
-                    if not msg and hasattr(e, 'args') and e.args:
-                        try:
-                            import ast
-                            err_dict = ast.literal_eval(e.args[0]) if isinstance(e.args[0], str) else e.args[0]
-                            msg = err_dict.get('message', str(e))
-                        except Exception:
-                            msg = str(e)
-                    if msg and 'ya está asociado al cliente' in msg:
-                        error = "RUT ya registrado por otro cliente"
-                    elif msg and 'duplicad' in msg.lower():
-                        error = "RUT duplicado"
-                    else:
-                        error = msg or str(e)
+                else:
+                    error = "RUT duplicado"
+            except APIError as e:
+                error = mensaje_error_pagador(e)
     return render_template_string("""
     <link href='https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css' rel='stylesheet'>
     <div class='container d-flex justify-content-center align-items-center' style='min-height:100vh;'>
@@ -679,19 +596,9 @@ def buscar_por_rut():
     if not resultado['valido']:
         return jsonify({'success': False, 'error': resultado['error']})
     rut_normalizado = resultado['rut_normalizado']
-    pagador_fields = [f"pagador{i}" for i in range(1, 201)]
-    select_fields = ["cliente"] + pagador_fields
-    select_str = ", ".join(select_fields)
-    pagadores_resp = supabase.table("pagadores").select(select_str).execute()
-    if not pagadores_resp.data:
-        return jsonify({'success': False, 'error': 'No hay datos de pagadores.'})
-    clientes_encontrados = set()
-    for registro in pagadores_resp.data:
-        for field in pagador_fields:
-            if registro.get(field) == rut_normalizado:
-                clientes_encontrados.add(registro.get('cliente'))
+    clientes_encontrados = clientes_por_rut(rut_normalizado)
     if clientes_encontrados:
-        return jsonify({'success': True, 'clientes': list(clientes_encontrados)})
+        return jsonify({'success': True, 'clientes': clientes_encontrados})
     else:
         return jsonify({'success': False, 'error': 'No se encontró ningún cliente con ese RUT.'})
 
@@ -707,22 +614,15 @@ def limpiar_cache():
 def buscar_cliente_por_rut(rut):
     """Busca qué cliente tiene asociado un RUT específico"""
     try:
-        # Buscar en la tabla pagadores
-        pagador_fields = [f"pagador{i}" for i in range(1, 201)]
-        select_fields = ["cliente"] + pagador_fields
-        select_str = ", ".join(select_fields)
-        
-        # Buscar en todas las columnas de pagadores
-        for field in pagador_fields:
-            pagadores_resp = supabase.table("pagadores").select(select_str).eq(field, rut).execute()
-            if pagadores_resp.data:
-                cliente = pagadores_resp.data[0]["cliente"]
-                return jsonify({
-                    "success": True, 
-                    "cliente": cliente,
-                    "rut": rut,
-                    "campo": field
-                })
+        # Una sola consulta por el índice de RUT
+        clientes = clientes_por_rut(rut)
+        if clientes:
+            return jsonify({
+                "success": True, 
+                "cliente": clientes[0],
+                "rut": rut,
+                "campo": "cliente_pagadores"
+            })
         
         return jsonify({
             "success": False, 
@@ -767,6 +667,15 @@ def cambiar_nombre_cliente(cliente_id):
             # Si falla la actualización en pagadores, no es crítico
             print(f"Advertencia: No se pudo actualizar pagadores: {e}")
         
+        # Y en los RUT de pagadores del cliente
+        try:
+            supabase.table("cliente_pagadores").update({
+                "cliente": nuevo_nombre
+            }).eq("cliente", nombre_actual).execute()
+        except Exception as e:
+            print(f"Advertencia: No se pudo actualizar cliente_pagadores: {e}")
+        obtener_resolutor(supabase).invalidar()
+        
         # Limpiar caché
         clear_clientes_cache()
         
@@ -1,4 +1,5 @@
 import os
+import io
 import logging
 from datetime import datetime, timedelta
 from functools import wraps
@@ -8,6 +9,9 @@ from supabase import create_client, Client
 from flask_caching import Cache
 import pytz
 from mi_app.mi_app.extensions import cache
+from mi_app.mi_app import cache_etiquetas
+from mi_app.mi_app.resumen_dashboard import resumen_service, invalidar_dashboard, DETALLE_PREFIJO, DETALLE_TIMEOUT
+from mi_app.mi_app.saldos_clientes import reparacion_pendiente
 
 
 # Configuración de zona horaria
@@ -18,6 +22,9 @@ SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Días hacia atrás que definen los clientes del resumen (HTML, API y CSV)
+DIAS_RESUMEN = 30
+
 # Configuración de ajuste de hora
 HOUR_ADJUSTMENT = int(os.getenv('HOUR_ADJUSTMENT', '0'))
 
@@ -57,213 +64,81 @@ def init_cache(cache_instance):
     global cache
     cache = cache_instance
 
-def get_ultimo_saldo_anterior(cliente, fecha, supabase):
+def calcular_ultimo_saldo_anterior(clp_por_dia, pagos_por_dia, fecha, dias=60, fecha_inicio=None):
+    """
+    Calcula en memoria el último saldo final distinto de cero antes de la fecha dada.
+    Args:
+        clp_por_dia: {fecha: CLP de pedidos del día}
+        pagos_por_dia: {fecha: pagos del día}
+        fecha: Fecha de consulta (YYYY-MM-DD)
+        dias: Días máximos hacia atrás que se revisan para cada fecha
+        fecha_inicio: Primer día de la ventana; los saldos anteriores se consideran 0
+    Returns:
+        float: Saldo encontrado o 0
+    """
+    fecha_dt = datetime.strptime(fecha, "%Y-%m-%d")
+    if fecha_inicio:
+        inicio_dt = datetime.strptime(fecha_inicio, "%Y-%m-%d")
+    else:
+        inicio_dt = fecha_dt - timedelta(days=2 * dias)
+    # saldo_por_fecha[d] = resultado de la búsqueda para la fecha d (se llena de la más antigua a la más reciente)
+    saldo_por_fecha = {}
+    dia_dt = inicio_dt
+    while dia_dt <= fecha_dt:
+        saldo = 0
+        for paso in range(dias):
+            anterior_str = (dia_dt - timedelta(days=paso + 1)).strftime("%Y-%m-%d")
+            clp = clp_por_dia.get(anterior_str, 0)
+            pagos_total = pagos_por_dia.get(anterior_str, 0)
+            saldo_ant = saldo_por_fecha.get(anterior_str, 0) if paso > 0 else 0
+            saldo_final = saldo_ant + clp - pagos_total
+            if clp != 0 or pagos_total != 0 or saldo_final != 0:
+                saldo = saldo_final
+                break
+        saldo_por_fecha[dia_dt.strftime("%Y-%m-%d")] = saldo
+        dia_dt += timedelta(days=1)
+    return saldo_por_fecha.get(fecha, 0)
+
+def get_ultimo_saldo_anterior(cliente, fecha, supabase, dias=60):
     """
     Busca hacia atrás el último saldo final distinto de cero para el cliente antes de la fecha dada.
+    Trae los pedidos y pagos del cliente de la ventana una sola vez y los agrupa por día.
     Devuelve 0 si no encuentra ninguno.
     """
     fecha_dt = datetime.strptime(fecha, "%Y-%m-%d")
-    for _ in range(60):  # Máximo 60 días hacia atrás para evitar bucles infinitos
-        fecha_dt -= timedelta(days=1)
-        fecha_str = fecha_dt.strftime("%Y-%m-%d")
-        # Pedidos y pagos del día
-        pedidos = supabase.table("pedidos").select("clp").eq("fecha", fecha_str).eq("cliente", cliente).eq("eliminado", False).execute().data or []
-        pagos = supabase.table("pagos_realizados").select("monto_total, fecha_registro").eq("cliente", cliente).eq("eliminado", False).execute().data or []
-        pagos_dia = [float(p["monto_total"]) for p in pagos if p.get("fecha_registro", "")[:10] == fecha_str]
-        clp = sum(float(p["clp"]) for p in pedidos)
-        pagos_total = sum(pagos_dia)
-        # Obtener saldo anterior de ese día
-        saldo_ant = get_ultimo_saldo_anterior(cliente, fecha_str, supabase) if _ > 0 else 0
-        saldo_final = saldo_ant + clp - pagos_total
-        if clp != 0 or pagos_total != 0 or saldo_final != 0:
-            return saldo_final
-    return 0
+    fecha_inicio = (fecha_dt - timedelta(days=3 * dias)).strftime("%Y-%m-%d")
+    fecha_anterior = (fecha_dt - timedelta(days=1)).strftime("%Y-%m-%d")
+    pedidos = supabase.table("pedidos").select("clp, fecha").eq("cliente", cliente).eq("eliminado", False).gte("fecha", fecha_inicio).lte("fecha", fecha_anterior).execute().data or []
+    pagos = supabase.table("pagos_realizados").select("monto_total, fecha_registro").eq("cliente", cliente).eq("eliminado", False).gte("fecha_registro", fecha_inicio + "T00:00:00").lte("fecha_registro", fecha_anterior + "T23:59:59").execute().data or []
+    clp_por_dia = {}
+    for p in pedidos:
+        if p.get("fecha") and p.get("clp") is not None:
+            clp_por_dia[p["fecha"]] = clp_por_dia.get(p["fecha"], 0) + float(p["clp"])
+    pagos_por_dia = {}
+    for p in pagos:
+        fecha_pago = (p.get("fecha_registro") or "")[:10]
+        if fecha_pago and p.get("monto_total") is not None:
+            pagos_por_dia[fecha_pago] = pagos_por_dia.get(fecha_pago, 0) + float(p["monto_total"])
+    return calcular_ultimo_saldo_anterior(clp_por_dia, pagos_por_dia, fecha, dias, fecha_inicio)
 
 @dashboard_bp.route("/", methods=["GET"])
 @login_required
-@cache.cached(timeout=300, query_string=True)  # Aumentar cache a 5 minutos
 def index():
     try:
         current_date = adjust_datetime(datetime.now(chile_tz)).strftime("%Y-%m-%d")
         fecha = request.args.get("fecha", current_date)
         cliente_filtro = request.args.get("cliente", "")
         
-        # Optimización: Solo cargar datos de los últimos 30 días para cálculos
-        fecha_inicio = (datetime.strptime(fecha, "%Y-%m-%d") - timedelta(days=30)).strftime("%Y-%m-%d")
-        
-        # Consulta optimizada: Solo pedidos y pagos relevantes
-        pedidos_query = supabase.table("pedidos").select("cliente, fecha, clp, brs").eq("eliminado", False).gte("fecha", fecha_inicio).lte("fecha", fecha)
-        pagos_query = supabase.table("pagos_realizados").select("cliente, monto_total, fecha_registro").eq("eliminado", False).gte("fecha_registro", fecha_inicio + "T00:00:00").lte("fecha_registro", fecha + "T23:59:59")
-        
-        # Ejecutar consultas en paralelo (simulado)
-        try:
-            pedidos_hist = pedidos_query.execute().data or []
-            logging.info(f"[DASHBOARD] Consulta pedidos ejecutada. Total pedidos: {len(pedidos_hist)}")
-            
-            # Verificar si hay pedidos de MaxiGiros Richard
-            maxigiros_pedidos = [p for p in pedidos_hist if 'maxigiros' in p.get('cliente', '').lower() or 'richard' in p.get('cliente', '').lower()]
-            if maxigiros_pedidos:
-                logging.info(f"[DASHBOARD] Pedidos de MaxiGiros Richard encontrados: {len(maxigiros_pedidos)}")
-                for p in maxigiros_pedidos:
-                    logging.info(f"[DASHBOARD] Pedido MaxiGiros: {p}")
-            else:
-                logging.info(f"[DASHBOARD] NO se encontraron pedidos de MaxiGiros Richard")
-                
-            # Debug: Verificar todos los pedidos de hoy
-            pedidos_hoy = [p for p in pedidos_hist if p.get('fecha') == fecha]
-            logging.info(f"[DASHBOARD] Total pedidos de hoy ({fecha}): {len(pedidos_hoy)}")
-            logging.info(f"[DASHBOARD] Fechas únicas en pedidos: {list(set([p.get('fecha') for p in pedidos_hist if p.get('fecha')]))}")
-                
-        except Exception as e:
-            logging.error(f"[DASHBOARD] Error al consultar pedidos: {e}")
-            pedidos_hist = []
-            
-        try:
-            pagos_hist = pagos_query.execute().data or []
-            logging.info(f"[DASHBOARD] Consulta pagos ejecutada. Total pagos: {len(pagos_hist)}")
-        except Exception as e:
-            logging.error(f"[DASHBOARD] Error al consultar pagos: {e}")
-            pagos_hist = []
-        
-        # Procesar datos de manera más eficiente
-        clientes_activos = set()
-        resumen = {}
-        
-        # Procesar pedidos
-        for p in pedidos_hist:
-            if p.get("cliente") and p.get("fecha") and p.get("clp") is not None:
-                cliente = p["cliente"]
-                
-                # Log específico para MaxiGiros Richard
-                if 'maxigiros' in cliente.lower() or 'richard' in cliente.lower():
-                    logging.info(f"[DASHBOARD] Procesando pedido para {cliente}: fecha={p.get('fecha')}, clp={p.get('clp')}")
-                
-                clientes_activos.add(cliente)
-                
-                if cliente not in resumen:
-                    resumen[cliente] = {
-                        "cliente": cliente,
-                        "brs": 0,
-                        "clp": 0,
-                        "pagos": 0,
-                        "deuda_anterior": 0,
-                        "diferencia": 0
-                    }
-                
-                if p["fecha"] == fecha:
-                    resumen[cliente]["brs"] += float(p.get("brs", 0))
-                    resumen[cliente]["clp"] += float(p["clp"])
-                    
-                    # Log específico para MaxiGiros Richard
-                    if 'maxigiros' in cliente.lower() or 'richard' in cliente.lower():
-                        logging.info(f"[DASHBOARD] Pedido de hoy para {cliente}: BRS={p.get('brs')}, CLP={p.get('clp')}")
-                        logging.info(f"[DASHBOARD] Resumen actualizado para {cliente}: BRS={resumen[cliente]['brs']}, CLP={resumen[cliente]['clp']}")
-                else:
-                    # Log para pedidos que NO son de hoy
-                    if 'maxigiros' in cliente.lower() or 'richard' in cliente.lower():
-                        logging.info(f"[DASHBOARD] Pedido NO de hoy para {cliente}: fecha={p.get('fecha')}, fecha_busqueda={fecha}")
-        
-        # Procesar pagos
-        for p in pagos_hist:
-            if p.get("cliente") and p.get("monto_total") is not None:
-                cliente = p["cliente"]
-                fecha_pago = p.get("fecha_registro", "")[:10]
-                
-                if cliente not in resumen:
-                    resumen[cliente] = {
-                        "cliente": cliente,
-                        "brs": 0,
-                        "clp": 0,
-                        "pagos": 0,
-                        "deuda_anterior": 0,
-                        "diferencia": 0
-                    }
-                
-                if fecha_pago == fecha:
-                    resumen[cliente]["pagos"] += float(p["monto_total"])
-        
-        # Calcular deuda anterior (todos los pedidos hasta el día anterior)
-        fecha_anterior = (datetime.strptime(fecha, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
-        
-        # Consulta para TODOS los pedidos hasta el día anterior
-        pedidos_anterior = supabase.table("pedidos").select("cliente, clp").eq("eliminado", False).lte("fecha", fecha_anterior).execute().data or []
-        # Consulta para TODOS los pagos hasta el día anterior CON PAGINACIÓN
-        pagos_anterior = []
-        offset = 0
-        limit = 1000
-        while True:
-            pedidos_batch = supabase.table("pedidos").select("cliente, clp").eq("eliminado", False).lte("fecha", fecha_anterior).order("fecha", desc=True).range(offset, offset + limit - 1).execute().data or []
-            if not pedidos_batch:
-                break
-            pedidos_anterior.extend(pedidos_batch)
-            offset += limit
-            if len(pedidos_batch) < limit:
-                break
-        # Consulta para TODOS los pagos hasta el día anterior CON PAGINACIÓN
-        pagos_anterior = []
-        offset = 0
-        limit = 1000
-        while True:
-            pagos_batch = supabase.table("pagos_realizados").select("cliente, monto_total").eq("eliminado", False).lte("fecha_registro", fecha_anterior + "T23:59:59").range(offset, offset + limit - 1).execute().data or []
-            if not pagos_batch:
-                break
-            pagos_anterior.extend(pagos_batch)
-            offset += limit
-            if len(pagos_batch) < limit:
-                break
-        
-        deuda_anterior_por_cliente = {}
-        for p in pedidos_anterior:
-            cliente = p["cliente"]
-            if cliente not in deuda_anterior_por_cliente:
-                deuda_anterior_por_cliente[cliente] = 0
-            deuda_anterior_por_cliente[cliente] += float(p["clp"])
-        
-        for p in pagos_anterior:
-            cliente = p["cliente"]
-            if cliente not in deuda_anterior_por_cliente:
-                deuda_anterior_por_cliente[cliente] = 0
-            deuda_anterior_por_cliente[cliente] -= float(p["monto_total"])
-        
-        # Aplicar deuda anterior al resumen
-        for cliente in resumen:
-            resumen[cliente]["deuda_anterior"] = deuda_anterior_por_cliente.get(cliente, 0)
-            resumen[cliente]["diferencia"] = (
-                resumen[cliente]["deuda_anterior"] + 
-                resumen[cliente]["clp"] - 
-                resumen[cliente]["pagos"]
-            )
-        
-        # Log final para MaxiGiros Richard
-        if 'MaxiGiros Richard' in resumen:
-            maxigiros_final = resumen['MaxiGiros Richard']
-            print(f"[API] RESULTADO FINAL MaxiGiros Richard: {maxigiros_final}")
-        else:
-            print(f"[API] MaxiGiros Richard NO encontrado en resumen final")
-        
-        # Filtrar clientes con algún valor relevante
-        clientes_filtrados = sorted([
-            r["cliente"] for r in resumen.values()
-            if r["brs"] != 0 or r["clp"] != 0 or r["pagos"] != 0 or r["diferencia"] != 0 or r["deuda_anterior"] != 0
-        ])
-        
-        # Si hay filtro de cliente, mostrar solo ese cliente
-        if cliente_filtro:
-            if cliente_filtro in resumen:
-                resumen_list = [resumen[cliente_filtro]]
-            else:
-                resumen_list = []
-        else:
-            resumen_list = [r for r in resumen.values() if r["cliente"] in clientes_filtrados]
-        
-        # Log final del resumen para MaxiGiros Richard
-        if 'MaxiGiros Richard' in resumen:
-            maxigiros_final = resumen['MaxiGiros Richard']
-            logging.info(f"[DASHBOARD] RESUMEN FINAL MaxiGiros Richard: {maxigiros_final}")
+        # Resumen compartido con la API y el CSV (clientes de los últimos 30 días)
+        datos = resumen_service.obtener(fecha, DIAS_RESUMEN, cliente_filtro)
+        resumen_list = datos["resumen"]
+        clientes_filtrados = datos["clientes"]
         
         # Si no hay datos, mostrar mensaje amigable
         if not resumen_list:
             flash("No hay movimientos para la fecha y cliente seleccionados.")
+        if reparacion_pendiente():
+            flash("La deuda anterior puede estar desactualizada: reconstruye los saldos de clientes en Admin > Configuración Inicial.")
             
     except Exception as e:
         logging.error(f"Error al cargar resumen de pedidos en dashboard: {e}")
@@ -283,17 +158,6 @@ def index():
 @dashboard_bp.route("/detalle/<cliente>")
 @login_required
 def detalle(cliente):
-    if cache is None:
-        # Si no hay cache configurado, usar un decorador dummy
-        def dummy_cache(timeout=60, query_string=True):
-            def decorator(f):
-                return f
-            return decorator
-        cache_decorator = dummy_cache
-    else:
-        cache_decorator = cache.cached
-    
-    @cache_decorator(timeout=60, query_string=True)
     def get_detalle_data(cliente):
         try:
             current_date = adjust_datetime(datetime.now(chile_tz)).strftime("%Y-%m-%d")
@@ -305,6 +169,13 @@ def detalle(cliente):
                 page = 1
             per_page = 10
             
+            # Detalle en cache, etiquetado por cliente y rango de fechas
+            clave = f"{DETALLE_PREFIJO}:{cliente}:{fecha_inicio}:{fecha_fin}:{page}"
+            datos = cache_etiquetas.obtener(clave)
+            if datos is not None:
+                return datos
+            vigente = cache_etiquetas.generacion(clave, DETALLE_TIMEOUT, cliente=cliente, fecha_desde=fecha_inicio, fecha_hasta=fecha_fin)
+            
             # Obtener pedidos
             query_pedidos = supabase.table("pedidos").select("id, cliente, fecha, brs, tasa, clp") \
                 .eq("cliente", cliente) \
@@ -381,7 +252,7 @@ def detalle(cliente):
                     'tasa': movimiento['tasa']
                 })
             
-            return {
+            datos = {
                 'pedidos_data': pedidos_data,
                 'pagos_data': pagos_data,
                 'flujo_caja': flujo_caja,
@@ -390,12 +261,15 @@ def detalle(cliente):
                 'fecha_inicio': fecha_inicio,
                 'fecha_fin': fecha_fin
             }
+            cache_etiquetas.guardar(clave, datos, DETALLE_TIMEOUT, cliente=cliente, fecha_desde=fecha_inicio, fecha_hasta=fecha_fin, generacion=vigente)
+            return datos
         except Exception as e:
             logging.error("Error al obtener el detalle para el cliente %s: %s", cliente, e)
             flash("Error al obtener el detalle: " + str(e))
             return {
                 'pedidos_data': [],
                 'pagos_data': [],
+                'flujo_caja': [],
                 'total_pages': 0,
                 'page': 1,
                 'fecha_inicio': current_date,
@@ -417,7 +291,8 @@ def detalle(cliente):
 @login_required
 def actualizar():
     try:
-        cache.clear()
+        # Solo el resumen y los detalles del dashboard; el resto del cache sigue vigente
+        invalidar_dashboard()
         flash("¡Dashboard actualizado!")
     except Exception as e:
         flash(f"Error al actualizar el dashboard: {e}")
@@ -427,146 +302,30 @@ def actualizar():
 @login_required
 def limpiar_cache():
     try:
-        cache.clear()
+        invalidar_dashboard()
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 @dashboard_bp.route("/api/datos")
 @login_required
-# Sin caché para datos siempre frescos
 def api_datos():
     """API para obtener datos del dashboard de manera eficiente"""
     try:
         fecha = request.args.get("fecha", adjust_datetime(datetime.now(chile_tz)).strftime("%Y-%m-%d"))
         cliente_filtro = request.args.get("cliente", "")
         
-        # Optimización: Solo cargar datos de los últimos 7 días para cálculos (más eficiente)
-        fecha_inicio = (datetime.strptime(fecha, "%Y-%m-%d") - timedelta(days=7)).strftime("%Y-%m-%d")
-        
-        # Consultas optimizadas - Rango de 7 días con límite aumentado
-        pedidos_query = supabase.table("pedidos").select("cliente, fecha, clp, brs").eq("eliminado", False).gte("fecha", fecha_inicio).lte("fecha", fecha).order("fecha", desc=True).limit(5000)
-        pagos_query = supabase.table("pagos_realizados").select("cliente, monto_total, fecha_registro").eq("eliminado", False).gte("fecha_registro", fecha_inicio + "T00:00:00").lte("fecha_registro", fecha + "T23:59:59")
-        
-        pedidos_hist = pedidos_query.execute().data or []
-        pagos_hist = pagos_query.execute().data or []
-        
-        # Procesar datos
-        resumen = {}
-        
-        # Procesar pedidos
-        for p in pedidos_hist:
-            if p.get("cliente") and p.get("fecha") and p.get("clp") is not None:
-                cliente = p["cliente"]
-                
-
-                
-                if cliente not in resumen:
-                    resumen[cliente] = {
-                        "cliente": cliente,
-                        "brs": 0,
-                        "clp": 0,
-                        "pagos": 0,
-                        "deuda_anterior": 0,
-                        "diferencia": 0
-                    }
-                
-                if p["fecha"] == fecha:
-                    resumen[cliente]["brs"] += float(p.get("brs", 0))
-                    resumen[cliente]["clp"] += float(p["clp"])
-                    
-
-        
-        # Procesar pagos
-        for p in pagos_hist:
-            if p.get("cliente") and p.get("monto_total") is not None:
-                cliente = p["cliente"]
-                fecha_pago = p.get("fecha_registro", "")[:10]
-                
-                if cliente not in resumen:
-                    resumen[cliente] = {
-                        "cliente": cliente,
-                        "brs": 0,
-                        "clp": 0,
-                        "pagos": 0,
-                        "deuda_anterior": 0,
-                        "diferencia": 0
-                    }
-                
-                if fecha_pago == fecha:
-                    resumen[cliente]["pagos"] += float(p["monto_total"])
-        
-        # Calcular deuda anterior (todos los pedidos hasta el día anterior)
-        fecha_anterior = (datetime.strptime(fecha, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
-        
-        # Consulta para TODOS los pedidos hasta el día anterior CON PAGINACIÓN
-        pedidos_anterior = []
-        offset = 0
-        limit = 1000
-        while True:
-            pedidos_batch = supabase.table("pedidos").select("cliente, clp").eq("eliminado", False).lte("fecha", fecha_anterior).order("fecha", desc=True).range(offset, offset + limit - 1).execute().data or []
-            if not pedidos_batch:
-                break
-            pedidos_anterior.extend(pedidos_batch)
-            offset += limit
-            if len(pedidos_batch) < limit:
-                break
-        # Consulta para TODOS los pagos hasta el día anterior CON PAGINACIÓN
-        pagos_anterior = []
-        offset = 0
-        limit = 1000
-        while True:
-            pagos_batch = supabase.table("pagos_realizados").select("cliente, monto_total").eq("eliminado", False).lte("fecha_registro", fecha_anterior + "T23:59:59").range(offset, offset + limit - 1).execute().data or []
-            if not pagos_batch:
-                break
-            pagos_anterior.extend(pagos_batch)
-            offset += limit
-            if len(pagos_batch) < limit:
-                break
-        
-        deuda_anterior_por_cliente = {}
-        for p in pedidos_anterior:
-            cliente = p["cliente"]
-            if cliente not in deuda_anterior_por_cliente:
-                deuda_anterior_por_cliente[cliente] = 0
-            deuda_anterior_por_cliente[cliente] += float(p["clp"])
-        
-        for p in pagos_anterior:
-            cliente = p["cliente"]
-            if cliente not in deuda_anterior_por_cliente:
-                deuda_anterior_por_cliente[cliente] = 0
-            deuda_anterior_por_cliente[cliente] -= float(p["monto_total"])
-        
-        # Aplicar deuda anterior
-        for cliente in resumen:
-            resumen[cliente]["deuda_anterior"] = deuda_anterior_por_cliente.get(cliente, 0)
-            resumen[cliente]["diferencia"] = (
-                resumen[cliente]["deuda_anterior"] + 
-                resumen[cliente]["clp"] - 
-                resumen[cliente]["pagos"]
-            )
-        
-        # Filtrar clientes con algún valor relevante
-        clientes_filtrados = sorted([
-            r["cliente"] for r in resumen.values()
-            if r["brs"] != 0 or r["clp"] != 0 or r["pagos"] != 0 or r["diferencia"] != 0 or r["deuda_anterior"] != 0
-        ])
-        
-        # Aplicar filtro de cliente si existe
-        if cliente_filtro:
-            if cliente_filtro in resumen:
-                resumen_list = [resumen[cliente_filtro]]
-            else:
-                resumen_list = []
-        else:
-            resumen_list = [r for r in resumen.values() if r["cliente"] in clientes_filtrados]
+        # Resumen compartido con la vista HTML (desde el cache si ya se calculó)
+        datos = resumen_service.obtener(fecha, DIAS_RESUMEN, cliente_filtro)
+        resumen_list = datos["resumen"]
+        clientes_filtrados = datos["clientes"]
         
         return jsonify({
             "success": True,
             "data": resumen_list,
             "clientes": clientes_filtrados,
             "fecha": fecha,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datos["calculado_en"]
         })
         
     except Exception as e:
@@ -588,111 +347,10 @@ def exportar_csv():
         fecha = request.args.get("fecha", adjust_datetime(datetime.now(chile_tz)).strftime("%Y-%m-%d"))
         cliente_filtro = request.args.get("cliente", "")
         
-        # Optimización: Solo cargar datos de los últimos 30 días
-        fecha_inicio = (datetime.strptime(fecha, "%Y-%m-%d") - timedelta(days=30)).strftime("%Y-%m-%d")
-        
-        # Consultas optimizadas
-        pedidos_query = supabase.table("pedidos").select("cliente, fecha, clp, brs").eq("eliminado", False).gte("fecha", fecha_inicio).lte("fecha", fecha)
-        pagos_query = supabase.table("pagos_realizados").select("cliente, monto_total, fecha_registro").eq("eliminado", False).gte("fecha_registro", fecha_inicio + "T00:00:00").lte("fecha_registro", fecha + "T23:59:59")
-        
-        pedidos_hist = pedidos_query.execute().data or []
-        pagos_hist = pagos_query.execute().data or []
-        
-        # Procesar datos
-        resumen = {}
-        
-        # Procesar pedidos
-        for p in pedidos_hist:
-            if p.get("cliente") and p.get("fecha") and p.get("clp") is not None:
-                cliente = p["cliente"]
-                
-                if cliente not in resumen:
-                    resumen[cliente] = {
-                        "cliente": cliente,
-                        "brs": 0,
-                        "clp": 0,
-                        "pagos": 0,
-                        "deuda_anterior": 0,
-                        "diferencia": 0
-                    }
-                
-                if p["fecha"] == fecha:
-                    resumen[cliente]["brs"] += float(p.get("brs", 0))
-                    resumen[cliente]["clp"] += float(p["clp"])
-        
-        # Procesar pagos
-        for p in pagos_hist:
-            if p.get("cliente") and p.get("monto_total") is not None:
-                cliente = p["cliente"]
-                fecha_pago = p.get("fecha_registro", "")[:10]
-                
-                if cliente not in resumen:
-                    resumen[cliente] = {
-                        "cliente": cliente,
-                        "brs": 0,
-                        "clp": 0,
-                        "pagos": 0,
-                        "deuda_anterior": 0,
-                        "diferencia": 0
-                    }
-                
-                if fecha_pago == fecha:
-                    resumen[cliente]["pagos"] += float(p["monto_total"])
-        
-        # Calcular deuda anterior (todos los pedidos hasta el día anterior)
-        fecha_anterior = (datetime.strptime(fecha, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
-        
-        # Consulta para TODOS los pedidos hasta el día anterior
-        pedidos_anterior = supabase.table("pedidos").select("cliente, clp").eq("eliminado", False).lte("fecha", fecha_anterior).execute().data or []
-        # Consulta para TODOS los pagos hasta el día anterior CON PAGINACIÓN
-        pagos_anterior = []
-        offset = 0
-        limit = 1000
-        while True:
-            pagos_batch = supabase.table("pagos_realizados").select("cliente, monto_total").eq("eliminado", False).lte("fecha_registro", fecha_anterior + "T23:59:59").range(offset, offset + limit - 1).execute().data or []
-            if not pagos_batch:
-                break
-            pagos_anterior.extend(pagos_batch)
-            offset += limit
-            if len(pagos_batch) < limit:
-                break
-        
-        deuda_anterior_por_cliente = {}
-        for p in pedidos_anterior:
-            cliente = p["cliente"]
-            if cliente not in deuda_anterior_por_cliente:
-                deuda_anterior_por_cliente[cliente] = 0
-            deuda_anterior_por_cliente[cliente] += float(p["clp"])
-        
-        for p in pagos_anterior:
-            cliente = p["cliente"]
-            if cliente not in deuda_anterior_por_cliente:
-                deuda_anterior_por_cliente[cliente] = 0
-            deuda_anterior_por_cliente[cliente] -= float(p["monto_total"])
-        
-        # Aplicar deuda anterior
-        for cliente in resumen:
-            resumen[cliente]["deuda_anterior"] = deuda_anterior_por_cliente.get(cliente, 0)
-            resumen[cliente]["diferencia"] = (
-                resumen[cliente]["deuda_anterior"] + 
-                resumen[cliente]["clp"] - 
-                resumen[cliente]["pagos"]
-            )
-        
-        # Filtrar clientes con algún valor relevante
-        clientes_filtrados = sorted([
-            r["cliente"] for r in resumen.values()
-            if r["brs"] != 0 or r["clp"] != 0 or r["pagos"] != 0 or r["diferencia"] != 0 or r["deuda_anterior"] != 0
-        ])
-        
-        # Aplicar filtro de cliente si existe
-        if cliente_filtro:
-            if cliente_filtro in resumen:
-                resumen_list = [resumen[cliente_filtro]]
-            else:
-                resumen_list = []
-        else:
-            resumen_list = [r for r in resumen.values() if r["cliente"] in clientes_filtrados]
+        # Resumen compartido con la vista HTML (desde el cache si ya se calculó)
+        datos = resumen_service.obtener(fecha, DIAS_RESUMEN, cliente_filtro)
+        resumen_list = datos["resumen"]
+        clientes_filtrados = datos["clientes"]
         
         # Generar CSV en memoria (UTF-16LE)
         output = io.StringIO()
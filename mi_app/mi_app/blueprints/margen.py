@@ -2,6 +2,9 @@ from flask import Blueprint, render_template, request, session, jsonify, redirec
 from datetime import datetime, timedelta
 from supabase import create_client
 import os
+from mi_app.mi_app.consultas_paralelas import consultar_en_paralelo
+from mi_app.mi_app.recalculo_flujo import fechas_pendientes, marcar_recalculadas, recalcular_flujo
+from mi_app.mi_app.totales_diarios import compras_del_dia, pedidos_del_dia
 
 margen_bp = Blueprint("margen", __name__)
 
@@ -183,14 +186,22 @@ def flujo_capital():
         
         flujo_data = flujo_data_filtrado
         
-        # Si se solicita recálculo o hay datos desactualizados, recalcular automáticamente
-        if recalcular or verificar_datos_desactualizados(flujo_data, fecha_inicio, fecha_fin):
-            print("🔄 Recalculando flujo de capital automáticamente...")
-            for item in flujo_data:
-                try:
-                    calcular_flujo_capital_automatico(item['fecha'])
-                except Exception as e:
-                    print(f"Error al recalcular {item['fecha']}: {e}")
+        # Si se solicita recálculo o hay días con cambios, recalcular automáticamente
+        fechas_flujo = [item['fecha'] for item in flujo_data]
+        pendientes = verificar_datos_desactualizados(flujo_data, fecha_inicio, fecha_fin)
+        if recalcular or pendientes is None or pendientes:
+            # Solo los días con cambios (o todos si se pidió o no se pudo saber); los siguientes se encadenan
+            fechas_recalcular = fechas_flujo if recalcular or pendientes is None else sorted(pendientes)
+            print(f"🔄 Recalculando flujo de capital automáticamente ({len(fechas_recalcular)} días)...")
+            try:
+                # Todo el rango en una pasada: capital_final se encadena en memoria y se guarda con un upsert
+                resultado = recalcular_flujo(fechas_recalcular, encadenar_hasta=fecha_fin)
+                for diferencia in resultado["diferencias"]:
+                    print(f"   {diferencia['fecha']}: {', '.join(diferencia['cambios'])}")
+                if pendientes:
+                    marcar_recalculadas(pendientes)
+            except Exception as e:
+                print(f"Error al recalcular el flujo de capital: {e}")
             
             # Obtener datos actualizados (CONSULTA OPTIMIZADA)
             flujo_data = supabase.table("flujo_capital").select(
@@ -340,26 +351,18 @@ def actualizar_flujo_capital():
         saldo_anterior = row[0] if row else None
         
         # Calcular ponderado VES/CLP usando la lógica completa de márgenes
-        # Sumar todos los BRS vendidos de la tabla pedidos para la fecha seleccionada
-        pedidos = supabase.table("pedidos").select("brs, clp").eq("fecha", fecha).eq("eliminado", False).execute().data
-        brs_vendidos_hoy = sum(float(p["brs"]) for p in pedidos) if pedidos else 0
-        
-        # Sumar todos los BRS comprados (VES recibidos por cambio de USDT) de la tabla compras
-        inicio = fecha + "T00:00:00"
-        fin = fecha + "T23:59:59"
-        compras_brs = supabase.table("compras").select("totalprice, amount, commission").eq("fiat", "VES").eq("tradetype", "SELL").gte("createtime", inicio).lte("createtime", fin).execute().data
-        brs_comprados = sum(float(c["totalprice"]) for c in compras_brs) if compras_brs else 0
-        usdt_vendidos = sum(float(c["amount"]) + float(c.get("commission", 0)) for c in compras_brs) if compras_brs else 0
-        
-        # Sumar todos los USDT comprados (costo_real) de la tabla compras
-        compras_usdt = supabase.table("compras").select("costo_real, totalprice").eq("fiat", "CLP").eq("tradetype", "BUY").gte("createtime", inicio).lte("createtime", fin).execute().data
-        usdt_comprados = sum(float(c["costo_real"]) for c in compras_usdt) if compras_usdt else 0
-        clp_invertidos = sum(float(c["totalprice"]) for c in compras_usdt) if compras_usdt else 0
-        
-        # Sumar todos los USDT vendidos en CLP (amount) de la tabla compras
-        ventas_usdt_clp = supabase.table("compras").select("amount, totalprice").eq("fiat", "CLP").eq("tradetype", "SELL").gte("createtime", inicio).lte("createtime", fin).execute().data
-        usdt_vendidos_clp = sum(float(c["amount"]) for c in ventas_usdt_clp) if ventas_usdt_clp else 0
-        clp_recibidos_usdt = sum(float(c["totalprice"]) for c in ventas_usdt_clp) if ventas_usdt_clp else 0
+        # Totales de pedidos del día (DETAL y mayor) en una sola consulta memoizada por fecha
+        totales_pedidos = pedidos_del_dia(fecha)
+        brs_vendidos_hoy = totales_pedidos["brs_total"]
+        
+        # Totales de compras del día (VES SELL, CLP BUY y CLP SELL) en una sola consulta memoizada por fecha
+        totales_compras = compras_del_dia(fecha)
+        brs_comprados = totales_compras["brs_comprados"]
+        usdt_vendidos = totales_compras["usdt_vendidos"]
+        usdt_comprados = totales_compras["usdt_comprados"]
+        clp_invertidos = totales_compras["clp_invertidos"]
+        usdt_vendidos_clp = totales_compras["usdt_vendidos_clp"]
+        clp_recibidos_usdt = totales_compras["clp_recibidos_usdt"]
         
         # Calcular tasas
         tasa_usdt_ves_actual = brs_comprados / usdt_vendidos if usdt_vendidos > 0 else 0
@@ -396,18 +399,11 @@ def actualizar_flujo_capital():
         if total_brs > 0:
             ponderado_ves_clp = (brs_anterior * tasa_ves_clp_anterior + brs_comprados * tasa_ves_clp_actual) / total_brs
         
-        # Calcular BRS vendidos al cliente DETAL
-        pedidos_detal = supabase.table("pedidos").select("brs").eq("fecha", fecha).eq("eliminado", False).eq("cliente", "DETAL").execute().data
-        brs_vendidos_detal = sum(float(p["brs"]) for p in pedidos_detal) if pedidos_detal else 0
-        brs_vendidos_mayor = brs_vendidos_hoy - brs_vendidos_detal
-        
-        # CLP recibidos del cliente DETAL
-        pedidos_detal_clp = supabase.table("pedidos").select("clp").eq("fecha", fecha).eq("eliminado", False).eq("cliente", "DETAL").execute().data
-        clp_recibidos_detal = sum(float(p["clp"]) for p in pedidos_detal_clp) if pedidos_detal_clp else 0
-        
-        # CLP recibidos de todos menos DETAL
-        pedidos_mayor_clp = supabase.table("pedidos").select("clp").eq("fecha", fecha).eq("eliminado", False).neq("cliente", "DETAL").execute().data
-        clp_recibidos_mayor = sum(float(p["clp"]) for p in pedidos_mayor_clp) if pedidos_mayor_clp else 0
+        # BRS vendidos y CLP recibidos del cliente DETAL y del resto (mayor)
+        brs_vendidos_detal = totales_pedidos["brs_detal"]
+        brs_vendidos_mayor = totales_pedidos["brs_mayor"]
+        clp_recibidos_detal = totales_pedidos["clp_detal"]
+        clp_recibidos_mayor = totales_pedidos["clp_mayor"]
         
         # Calcular márgenes
         if ponderado_ves_clp > 0:
@@ -485,175 +481,28 @@ def sincronizar_flujo_capital():
         return jsonify({'success': False, 'message': f'Error interno: {str(e)}'}), 500
 
 def verificar_datos_desactualizados(flujo_data, fecha_inicio, fecha_fin):
-    """Verifica si los datos del flujo de capital están desactualizados"""
-    try:
-        if not flujo_data:
-            return True
-        
-        # Verificar si hay pedidos recientes que no están reflejados
-        for item in flujo_data:
-            fecha = item['fecha']
-            
-            # Obtener última actualización del flujo
-            ultima_actualizacion_flujo = item.get('updated_at')
-            
-            # Obtener último pedido de esa fecha (usando fecha en lugar de created_at)
-            ultimo_pedido = supabase.table("pedidos").select("fecha").eq("fecha", fecha).eq("eliminado", False).order("fecha", desc=True).limit(1).execute().data
-            
-            if ultimo_pedido and ultima_actualizacion_flujo:
-                ultima_actualizacion_flujo = datetime.fromisoformat(ultima_actualizacion_flujo.replace('Z', '+00:00'))
-                ultimo_pedido_time = datetime.strptime(ultimo_pedido[0]['fecha'], '%Y-%m-%d')
-                
-                # Si hay pedidos más recientes que la última actualización del flujo
-                if ultimo_pedido_time > ultima_actualizacion_flujo:
-                    print(f"⚠️ Datos desactualizados para {fecha}: pedidos más recientes que el flujo")
-                    return True
-        
-        return False
-        
-    except Exception as e:
-        print(f"Error al verificar datos desactualizados: {e}")
-        return True
+    """
+    Días del flujo de capital con pedidos, compras o stock modificados después de su último recálculo.
+    Una sola consulta a las marcas de cambio por fecha para todo el rango.
+    Returns:
+        dict fecha -> marca de cambio (vacío si todo está al día), o None si no se puede saber
+    """
+    fechas_flujo = {item['fecha'][:10] for item in flujo_data}
+    pendientes = fechas_pendientes(fecha_inicio, fecha_fin)
+    if pendientes is None:
+        return None
+    # Solo los días que ya tienen flujo (los faltantes los crea calcular_flujo_faltante.py)
+    pendientes = {fecha: marca for fecha, marca in pendientes.items() if fecha in fechas_flujo}
+    if pendientes:
+        print(f"⚠️ Datos desactualizados para {len(pendientes)} días: {', '.join(sorted(pendientes))}")
+    return pendientes
 
 def calcular_flujo_capital_automatico(fecha):
     """Calcula automáticamente el flujo de capital para una fecha específica (OPTIMIZADO)"""
     try:
-        fecha_dt = datetime.strptime(fecha, '%Y-%m-%d')
-        fecha_ayer = (fecha_dt - timedelta(days=1)).strftime('%Y-%m-%d')
-        
-        # CONSULTAS OPTIMIZADAS - Proyecciones específicas
-        # 1. Capital anterior - solo la columna necesaria
-        capital_anterior = supabase.table("flujo_capital").select("capital_final").eq("fecha", fecha_ayer).execute().data
-        capital_inicial = float(capital_anterior[0]['capital_final']) if capital_anterior else 32000000
-        
-        # 2. Stock diario - una sola consulta con todas las columnas necesarias
-        stock_data = supabase.table("stock_diario").select(
-            "gastos, pago_movil, envios_al_detal, brs_stock, usdt_stock, tasa_ves_clp, usdt_tasa"
-        ).eq("fecha", fecha).execute().data
-        
-        if stock_data and stock_data[0]:
-            gastos = float(stock_data[0].get('gastos', 15330))
-            pago_movil = float(stock_data[0].get('pago_movil', 7190))
-            envios_al_detal = float(stock_data[0].get('envios_al_detal', 170984))
-            saldo_anterior = stock_data[0]
-        else:
-            gastos = 15330
-            pago_movil = 7190
-            envios_al_detal = 170984
-            saldo_anterior = None
-        
-        # 3. Pedidos - filtros optimizados con solo las columnas necesarias
-        pedidos = supabase.table("pedidos").select("brs, clp, cliente").eq("fecha", fecha).eq("eliminado", False).execute().data
-        brs_vendidos_hoy = sum(float(p["brs"]) for p in pedidos) if pedidos else 0
-        
-        # 4. Compras - consultas específicas con rangos de fecha optimizados
-        inicio = fecha + "T00:00:00"
-        fin = fecha + "T23:59:59"
-        
-        # Compras BRS (VES recibidos por cambio de USDT)
-        compras_brs = supabase.table("compras").select("totalprice, amount, commission").eq("fiat", "VES").eq("tradetype", "SELL").gte("createtime", inicio).lte("createtime", fin).execute().data
-        brs_comprados = sum(float(c["totalprice"]) for c in compras_brs) if compras_brs else 0
-        usdt_vendidos = sum(float(c["amount"]) + float(c.get("commission", 0)) for c in compras_brs) if compras_brs else 0
-        
-        # Compras USDT (costo_real)
-        compras_usdt = supabase.table("compras").select("costo_real, totalprice").eq("fiat", "CLP").eq("tradetype", "BUY").gte("createtime", inicio).lte("createtime", fin).execute().data
-        usdt_comprados = sum(float(c["costo_real"]) for c in compras_usdt) if compras_usdt else 0
-        clp_invertidos = sum(float(c["totalprice"]) for c in compras_usdt) if compras_usdt else 0
-        
-        # Ventas USDT en CLP
-        ventas_usdt_clp = supabase.table("compras").select("amount, totalprice").eq("fiat", "CLP").eq("tradetype", "SELL").gte("createtime", inicio).lte("createtime", fin).execute().data
-        usdt_vendidos_clp = sum(float(c["amount"]) for c in ventas_usdt_clp) if ventas_usdt_clp else 0
-        clp_recibidos_usdt = sum(float(c["totalprice"]) for c in ventas_usdt_clp) if ventas_usdt_clp else 0
-        
-        # Calcular tasas
-        tasa_usdt_ves_actual = brs_comprados / usdt_vendidos if usdt_vendidos > 0 else 0
-        tasa_usdt_clp_actual = clp_invertidos / usdt_comprados if usdt_comprados > 0 else 0
-        
-        total_brs = (float(saldo_anterior["brs_stock"]) if saldo_anterior and saldo_anterior.get("brs_stock") is not None else 0) + brs_comprados
-        total_usdt = (float(saldo_anterior["usdt_stock"]) if saldo_anterior and saldo_anterior.get("usdt_stock") is not None else 0) + usdt_comprados - usdt_vendidos_clp
-        
-        clp_anterior = 0
-        if saldo_anterior and saldo_anterior.get('usdt_stock') is not None and saldo_anterior.get('usdt_tasa') is not None:
-            clp_anterior = float(saldo_anterior['usdt_stock']) * float(saldo_anterior['usdt_tasa'])
-        
-        total_clp = clp_anterior + clp_invertidos + clp_recibidos_usdt
-        usdt_anterior = float(saldo_anterior["usdt_stock"]) if saldo_anterior and saldo_anterior.get("usdt_stock") is not None else 0
-        tasa_usdt_clp_anterior = float(saldo_anterior["usdt_tasa"]) if saldo_anterior and saldo_anterior.get("usdt_tasa") is not None else 0
-        tasa_usdt_clp_general = 0
-        if total_usdt > 0:
-            tasa_usdt_clp_general = (usdt_anterior * tasa_usdt_clp_anterior + usdt_comprados * tasa_usdt_clp_actual) / total_usdt
-        
-        clp_por_usdt_vendido = usdt_vendidos * tasa_usdt_clp_general
-        tasa_ves_clp_actual = brs_comprados / clp_por_usdt_vendido if clp_por_usdt_vendido > 0 else 0
-        
-        brs_anterior = float(saldo_anterior["brs_stock"]) if saldo_anterior and saldo_anterior.get("brs_stock") is not None else 0
-        tasa_ves_clp_anterior = float(saldo_anterior["tasa_ves_clp"]) if saldo_anterior and saldo_anterior.get("tasa_ves_clp") is not None else 0
-        ponderado_ves_clp = 0
-        if total_brs > 0:
-            ponderado_ves_clp = (brs_anterior * tasa_ves_clp_anterior + brs_comprados * tasa_ves_clp_actual) / total_brs
-        
-        # OPTIMIZACIÓN: Usar los datos de pedidos ya obtenidos en lugar de hacer consultas adicionales
-        # Calcular BRS vendidos al cliente DETAL
-        brs_vendidos_detal = sum(float(p["brs"]) for p in pedidos if p.get("cliente") == "DETAL") if pedidos else 0
-        brs_vendidos_mayor = brs_vendidos_hoy - brs_vendidos_detal
-        
-        # CLP recibidos del cliente DETAL
-        clp_recibidos_detal = sum(float(p["clp"]) for p in pedidos if p.get("cliente") == "DETAL") if pedidos else 0
-        
-        # CLP recibidos de todos menos DETAL
-        clp_recibidos_mayor = sum(float(p["clp"]) for p in pedidos if p.get("cliente") != "DETAL") if pedidos else 0
-        
-        # Calcular márgenes
-        if ponderado_ves_clp > 0:
-            margen_mayor = clp_recibidos_mayor - (brs_vendidos_mayor / ponderado_ves_clp)
-            margen_detal = clp_recibidos_detal - (brs_vendidos_detal / ponderado_ves_clp)
-            costo_pago_movil = pago_movil / ponderado_ves_clp
-            costo_gastos = gastos / ponderado_ves_clp
-        else:
-            margen_mayor = 0
-            margen_detal = 0
-            costo_pago_movil = 0
-            costo_gastos = 0
-        
-        margen_total = margen_mayor + margen_detal
-        margen_neto = margen_total - costo_pago_movil
-        
-        # Obtener gastos manuales si existen
-        flujo_existente = supabase.table("flujo_capital").select("gastos_manuales").eq("fecha", fecha).execute().data
-        gastos_manuales = float(flujo_existente[0]['gastos_manuales']) if flujo_existente else 0
-        
-        # Calcular ganancias (margen neto)
-        ganancias = margen_neto
-        
-        # Calcular capital final
-        capital_final = capital_inicial + ganancias - costo_gastos - gastos_manuales
-        
-        # Preparar datos para insertar/actualizar
-        flujo_data = {
-            'fecha': fecha,
-            'capital_inicial': capital_inicial,
-            'ganancias': ganancias,
-            'costo_gastos': costo_gastos,
-            'gastos_manuales': gastos_manuales,
-            'capital_final': capital_final,
-            'margen_neto': margen_neto,
-            'ponderado_ves_clp': ponderado_ves_clp,
-            'gastos_brs': gastos,
-            'pago_movil_brs': pago_movil,
-            'envios_al_detal_brs': envios_al_detal
-        }
-        
-        # Verificar si ya existe un registro para esta fecha
-        existing = supabase.table("flujo_capital").select("fecha").eq("fecha", fecha).execute().data
-        
-        if existing:
-            # Actualizar registro existente
-            response = supabase.table("flujo_capital").update(flujo_data).eq("fecha", fecha).execute()
-        else:
-            # Crear nuevo registro
-            response = supabase.table("flujo_capital").insert(flujo_data).execute()
-        
-        return response.data if response.data else None
+        # Mismo motor que el recálculo por rango, con un solo día
+        resultado = recalcular_flujo([fecha])
+        return resultado["filas"] or resultado["calculadas"]
         
     except Exception as e:
         print(f"Error al calcular flujo de capital automático: {e}")
@@ -732,8 +581,16 @@ def index():
         fecha = datetime.now().strftime("%Y-%m-%d")
     fecha_ayer = (datetime.strptime(fecha, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
     
+    # Todas las consultas de la página son independientes: se ejecutan en paralelo
+    respuestas = consultar_en_paralelo({
+        "gastos": supabase.table("stock_diario").select("gastos, pago_movil, envios_al_detal").eq("fecha", fecha),
+        "stock_ayer": supabase.table("stock_diario").select("brs_stock, usdt_stock, tasa_ves_clp, usdt_tasa").eq("fecha", fecha_ayer),
+        "pedidos": lambda: pedidos_del_dia(fecha),
+        "compras": lambda: compras_del_dia(fecha),
+    }, etiqueta="MARGEN")
+    
     # Consultar gastos de la fecha seleccionada desde la base de datos
-    row_gastos = supabase.table("stock_diario").select("gastos, pago_movil, envios_al_detal").eq("fecha", fecha).execute().data
+    row_gastos = respuestas["gastos"].data
     if row_gastos and row_gastos[0]:
         gastos = float(row_gastos[0].get('gastos', 15330))
         pago_movil = float(row_gastos[0].get('pago_movil', 7190))
@@ -745,37 +602,23 @@ def index():
         envios_al_detal = 170984
     
     # Consultar stock diario de ayer
-    row = supabase.table("stock_diario").select("brs_stock, usdt_stock, tasa_ves_clp, usdt_tasa").eq("fecha", fecha_ayer).execute().data
+    row = respuestas["stock_ayer"].data
     saldo_anterior = row[0] if row else None
     fecha_hoy = datetime.now().strftime("%Y-%m-%d")
     
-    # Consultar stock diario de hoy
-    row_hoy = supabase.table("stock_diario").select("brs_stock").eq("fecha", fecha).execute().data
-    brs_vendidos_hoy = row_hoy[0]["brs_stock"] if row_hoy else None
-    
-    # Sumar todos los BRS vendidos de la tabla pedidos para la fecha seleccionada
-    pedidos = supabase.table("pedidos").select("brs, clp").eq("fecha", fecha).eq("eliminado", False).execute().data
-    brs_vendidos_hoy = sum(float(p["brs"]) for p in pedidos) if pedidos else 0
-    
-    # Sumar todos los CLP recibidos de la tabla pedidos para la fecha seleccionada
-    clp_recibidos = sum(float(p["clp"]) for p in pedidos) if pedidos else 0
+    # Totales de pedidos de la fecha seleccionada (DETAL y mayor en una sola consulta)
+    totales_pedidos = respuestas["pedidos"]
+    brs_vendidos_hoy = totales_pedidos["brs_total"]
+    clp_recibidos = totales_pedidos["clp_total"]
     
-    # Sumar todos los BRS comprados (VES recibidos por cambio de USDT) de la tabla compras para la fecha seleccionada
-    inicio = fecha + "T00:00:00"
-    fin = fecha + "T23:59:59"
-    compras_brs = supabase.table("compras").select("totalprice, amount, commission").eq("fiat", "VES").eq("tradetype", "SELL").gte("createtime", inicio).lte("createtime", fin).execute().data
-    brs_comprados = sum(float(c["totalprice"]) for c in compras_brs) if compras_brs else 0
-    usdt_vendidos = sum(float(c["amount"]) + float(c.get("commission", 0)) for c in compras_brs) if compras_brs else 0
-    
-    # Sumar todos los USDT comprados (costo_real) de la tabla compras para la fecha seleccionada
-    compras_usdt = supabase.table("compras").select("costo_real, totalprice").eq("fiat", "CLP").eq("tradetype", "BUY").gte("createtime", inicio).lte("createtime", fin).execute().data
-    usdt_comprados = sum(float(c["costo_real"]) for c in compras_usdt) if compras_usdt else 0
-    clp_invertidos = sum(float(c["totalprice"]) for c in compras_usdt) if compras_usdt else 0
-    
-    # Sumar todos los USDT vendidos en CLP (amount) de la tabla compras para la fecha seleccionada
-    ventas_usdt_clp = supabase.table("compras").select("amount, totalprice").eq("fiat", "CLP").eq("tradetype", "SELL").gte("createtime", inicio).lte("createtime", fin).execute().data
-    usdt_vendidos_clp = sum(float(c["amount"]) for c in ventas_usdt_clp) if ventas_usdt_clp else 0
-    clp_recibidos_usdt = sum(float(c["totalprice"]) for c in ventas_usdt_clp) if ventas_usdt_clp else 0
+    # Totales de compras de la fecha seleccionada (VES SELL, CLP BUY y CLP SELL en una sola consulta)
+    totales_compras = respuestas["compras"]
+    brs_comprados = totales_compras["brs_comprados"]
+    usdt_vendidos = totales_compras["usdt_vendidos"]
+    usdt_comprados = totales_compras["usdt_comprados"]
+    clp_invertidos = totales_compras["clp_invertidos"]
+    usdt_vendidos_clp = totales_compras["usdt_vendidos_clp"]
+    clp_recibidos_usdt = totales_compras["clp_recibidos_usdt"]
     
     tasa_usdt_ves_actual = brs_comprados / usdt_vendidos if usdt_vendidos > 0 else 0
     tasa_usdt_clp_actual = clp_invertidos / usdt_comprados if usdt_comprados > 0 else 0
@@ -813,19 +656,14 @@ def index():
     sobrante_brs = total_brs - brs_vendidos_hoy
     
     # Calcular BRS vendidos al cliente DETAL
-    pedidos_detal = supabase.table("pedidos").select("brs").eq("fecha", fecha).eq("eliminado", False).eq("cliente", "DETAL").execute().data
-    brs_vendidos_detal = sum(float(p["brs"]) for p in pedidos_detal) if pedidos_detal else 0
-    brs_vendidos_mayor = brs_vendidos_hoy - brs_vendidos_detal
+    brs_vendidos_detal = totales_pedidos["brs_detal"]
+    brs_vendidos_mayor = totales_pedidos["brs_mayor"]
     
     sobrante_al_mayor = total_brs - brs_vendidos_mayor - gastos - pago_movil - envios_al_detal
     
-    # CLP recibidos del cliente DETAL
-    pedidos_detal_clp = supabase.table("pedidos").select("clp").eq("fecha", fecha).eq("eliminado", False).eq("cliente", "DETAL").execute().data
-    clp_recibidos_detal = sum(float(p["clp"]) for p in pedidos_detal_clp) if pedidos_detal_clp else 0
-    
-    # CLP recibidos de todos menos DETAL
-    pedidos_mayor_clp = supabase.table("pedidos").select("clp").eq("fecha", fecha).eq("eliminado", False).neq("cliente", "DETAL").execute().data
-    clp_recibidos_mayor = sum(float(p["clp"]) for p in pedidos_mayor_clp) if pedidos_mayor_clp else 0
+    # CLP recibidos del cliente DETAL y de todos los demás
+    clp_recibidos_detal = totales_pedidos["clp_detal"]
+    clp_recibidos_mayor = totales_pedidos["clp_mayor"]
     
     if ponderado_ves_clp > 0:
         margen_mayor = clp_recibidos_mayor - (brs_vendidos_mayor / ponderado_ves_clp)
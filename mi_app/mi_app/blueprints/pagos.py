@@ -5,7 +5,8 @@ from datetime import datetime, timedelta
 import logging
 import pytz
 from functools import wraps
-from mi_app.mi_app.blueprints.dashboard import cache
+from mi_app.mi_app.resumen_dashboard import invalidar_dashboard
+from mi_app.mi_app.saldos_clientes import mover_saldo, registrar_delta_saldo, fecha_de_registro
 
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
@@ -153,8 +154,10 @@ def nuevo():
             }).execute()
             
             if result.data:
-                # Limpiar caché del dashboard
-                cache.clear()
+                # Actualizar libro diario de saldos
+                registrar_delta_saldo(cliente, fecha_de_registro(fecha_hora), pagos=monto_float)
+                # Invalidar solo el dashboard afectado por este cliente y fecha
+                invalidar_dashboard(cliente, fecha_de_registro(fecha_hora))
                 # Guardar el cliente en la sesión para el próximo ingreso
                 session['ultimo_cliente_pagos'] = cliente
                 
@@ -189,7 +192,7 @@ def nuevo():
 def editar(pago_id):
     try:
         # Obtener el pago actual
-        pago_resp = supabase.table("pagos_realizados").select("id, cliente, monto_total, fecha_registro").eq("id", pago_id).single().execute()
+        pago_resp = supabase.table("pagos_realizados").select("id, cliente, monto_total, fecha_registro, eliminado").eq("id", pago_id).single().execute()
         pago = pago_resp.data if pago_resp.data else None
         if not pago:
             flash("Pago no encontrado.")
@@ -267,8 +270,14 @@ def editar(pago_id):
                 "monto_total": float(nuevo_monto),
                 "fecha_registro": nueva_fecha_registro
             }).eq("id", pago_id).execute()
-            # Limpiar caché del dashboard
-            cache.clear()
+            # Mover el pago en el libro diario de saldos (revertir el anterior y aplicar el nuevo)
+            # Un pago eliminado ya no cuenta en el libro: no se revierte ni se aplica
+            if not pago.get("eliminado"):
+                mover_saldo({"cliente": pago["cliente"], "fecha": fecha_de_registro(fecha_registro_original), "pagos": pago["monto_total"]},
+                            {"cliente": nuevo_cliente, "fecha": fecha_de_registro(nueva_fecha_registro), "pagos": nuevo_monto})
+            # Invalidar el dashboard del cliente/fecha anterior y del nuevo
+            invalidar_dashboard(pago["cliente"], fecha_de_registro(fecha_registro_original))
+            invalidar_dashboard(nuevo_cliente, fecha_de_registro(nueva_fecha_registro))
             # Guardar en historial (siempre, aunque no haya cambios)
             if not cambios:
                 cambios.append({
@@ -305,10 +314,16 @@ def eliminar(pago_id):
         print(f"[DEBUG] Eliminando pago con ID: {pago_id}")
         usuario = session.get("email", "desconocido")
         ahora = datetime.now(chile_tz).isoformat()
+        # Obtener el pago antes de eliminarlo para revertir su saldo
+        pago_resp = supabase.table("pagos_realizados").select("cliente, monto_total, fecha_registro, eliminado").eq("id", pago_id).execute()
+        pago = pago_resp.data[0] if pago_resp.data else None
         # Solo marcar como eliminado, sin tocar fecha_registro ni otros campos
         result = supabase.table("pagos_realizados").update({"eliminado": True}).eq("id", pago_id).execute()
-        # Limpiar caché del dashboard
-        cache.clear()
+        if pago and not pago.get("eliminado"):
+            registrar_delta_saldo(pago["cliente"], fecha_de_registro(pago["fecha_registro"]), pagos=-float(pago["monto_total"]))
+        # Invalidar solo el dashboard afectado por este pago
+        if pago:
+            invalidar_dashboard(pago["cliente"], fecha_de_registro(pago["fecha_registro"]))
         print(f"[DEBUG] Resultado del update en Supabase: {result}")
         # Eliminar también la relación en transferencias_pagos
         supabase.table("transferencias_pagos").delete().eq("pago_id", pago_id).execute()
@@ -6,7 +6,12 @@ from functools import wraps
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
 from supabase import create_client, Client
 import pytz
-from mi_app.mi_app.blueprints.dashboard import cache
+from mi_app.mi_app.resumen_dashboard import invalidar_dashboard
+from mi_app.mi_app.totales_diarios import invalidar_pedidos_dia
+from mi_app.mi_app.saldos_clientes import mover_saldo, registrar_delta_saldo
+from mi_app.mi_app.saldos_cuentas import cuentas_con_ultimo_movimiento, eliminar_movimientos, insertar_movimiento, recalcular_saldo, recalcular_saldos_cuentas
+from mi_app.mi_app.extensions import obtener_permisos
+from mi_app.mi_app.consultas_paralelas import consultar_en_paralelo
 
 # Configuración de zona horaria
 chile_tz = pytz.timezone('America/Santiago')
@@ -185,33 +190,35 @@ def index():
             query = query.eq("cuenta_id", cuenta_id)
 
         query = query.order("fecha", desc=False)
-        response = query.execute()
+
+        # Obtener cuentas activas para el filtro
+        def consultar_cuentas_activas():
+            try:
+                response_cuentas = supabase.table("cuentas_activas").select("id, numero_cuenta, nombre_titular").eq("activa", True).order("nombre_titular").execute()
+                return response_cuentas.data if response_cuentas.data else []
+            except Exception as e:
+                logging.error("Error al obtener cuentas activas: %s", e)
+                return []
+
+        # Pedidos, cuentas y tasas no dependen entre sí: se consultan en paralelo
+        respuestas = consultar_en_paralelo({
+            "pedidos": query,
+            "cuentas": consultar_cuentas_activas,
+            "tasas": supabase.table("configuracion").select("clave, valor").in_("clave", ["tasa_banesco", "tasa_venezuela", "tasa_otros"]),
+        }, etiqueta="PEDIDOS")
+        response = respuestas["pedidos"]
         pedidos_data = response.data if response.data is not None else []
         clientes = sorted({p["cliente"] for p in pedidos_data if p.get("cliente")})
-        
-        # Obtener cuentas activas para el filtro
-        try:
-            response_cuentas = supabase.table("cuentas_activas").select("id, numero_cuenta, nombre_titular").eq("activa", True).order("nombre_titular").execute()
-            cuentas_activas = response_cuentas.data if response_cuentas.data else []
-        except Exception as e:
-            logging.error("Error al obtener cuentas activas: %s", e)
-            cuentas_activas = []
-        
+        cuentas_activas = respuestas["cuentas"]
 
         # Obtener tasas desde la tabla de configuración
-        tasas_resp = supabase.table("configuracion").select("clave, valor").in_("clave", ["tasa_banesco", "tasa_venezuela", "tasa_otros"]).execute()
+        tasas_resp = respuestas["tasas"]
         tasas_dict = {t["clave"]: t["valor"] for t in tasas_resp.data} if tasas_resp.data else {}
         tasa_banesco = tasas_dict.get("tasa_banesco", "0.000")
         tasa_venezuela = tasas_dict.get("tasa_venezuela", "0.000")
         tasa_otros = tasas_dict.get("tasa_otros", "0.000")
         # Verificar si el usuario es admin
-        is_admin = False
-        if "email" in session:
-            try:
-                response_admin = supabase.table("allowed_users").select("email").eq("email", session["email"]).execute()
-                is_admin = bool(response_admin.data)
-            except Exception as e:
-                logging.error("Error al verificar permisos de usuario: %s", e)
+        is_admin = obtener_permisos()["is_allowed"]
         
         # Obtener comisiones asociadas a los pedidos
         pedido_ids = [p["id"] for p in pedidos_data]
@@ -350,12 +357,16 @@ def nuevo():
                     logging.info(f"[PEDIDOS] Pedido creado para cliente especial: {cliente}")
                     logging.info(f"[PEDIDOS] CLP: {clp_calculado}, BRS: {brs_num}, Fecha: {fecha}")
                 
-                # Limpiar caché del dashboard
-                cache.clear()
+                # Actualizar libro diario de saldos del cliente
+                registrar_delta_saldo(cliente, fecha, clp=float(result.data[0].get("clp") or clp_calculado))
+                
+                # Invalidar solo el dashboard afectado por este cliente y fecha
+                invalidar_dashboard(cliente, fecha)
+                invalidar_pedidos_dia(fecha)
                 
                 # Log adicional para MaxiGiros Richard
                 if 'maxigiros' in cliente.lower() or 'richard' in cliente.lower():
-                    logging.info(f"[PEDIDOS] Caché limpiado para {cliente}")
+                    logging.info(f"[PEDIDOS] Caché invalidado para {cliente}")
                 if cuenta_id:
                     pedido_id = result.data[0]["id"]
                     descripcion = f"Pedido para cliente {cliente} - CLP: {clp_calculado:,.0f}"
@@ -472,9 +483,8 @@ def editar(pedido_id):
                 # Eliminar el movimiento PEDIDO anterior en la cuenta original
                 if cuenta_actual:
                     try:
-                        supabase.table("movimientos_cuenta").delete().eq("cuenta_id", cuenta_actual).eq("tipo_movimiento", "PEDIDO").eq("referencia_id", pedido_id).eq("referencia_tipo", "pedido").execute()
-                        # Eliminar comisión asociada si existe
-                        supabase.table("movimientos_cuenta").delete().eq("cuenta_id", cuenta_actual).eq("tipo_movimiento", "COMISION_PEDIDO").eq("referencia_id", pedido_id).eq("referencia_tipo", "pedido").execute()
+                        # Junto con la comisión asociada si existe; el saldo se ajusta en la misma transacción
+                        eliminar_movimientos(pedido_id, "pedido", cuenta_id=cuenta_actual)
                     except Exception as e:
                         logging.error(f"Error al eliminar movimiento PEDIDO/COMISION anterior: {e}")
                 # Crear el nuevo movimiento PEDIDO en la cuenta nueva
@@ -490,14 +500,14 @@ def editar(pedido_id):
             # Si no cambió la cuenta pero cambió el monto, eliminar y crear el movimiento en la misma cuenta
             elif cuenta_actual and int(pedido["brs"]) != nuevo_brs:
                 try:
-                    supabase.table("movimientos_cuenta").delete().eq("cuenta_id", cuenta_actual).eq("tipo_movimiento", "PEDIDO").eq("referencia_id", pedido_id).eq("referencia_tipo", "pedido").execute()
+                    eliminar_movimientos(pedido_id, "pedido", cuenta_id=cuenta_actual, tipo_movimiento="PEDIDO")
                 except Exception as e:
                     logging.error(f"Error al eliminar movimiento PEDIDO anterior (monto editado): {e}")
                 descripcion_pedido = f"PEDIDO editado para cliente {nuevo_cliente} (monto editado)"
                 registrar_movimiento_cuenta(cuenta_actual, "PEDIDO", nuevo_brs, pedido_id, "pedido", descripcion_pedido)
                 # Actualizar o eliminar/crear comisión
                 # Eliminar comisión anterior si existe
-                supabase.table("movimientos_cuenta").delete().eq("cuenta_id", cuenta_actual).eq("tipo_movimiento", "COMISION_PEDIDO").eq("referencia_id", pedido_id).eq("referencia_tipo", "pedido").execute()
+                eliminar_movimientos(pedido_id, "pedido", cuenta_id=cuenta_actual, tipo_movimiento="COMISION_PEDIDO")
                 if agregar_comision:
                     comision = round(nuevo_brs * 0.003)
                     if comision > 0:
@@ -506,7 +516,7 @@ def editar(pedido_id):
             # Si no cambió la cuenta ni el monto, solo actualizar o eliminar/crear comisión
             elif cuenta_actual:
                 # Eliminar comisión anterior si existe
-                supabase.table("movimientos_cuenta").delete().eq("cuenta_id", cuenta_actual).eq("tipo_movimiento", "COMISION_PEDIDO").eq("referencia_id", pedido_id).eq("referencia_tipo", "pedido").execute()
+                eliminar_movimientos(pedido_id, "pedido", cuenta_id=cuenta_actual, tipo_movimiento="COMISION_PEDIDO")
                 if agregar_comision:
                     comision = round(nuevo_brs * 0.003)
                     if comision > 0:
@@ -524,9 +534,18 @@ def editar(pedido_id):
                 pedido_update["cuenta_id"] = nuevo_cuenta_id
             else:
                 pedido_update["cuenta_id"] = None
-            supabase.table("pedidos").update(pedido_update).eq("id", pedido_id).execute()
-            # Limpiar caché del dashboard
-            cache.clear()
+            update_result = supabase.table("pedidos").update(pedido_update).eq("id", pedido_id).execute()
+            # Mover el pedido en el libro diario de saldos (revertir el anterior y aplicar el nuevo)
+            nuevo_clp = update_result.data[0].get("clp") if update_result.data else None
+            if nuevo_clp is None:
+                nuevo_clp = round(nuevo_brs / nuevo_tasa, 2)
+            mover_saldo({"cliente": pedido["cliente"], "fecha": pedido["fecha"], "clp": pedido["clp"]},
+                        {"cliente": nuevo_cliente, "fecha": nuevo_fecha, "clp": nuevo_clp})
+            # Invalidar el dashboard del cliente/fecha anterior y del nuevo
+            invalidar_dashboard(pedido["cliente"], pedido["fecha"])
+            invalidar_pedidos_dia(pedido["fecha"])
+            invalidar_dashboard(nuevo_cliente, nuevo_fecha)
+            invalidar_pedidos_dia(nuevo_fecha)
             # Registrar cambios en el log
             if cambios:
                 cambios_str = "; ".join(cambios)
@@ -581,27 +600,21 @@ def eliminar(pedido_id):
         usuario = session.get("email", "desconocido")
         ahora = adjust_datetime(datetime.now(chile_tz)).isoformat()
         # Obtener información del pedido antes de eliminarlo
-        pedido_response = supabase.table("pedidos").select("id, cliente, fecha, brs, tasa, clp, cuenta_id").eq("id", pedido_id).execute()
+        pedido_response = supabase.table("pedidos").select("id, cliente, fecha, brs, tasa, clp, cuenta_id, eliminado").eq("id", pedido_id).execute()
         if not pedido_response.data:
             flash("Pedido no encontrado.")
             return redirect(url_for("pedidos.index"))
         pedido = pedido_response.data[0]
         # Marcar como eliminado (borrado lógico)
         result = supabase.table("pedidos").update({"eliminado": True}).eq("id", pedido_id).execute()
-        # Limpiar caché del dashboard
-        cache.clear()
+        if not pedido.get("eliminado"):
+            registrar_delta_saldo(pedido["cliente"], pedido["fecha"], clp=-float(pedido["clp"] or 0))
+        # Invalidar solo el dashboard afectado por este pedido
+        invalidar_dashboard(pedido["cliente"], pedido["fecha"])
+        invalidar_pedidos_dia(pedido["fecha"])
         logging.info(f"Resultado del update en Supabase: {result}")
-        # Buscar y eliminar todos los movimientos asociados a este pedido
-        movimientos_resp = supabase.table("movimientos_cuenta").select("id, cuenta_id").eq("referencia_id", pedido_id).eq("referencia_tipo", "pedido").execute()
-        cuentas_afectadas = set()
-        if movimientos_resp.data:
-            for mov in movimientos_resp.data:
-                cuentas_afectadas.add(mov.get("cuenta_id"))
-                supabase.table("movimientos_cuenta").delete().eq("id", mov["id"]).execute()
-        # Actualizar saldo de todas las cuentas afectadas
-        for cuenta_id in cuentas_afectadas:
-            if cuenta_id:
-                actualizar_saldo_cuenta(cuenta_id)
+        # Eliminar todos los movimientos asociados a este pedido revirtiendo su efecto en cada cuenta
+        eliminar_movimientos(pedido_id, "pedido")
         # Registrar en historial
         supabase.table("pedidos_log").insert({
             "pedido_id": pedido_id,
@@ -839,22 +852,10 @@ def flujo_caja():
     Vista para mostrar el flujo de caja de todas las cuentas activas
     """
     try:
-        # Obtener todas las cuentas activas con su saldo
-        response = supabase.table("cuentas_activas").select("id, numero_cuenta, nombre_titular, saldo_actual").eq("activa", True).order("nombre_titular").execute()
-        cuentas = response.data if response.data else []
-        
-        # Obtener el último movimiento de cada cuenta
-        ultimos_movimientos = {}
-        try:
-            response_mov = supabase.table("movimientos_cuenta").select("cuenta_id, fecha").order("fecha", desc=True).execute()
-            for mov in response_mov.data if response_mov.data else []:
-                cid = mov["cuenta_id"]
-                if cid not in ultimos_movimientos:
-                    ultimos_movimientos[cid] = mov["fecha"]
-        except Exception as e:
-            logging.error(f"Error al obtener últimos movimientos por cuenta: {e}")
+        # Obtener todas las cuentas activas con su saldo y la fecha de su último movimiento
+        cuentas = cuentas_con_ultimo_movimiento()
         # Ordenar cuentas por fecha de último movimiento (más reciente primero)
-        cuentas.sort(key=lambda c: ultimos_movimientos.get(c["id"], ""), reverse=True)
+        cuentas.sort(key=lambda c: c.get("ultimo_movimiento") or "", reverse=True)
         
         # Obtener movimientos recientes (últimos 20)
         movimientos_recientes = []
@@ -993,19 +994,22 @@ def recalcular_saldos():
     Recalcula todos los saldos de las cuentas basado en sus movimientos
     """
     try:
-        # Obtener todas las cuentas activas
-        response = supabase.table("cuentas_activas").select("id").eq("activa", True).execute()
-        if not response.data:
+        # Todas las cuentas activas en un solo recálculo agrupado
+        saldos = recalcular_saldos_cuentas()
+        if not saldos:
             flash('No se encontraron cuentas activas.', 'warning')
             return redirect(url_for('pedidos.flujo_caja'))
         
-        cuentas_actualizadas = 0
-        for cuenta in response.data:
-            cuenta_id = cuenta["id"]
-            if actualizar_saldo_cuenta(cuenta_id):
-                cuentas_actualizadas += 1
+        cambios = [s for s in saldos if abs(s["saldo_despues"] - s["saldo_antes"]) >= 0.01]
+        for s in cambios:
+            logging.info(f"[SALDOS] Cuenta {s['cuenta_id']} ({s['nombre_titular']}): "
+                         f"{s['saldo_antes']:,.2f} -> {s['saldo_despues']:,.2f} BRS "
+                         f"(diferencia {s['saldo_despues'] - s['saldo_antes']:+,.2f})")
         
-        flash(f'Saldos recalculados correctamente para {cuentas_actualizadas} cuentas.', 'success')
+        flash(f'Saldos recalculados correctamente para {len(saldos)} cuentas.', 'success')
+        if cambios:
+            detalle = "; ".join(f"{s['nombre_titular']}: {s['saldo_antes']:,.2f} → {s['saldo_despues']:,.2f}" for s in cambios)
+            flash(f'{len(cambios)} cuentas cambiaron de saldo: {detalle}', 'info')
         
     except Exception as e:
         logging.error(f'Error al recalcular saldos: {e}')
@@ -1222,10 +1226,12 @@ def nuevos_multiples():
                 pedido_data['cuenta_id'] = cuenta_id
             result = supabase.table('pedidos').insert(pedido_data).execute()
             if result.data:
-                # Limpiar caché del dashboard
-                cache.clear()
+                # Invalidar solo el dashboard afectado por este cliente y fecha
+                invalidar_dashboard(cliente, fecha)
+                invalidar_pedidos_dia(fecha)
                 pedido_id = result.data[0]['id']
                 clp_calculado = round(brs_num / tasa_num, 2)
+                registrar_delta_saldo(cliente, fecha, clp=float(result.data[0].get('clp') or clp_calculado))
                 descripcion = f"Pedido múltiple para cliente {cliente} - CLP: {clp_calculado:,.0f}"
                 if cuenta_id:
                     registrar_movimiento_cuenta(cuenta_id, 'PEDIDO', brs_num, pedido_id, 'pedido', descripcion)
@@ -1280,21 +1286,16 @@ def registrar_movimiento_cuenta(cuenta_id, tipo_movimiento, monto_brs, referenci
         logging.info(f"Intentando insertar movimiento: {tipo_movimiento} - {monto_brs} BRS en cuenta {cuenta_id}")
         logging.info(f"Datos del movimiento: {movimiento_data}")
         
-        result = supabase.table("movimientos_cuenta").insert(movimiento_data).execute()
+        # Inserta el movimiento y suma su efecto al saldo de la cuenta en una sola transacción
+        movimiento = insertar_movimiento(movimiento_data)
         
-        logging.info(f"Resultado de la inserción: {result}")
-        logging.info(f"Result.data: {result.data}")
-        logging.info(f"Result.error: {getattr(result, 'error', 'No error')}")
+        logging.info(f"Resultado de la inserción: {movimiento}")
         
-        if result.data:
-            # Actualizar saldo de la cuenta
-            actualizar_saldo_cuenta(cuenta_id)
+        if movimiento:
             logging.info(f"Movimiento registrado exitosamente: {tipo_movimiento} - {monto_brs} BRS en cuenta {cuenta_id}")
             return True
         else:
-            logging.error(f"Error al insertar movimiento en la base de datos. Result: {result}")
-            if hasattr(result, 'error'):
-                logging.error(f"Error específico: {result.error}")
+            logging.error(f"Error al insertar movimiento en la base de datos. Movimiento: {movimiento_data}")
             return False
             
     except Exception as e:
@@ -1305,38 +1306,16 @@ def registrar_movimiento_cuenta(cuenta_id, tipo_movimiento, monto_brs, referenci
 
 def actualizar_saldo_cuenta(cuenta_id):
     """
-    Actualiza el saldo actual de una cuenta basado en sus movimientos
+    Recalcula el saldo actual de una cuenta desde todo su historial de movimientos.
+    Los movimientos nuevos ya ajustan el saldo al registrarse (ver saldos_cuentas.py);
+    este recálculo completo corrige una deriva.
     Args:
         cuenta_id: ID de la cuenta
     Returns:
         bool: True si se actualizó correctamente
     """
     try:
-        # Calcular saldo sumando compras, restando pedidos y comisiones, sumando ajustes y ajustes manuales
-        response = supabase.table("movimientos_cuenta").select("tipo_movimiento, monto_brs").eq("cuenta_id", cuenta_id).execute()
-        if not response.data:
-            saldo = 0
-        else:
-            saldo = 0
-            for movimiento in response.data:
-                if movimiento["tipo_movimiento"] == "COMPRA":
-                    saldo += movimiento["monto_brs"]
-                elif movimiento["tipo_movimiento"] == "PEDIDO":
-                    saldo -= movimiento["monto_brs"]
-                elif movimiento["tipo_movimiento"] == "COMISION_PEDIDO":
-                    saldo -= movimiento["monto_brs"]
-                elif movimiento["tipo_movimiento"] == "COMISION_TRANS":
-                    saldo -= movimiento["monto_brs"]
-                elif movimiento["tipo_movimiento"] == "AJUSTE":
-                    saldo += movimiento["monto_brs"]
-                elif movimiento["tipo_movimiento"] == "AJUSTE_MANUAL":
-                    saldo += movimiento["monto_brs"]
-                elif movimiento["tipo_movimiento"] == "TRANS_SALIDA":
-                    saldo -= movimiento["monto_brs"]
-                elif movimiento["tipo_movimiento"] == "TRANS_ENTRADA":
-                    saldo += movimiento["monto_brs"]
-        # Actualizar saldo en la tabla cuentas_activas
-        supabase.table("cuentas_activas").update({"saldo_actual": saldo}).eq("id", cuenta_id).execute()
+        saldo = recalcular_saldo(cuenta_id)
         logging.info(f"Saldo actualizado para cuenta {cuenta_id}: {saldo} BRS")
         return True
     except Exception as e:
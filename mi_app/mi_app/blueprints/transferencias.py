@@ -9,6 +9,12 @@ from flask import Blueprint, render_template, request, redirect, url_for, sessio
 from supabase import create_client, Client
 import pytz
 from mi_app.mi_app.extensions import chile_tz
+from mi_app.mi_app import cache_etiquetas
+from mi_app.mi_app.saldos_clientes import registrar_delta_saldo, fecha_de_registro
+from mi_app.mi_app.ingesta_worker import encolar_archivo, estado_trabajo
+from mi_app.mi_app.resumen_dashboard import invalidar_dashboard
+from mi_app.ingesta_transferencias import detectar_banco
+from mi_app.resolutor_ruts import obtener_resolutor
 
 # Configuración de zona horaria
 chile_tz = pytz.timezone('America/Santiago')
@@ -50,6 +56,165 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def asignar_clientes_por_rut(transferencias):
+    """
+    Completa el cliente de las transferencias sin cliente según el RUT del pagador
+    (índice en memoria) y lo guarda con un update por cliente.
+    Args:
+        transferencias: Lista de dicts con 'id', 'rut' y 'cliente' (se modifican en el lugar)
+    Returns:
+        int: Cantidad de transferencias asignadas
+    """
+    sin_cliente = [t for t in transferencias if not t.get('cliente')]
+    if not sin_cliente or not obtener_resolutor(supabase).asignar_clientes(sin_cliente):
+        return 0
+    ids_por_cliente = {}
+    for t in sin_cliente:
+        if t.get('cliente'):
+            ids_por_cliente.setdefault(t['cliente'], []).append(t['id'])
+    for cliente, ids in ids_por_cliente.items():
+        try:
+            # Solo las que siguen sin cliente: no se pisa una asignación manual
+            supabase.table("transferencias").update({"cliente": cliente}).in_("id", ids).is_("cliente", "null").execute()
+        except Exception as e:
+            logging.error(f"[RUTS] Error al guardar el cliente {cliente} en transferencias: {e}")
+    asignadas = sum(len(ids) for ids in ids_por_cliente.values())
+    logging.info(f"[RUTS] {asignadas} transferencias asignadas por RUT a {len(ids_por_cliente)} clientes")
+    return asignadas
+
+# -----------------------------------------------------------------------------
+# Listado de transferencias: filtros, cursor (fecha_detec, id) y conteo cacheado
+# Sin orden elegido por el usuario, las páginas se leen desde la última fila
+# mostrada (keyset) en lugar de saltar offset filas; el total se cuenta una vez
+# por combinación de filtros y se reutiliza entre páginas (las cargas de
+# cartolas del worker de ingesta lo descartan al terminar; las del monitor
+# externo se reflejan al vencer CONTEO_TIMEOUT).
+# -----------------------------------------------------------------------------
+POR_PAGINA = 150
+CONTEO_PREFIJO = "transferencias:conteo"
+CONTEO_TIMEOUT = 120  # segundos
+EMPRESAS_CACHE_KEY = "transferencias:empresas"
+EMPRESAS_TIMEOUT = 600  # segundos
+
+def filtros_index(args):
+    """Lee los filtros del listado desde los parámetros de la URL"""
+    monto = args.get("monto", "").replace(".", "").strip()
+    try:
+        monto = int(monto) if monto else None
+    except ValueError:
+        logging.warning("Valor de monto no válido: %s", monto)
+        monto = None
+    verificada = args.get("verificada")
+    return {
+        "cliente": args.get("cliente") or None,
+        "rut": args.get("rut") or None,
+        "monto": monto,
+        "verificada": verificada if verificada in ("true", "false") else None,
+        "empresas": sorted(emp for emp in args.getlist("empresa") if emp.strip())
+    }
+
+def aplicar_filtros(query, filtros):
+    """Aplica los filtros del listado a una consulta de transferencias"""
+    if filtros["cliente"] == "Desconocido":
+        query = query.is_("cliente", "null")
+    elif filtros["cliente"]:
+        query = query.eq("cliente", filtros["cliente"])
+    if filtros["rut"]:
+        query = query.ilike("rut", f"%{filtros['rut']}%")
+    if filtros["monto"] is not None:
+        query = query.eq("monto", filtros["monto"])
+    if filtros["verificada"] is not None:
+        query = query.eq("verificada", filtros["verificada"] == "true")
+    if filtros["empresas"]:
+        query = query.in_("empresa", filtros["empresas"])
+    return query
+
+def contar_transferencias(filtros, fecha_limite):
+    """Total de transferencias con los filtros (count exacto cacheado por filtros y fecha límite)"""
+    firma = hashlib.md5(repr((fecha_limite, sorted(filtros.items()))).encode("utf-8")).hexdigest()
+
+    def _contar():
+        resp = aplicar_filtros(
+            supabase.table("transferencias").select("id", count="exact").gte("fecha", fecha_limite).limit(1),
+            filtros
+        ).execute()
+        return resp.count or 0
+
+    return cache_etiquetas.obtener_o_calcular(f"{CONTEO_PREFIJO}:{firma}", _contar, CONTEO_TIMEOUT, gracia=0)
+
+def invalidar_conteos():
+    """Descarta los totales cacheados (nueva transferencia o cliente asignado)"""
+    cache_etiquetas.invalidar(prefijo=CONTEO_PREFIJO)
+
+def empresas_catalogo():
+    """Empresas distintas de transferencias (función empresas_transferencias, cacheada EMPRESAS_TIMEOUT)"""
+    def _consultar():
+        try:
+            resp = supabase.rpc("empresas_transferencias").execute()
+            return sorted(e["empresa"] for e in (resp.data or []) if e.get("empresa"))
+        except Exception as e:
+            # Sin la función en la base: empresas de las transferencias más recientes
+            logging.error(f"[FILTRO] Error al consultar empresas_transferencias, se usan las recientes: {e}")
+            resp = supabase.table("transferencias").select("empresa").order("fecha", desc=True).limit(1000).execute()
+            return sorted(set(e["empresa"] for e in (resp.data or []) if e["empresa"] is not None))
+
+    try:
+        return cache_etiquetas.obtener_o_calcular(EMPRESAS_CACHE_KEY, _consultar, EMPRESAS_TIMEOUT)
+    except Exception as e:
+        logging.error(f"[FILTRO] Error al obtener el catálogo de empresas: {e}")
+        return []
+
+def registrar_empresa(empresa):
+    """Descarta el catálogo si se ingresó una empresa que no estaba en él"""
+    if empresa and empresa not in empresas_catalogo():
+        cache_etiquetas.invalidar(prefijo=EMPRESAS_CACHE_KEY)
+
+def invalidar_tras_ingesta():
+    """Descarta totales y catálogo de empresas después de una carga de cartola con filas nuevas"""
+    invalidar_conteos()
+    cache_etiquetas.invalidar(prefijo=EMPRESAS_CACHE_KEY)
+
+def ids_con_pago(ids):
+    """Devuelve cuáles de las transferencias dadas ya tienen un pago asignado"""
+    if not ids:
+        return set()
+    resp = supabase.table('transferencias_pagos').select('transferencia_id').in_('transferencia_id', ids).execute()
+    return {item['transferencia_id'] for item in (resp.data or [])}
+
+def cursor_de(transferencia):
+    """
+    Cursor 'fecha_detec|id' de una fila. Las filas sin fecha_detec no tienen cursor:
+    la página vecina se pide por offset (el orden descendente las deja primero).
+    """
+    if transferencia.get('fecha_detec') is None:
+        return None
+    return f"{transferencia['fecha_detec']}|{transferencia['id']}"
+
+def leer_cursor(valor):
+    """Convierte 'fecha_detec|id' en (fecha_detec, id); None si no es válido"""
+    if not valor or "|" not in valor:
+        return None
+    fecha_detec, _, id_transferencia = valor.rpartition("|")
+    if fecha_detec in ("", "None"):
+        return None
+    try:
+        return fecha_detec, int(id_transferencia)
+    except ValueError:
+        return None
+
+def condicion_cursor(cursor, operador):
+    """
+    Filtro PostgREST para las filas antes ('lt') o después ('gt') del cursor en orden (fecha_detec, id).
+    Las filas sin fecha_detec van antes que todas en el listado (DESC deja los nulos primero),
+    así que quedan después del cursor al leer hacia atrás.
+    """
+    fecha_detec, id_transferencia = cursor
+    condicion = (f'fecha_detec.{operador}."{fecha_detec}",'
+                 f'and(fecha_detec.eq."{fecha_detec}",id.{operador}.{id_transferencia})')
+    if operador == "gt":
+        condicion += ',fecha_detec.is.null'
+    return condicion
+
 # Crear blueprint
 transferencias_bp = Blueprint("transferencias", __name__)
 
@@ -61,131 +226,79 @@ def index():
         fecha_limite = adjust_datetime(datetime.now(chile_tz) - timedelta(days=15)).strftime("%Y-%m-%d")
         
         # Obtener parámetros de paginación
-        page = request.args.get('page', 1, type=int)
-        per_page = 150
-        offset = (page - 1) * per_page
-        
-        # Iniciar la consulta base con filtro de fecha
-        query = supabase.table("transferencias").select(
-            "id, cliente, empresa, rut, monto, fecha, fecha_detec, verificada, manual"
-        ).gte("fecha", fecha_limite)  # Solo últimos 15 días
-
-        # Aplicar filtros
-        cliente = request.args.get("cliente")
-        if cliente:
-            if cliente == "Desconocido":
-                query = query.is_("cliente", "null")
-            else:
-                query = query.eq("cliente", cliente)
-
-        rut = request.args.get("rut")
-        if rut:
-            query = query.ilike("rut", f"%{rut}%")
-
-        monto = request.args.get("monto", "").replace(".", "").strip()
-        if monto:
-            try:
-                query = query.eq("monto", int(monto))
-            except ValueError:
-                logging.warning("Valor de monto no válido: %s", monto)
-
-        verificada = request.args.get("verificada")
-        if verificada == "true":
-            query = query.eq("verificada", True)
-        elif verificada == "false":
-            query = query.eq("verificada", False)
-
-        empresas_filtro = request.args.getlist("empresa")
-        logging.info(f"[FILTRO] Empresas seleccionadas en el filtro: {empresas_filtro}")
-
-        # Obtener lista única de empresas de las 1000 transferencias más recientes para el select
-        response_empresas = supabase.table("transferencias").select("empresa").order("fecha", desc=True).limit(1000).execute()
-        empresas_select = sorted(set(e["empresa"] for e in response_empresas.data if e["empresa"] is not None)) if response_empresas.data else []
-        empresas_select = ["Todas"] + empresas_select  # Agregar opción "Todas" al inicio
-
-        # Obtener lista única de empresas de la tabla transferencias (para log)
-        response_empresas_log = supabase.table("transferencias").select("empresa").execute()
-        empresas_db = sorted(set(e["empresa"] for e in response_empresas_log.data if e["empresa"] is not None)) if response_empresas_log.data else []
-        logging.info(f"[FILTRO] Empresas únicas en la base de datos: {empresas_db}")
-
-        # Aplicar filtro de empresas a la consulta principal
-        if empresas_filtro and not (len(empresas_filtro) == 1 and empresas_filtro[0] == ""):
-            empresas_filtradas = [emp for emp in empresas_filtro if emp.strip()]
-            logging.info(f"[FILTRO] Empresas que se usarán para filtrar: {empresas_filtradas}")
-            if empresas_filtradas:
-                query = query.in_("empresa", empresas_filtradas)
-        else:
-            logging.info("[FILTRO] No se aplica filtro de empresas (opción 'Todas' seleccionada)")
-
-        # Aplicar ordenamiento
-        sort_fields = []
-        for i in range(1, 4):  # Para sort1, sort2, sort3
-            sort = request.args.get(f"sort{i}")
-            order = request.args.get(f"order{i}", "asc")
-            if sort:
-                query = query.order(sort, desc=(order == "desc"))
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = POR_PAGINA
+        filtros = filtros_index(request.args)
 
-        # Si no hay ordenamiento específico, ordenar por fecha_detec descendente
-        if not any(request.args.get(f"sort{i}") for i in range(1, 4)):
-            query = query.order("fecha_detec", desc=True)
+        # Catálogo de empresas para el select (cacheado, sin recorrer la tabla)
+        empresas_select = ["Todas"] + empresas_catalogo()  # Agregar opción "Todas" al inicio
+        logging.info(f"[FILTRO] Empresas que se usarán para filtrar: {filtros['empresas'] or 'Todas'}")
 
-        # Aplicar paginación
-        query = query.range(offset, offset + per_page - 1)
+        # Total de registros: cacheado por combinación de filtros
+        total_records = contar_transferencias(filtros, fecha_limite)
+        total_pages = (total_records + per_page - 1) // per_page
 
-        # Ejecutar la consulta
-        response_transfers = query.execute()
+        # Iniciar la consulta base con filtro de fecha (solo últimos 15 días)
+        query = aplicar_filtros(
+            supabase.table("transferencias").select(
+                "id, cliente, empresa, rut, monto, fecha, fecha_detec, verificada, manual"
+            ).gte("fecha", fecha_limite),
+            filtros
+        )
 
-        # Obtener el total de registros para la paginación
-        count_query = supabase.table("transferencias").select("id", count="exact").gte("fecha", fecha_limite)
-        
-        # Aplicar los mismos filtros al count query
-        if cliente:
-            if cliente == "Desconocido":
-                count_query = count_query.is_("cliente", "null")
+        # Ordenamiento elegido por el usuario: paginación por offset como antes
+        orden_usuario = [(request.args.get(f"sort{i}"), request.args.get(f"order{i}", "asc")) for i in range(1, 4)]
+        orden_usuario = [(campo, orden) for campo, orden in orden_usuario if campo]
+        despues = leer_cursor(request.args.get("despues"))
+        antes = leer_cursor(request.args.get("antes"))
+        ultima = request.args.get("ultima") == "1" and total_pages > 0
+
+        cursor_anterior = cursor_siguiente = None
+        if orden_usuario or (page > 1 and not (despues or antes or ultima)):
+            for campo, orden in orden_usuario:
+                query = query.order(campo, desc=(orden == "desc"))
+            if not orden_usuario:
+                query = query.order("fecha_detec", desc=True).order("id", desc=True)
+            offset = (page - 1) * per_page
+            filas = query.range(offset, offset + per_page - 1).execute().data or []
+            has_prev, has_next = page > 1, page < total_pages
+        elif antes:
+            # Página anterior: se lee hacia atrás desde la primera fila mostrada
+            filas = (query.or_(condicion_cursor(antes, "gt"))
+                     .order("fecha_detec").order("id").limit(per_page + 1).execute().data or [])
+            has_prev, has_next = len(filas) > per_page, True
+            filas = list(reversed(filas[:per_page]))
+        elif ultima:
+            # Última página: las filas más antiguas que sobran de las páginas completas
+            page = total_pages
+            restantes = total_records - (total_pages - 1) * per_page
+            filas = query.order("fecha_detec").order("id").limit(restantes).execute().data or []
+            has_prev, has_next = page > 1, False
+            filas = list(reversed(filas))
+        else:
+            # Primera página o siguiente desde la última fila mostrada: mismo costo en cualquier página
+            if despues:
+                query = query.or_(condicion_cursor(despues, "lt"))
             else:
-                count_query = count_query.eq("cliente", cliente)
-        
-        if rut:
-            count_query = count_query.ilike("rut", f"%{rut}%")
-        
-        if monto:
-            try:
-                count_query = count_query.eq("monto", int(monto))
-            except ValueError:
-                pass
-        
-        if verificada == "true":
-            count_query = count_query.eq("verificada", True)
-        elif verificada == "false":
-            count_query = count_query.eq("verificada", False)
-        
-        # Filtro de empresas para el count_query (igual que arriba)
-        if empresas_filtro and not (len(empresas_filtro) == 1 and empresas_filtro[0] == ""):
-            empresas_filtradas = [emp for emp in empresas_filtro if emp.strip()]
-            if empresas_filtradas:
-                count_query = count_query.in_("empresa", empresas_filtradas)
-        
-        count_response = count_query.execute()
-        total_records = count_response.count if hasattr(count_response, 'count') else 0
-        total_pages = (total_records + per_page - 1) // per_page
+                page = 1
+            filas = query.order("fecha_detec", desc=True).order("id", desc=True).limit(per_page + 1).execute().data or []
+            has_prev, has_next = despues is not None, len(filas) > per_page
+            filas = filas[:per_page]
+        if not orden_usuario and filas:
+            cursor_anterior = cursor_de(filas[0]) if has_prev else None
+            cursor_siguiente = cursor_de(filas[-1]) if has_next else None
+
+        # Las que llegaron sin cliente se resuelven por RUT antes de mostrarlas
+        if filas and asignar_clientes_por_rut(filas):
+            invalidar_conteos()
 
-        # Obtener todos los IDs de transferencias asignadas de una sola vez (sin límite)
-        ids_asignadas = set()
-        offset = 0
-        limit = 1000
-        while True:
-            asignadas_resp = supabase.table('transferencias_pagos').select('transferencia_id').range(offset, offset + limit - 1).execute()
-            if not asignadas_resp.data:
-                break
-            ids_asignadas.update({item['transferencia_id'] for item in asignadas_resp.data})
-            if len(asignadas_resp.data) < limit:
-                break
-            offset += limit
+        # Solo las asignaciones de las transferencias de esta página (una consulta por índice)
+        ids_asignadas = ids_con_pago([t['id'] for t in filas])
 
         transfers_data = []
         clientes_en_transferencias = set()
-        if response_transfers.data:
-            for transfer in response_transfers.data:
+        if filas:
+            for transfer in filas:
                 transfer_processed = {
                     'id': transfer.get('id'),
                     'cliente': transfer.get('cliente') if transfer.get('cliente') is not None else 'Desconocido',
@@ -219,10 +332,12 @@ def index():
                 'per_page': per_page,
                 'total_pages': total_pages,
                 'total_records': total_records,
-                'has_prev': page > 1,
-                'has_next': page < total_pages,
-                'prev_page': page - 1 if page > 1 else None,
-                'next_page': page + 1 if page < total_pages else None
+                'has_prev': has_prev,
+                'has_next': has_next,
+                'prev_page': page - 1 if has_prev else None,
+                'next_page': page + 1 if has_next else None,
+                'cursor_anterior': cursor_anterior,
+                'cursor_siguiente': cursor_siguiente
             }
         )
     except Exception as e:
@@ -236,13 +351,15 @@ def index():
             active_page="transferencias",
             pagination={
                 'page': 1,
-                'per_page': 150,
+                'per_page': POR_PAGINA,
                 'total_pages': 0,
                 'total_records': 0,
                 'has_prev': False,
                 'has_next': False,
                 'prev_page': None,
-                'next_page': None
+                'next_page': None,
+                'cursor_anterior': None,
+                'cursor_siguiente': None
             }
         )
 
@@ -271,6 +388,8 @@ def nuevo():
                 "hash": hash_value,
                 "manual": True
             }).execute()
+            registrar_empresa(empresa)
+            invalidar_conteos()
             flash("Transferencia ingresada con éxito.")
             return redirect(url_for("transferencias.nuevo"))
         except Exception as e:
@@ -323,6 +442,8 @@ def editar_transferencia(transfer_id):
                 "verificada": verificada,
                 "hash": hash_value
             }).eq("id", transfer_id).execute()
+            registrar_empresa(empresa)
+            invalidar_conteos()
             flash("Transferencia actualizada con éxito.")
             return redirect(url_for("transferencias.index"))
         except Exception as e:
@@ -404,6 +525,7 @@ def asignar_pago():
         if nuevo_pago.data:
             pago_id = nuevo_pago.data[0]['id']
             logging.info(f"[ASIGNAR_PAGO] Pago creado exitosamente - ID: {pago_id}")
+            registrar_delta_saldo(cliente, fecha_de_registro(fecha_hora), pagos=float(monto or 0))
         else:
             logging.error("[ASIGNAR_PAGO] Error al crear el pago")
             return jsonify({'success': False, 'message': 'Error al crear el pago.'}), 500
@@ -433,14 +555,10 @@ def asignar_pago():
             logging.info(f"[DIAGNÓSTICO] Pago asignado para cliente especial: {cliente}")
             logging.info(f"[DIAGNÓSTICO] Monto: {monto}, Fecha: {fecha_hora}")
             logging.info(f"[DIAGNÓSTICO] Pago ID: {pago_id}")
-            
-            # Limpiar caché específicamente para este cliente
-            try:
-                from mi_app.mi_app.blueprints.dashboard import cache
-                cache.clear()
-                logging.info(f"[DIAGNÓSTICO] Caché limpiado para {cliente}")
-            except Exception as cache_error:
-                logging.error(f"[DIAGNÓSTICO] Error al limpiar caché: {cache_error}")
+
+        # Invalidar solo el dashboard afectado por este cliente y fecha
+        invalidar_dashboard(cliente, fecha_de_registro(fecha_hora))
+        invalidar_conteos()
 
         logging.info(f"[ASIGNAR_PAGO] Asignación completada exitosamente para transferencia {transferencia_id}")
         return jsonify({'success': True, 'message': 'Pago asignado correctamente.'})
@@ -540,76 +658,6 @@ def verificar_dashboard_cliente(cliente):
             "error": str(e)
         }), 500
 
-def procesar_archivo_inmediato(ruta_archivo, nombre_original):
-    """
-    Procesa un archivo inmediatamente después de subirlo
-    """
-    try:
-        import shutil
-        import subprocess
-        import os
-        
-        # Directorio base del proyecto
-        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-        
-        # Ya no necesitamos carpetas de destino, procesamos directamente desde uploads
-        
-        # Obtener ruta del Python del entorno virtual
-        # Usar la misma ruta que el monitor para consistencia
-        venv_python = '/home/sacristobalspa/webfinal/venv/bin/python'
-        if not os.path.exists(venv_python):
-            # Fallback para desarrollo local
-            venv_python = os.path.join(base_dir, 'venv', 'bin', 'python3')
-        if not os.path.exists(venv_python):
-            # Fallback para Windows
-            venv_python = os.path.join(base_dir, 'venv', 'Scripts', 'python.exe')
-        if not os.path.exists(venv_python):
-            # Fallback al Python del sistema
-            venv_python = 'python3'
-            
-        logging.info(f"Usando Python: {venv_python}")
-        
-        # Palabras clave
-        bci_keyword = 'Movimientos_Detallado_Cuenta'
-        santander_keyword = 'CartolaMovimiento-'
-        
-        if bci_keyword in nombre_original:
-            logging.info(f"Procesando archivo BCI: {nombre_original}")
-            
-            # Ejecutar script BCI directamente (sin copiar archivo)
-            try:
-                subprocess.run([venv_python, 'bci.py'], cwd=base_dir, check=True, timeout=300)
-                logging.info("Script bci.py ejecutado exitosamente")
-                return True, "Archivo BCI procesado exitosamente"
-            except subprocess.TimeoutExpired:
-                logging.error("Script bci.py excedió el tiempo límite")
-                return False, "Script BCI excedió el tiempo límite"
-            except subprocess.CalledProcessError as e:
-                logging.error(f"Error ejecutando bci.py: {e}")
-                return False, f"Error ejecutando script BCI: {e}"
-                
-        elif santander_keyword in nombre_original:
-            logging.info(f"Procesando archivo Santander: {nombre_original}")
-            
-            # Ejecutar script Santander directamente (sin copiar archivo)
-            try:
-                subprocess.run([venv_python, 'Santander.py'], cwd=base_dir, check=True, timeout=300)
-                logging.info("Script Santander.py ejecutado exitosamente")
-                return True, "Archivo Santander procesado exitosamente"
-            except subprocess.TimeoutExpired:
-                logging.error("Script Santander.py excedió el tiempo límite")
-                return False, "Script Santander excedió el tiempo límite"
-            except subprocess.CalledProcessError as e:
-                logging.error(f"Error ejecutando Santander.py: {e}")
-                return False, f"Error ejecutando script Santander: {e}"
-        else:
-            logging.warning(f"Archivo no reconocido: {nombre_original}")
-            return False, "Archivo no reconocido (no es BCI ni Santander)"
-            
-    except Exception as e:
-        logging.error(f"Error procesando archivo {nombre_original}: {e}")
-        return False, f"Error procesando archivo: {str(e)}"
-
 @transferencias_bp.route('/subir_archivo', methods=['POST'])
 @login_required
 def subir_archivo():
@@ -673,44 +721,46 @@ def subir_archivo():
         
         archivo_id = registro_archivo.data[0]['id'] if registro_archivo.data else None
         
-        # Procesar el archivo inmediatamente
-        exito, mensaje = procesar_archivo_inmediato(file_path, nombre_original)
-        
         # Detectar tipo de banco basado en el nombre del archivo
-        tipo_banco = "No reconocido"
-        if "Movimientos_Detallado_Cuenta" in nombre_original:
-            tipo_banco = "BCI"
-        elif "CartolaMovimiento-" in nombre_original:
-            tipo_banco = "Santander"
-        
-        # Actualizar registro con el resultado del procesamiento
-        if archivo_id:
-            estado = 'procesado' if exito else 'error'
-            supabase.table('archivos_subidos').update({
-                'estado': estado,
-                'mensaje_error': mensaje
-            }).eq('id', archivo_id).execute()
-        
-        if exito:
-            return jsonify({
-                'success': True,
-                'message': f'Archivo {tipo_banco} subido y procesado exitosamente.',
-                'archivo_guardado': nombre_archivo,
-                'tipo_banco': tipo_banco
-            })
-        else:
+        tipo_banco = detectar_banco(nombre_original)
+        if tipo_banco is None:
+            mensaje = "Archivo no reconocido (no es BCI ni Santander)"
+            if archivo_id:
+                supabase.table('archivos_subidos').update({
+                    'estado': 'error',
+                    'mensaje_error': mensaje
+                }).eq('id', archivo_id).execute()
             return jsonify({
                 'success': False,
                 'message': f'Archivo subido pero error en procesamiento: {mensaje}',
                 'archivo_guardado': nombre_archivo,
-                'tipo_banco': tipo_banco
+                'tipo_banco': "No reconocido"
             }), 400
+
+        # Encolar el archivo en el worker de ingesta (se procesa en segundo plano)
+        job_id = encolar_archivo(file_path, nombre_original, archivo_id)
+
+        return jsonify({
+            'success': True,
+            'message': f'Archivo {tipo_banco} subido. Procesando en segundo plano...',
+            'archivo_guardado': nombre_archivo,
+            'tipo_banco': tipo_banco,
+            'job_id': job_id
+        }), 202
             
     except Exception as e:
         import traceback
         logging.error(f"Error al procesar archivo: {e}\n{traceback.format_exc()}")
         return jsonify({'success': False, 'message': f'Error inesperado: {str(e)}', 'traceback': traceback.format_exc()}), 500
 
+@transferencias_bp.route('/estado_archivo/<job_id>')
+@login_required
+def estado_archivo(job_id):
+    trabajo = estado_trabajo(job_id)
+    if trabajo is None:
+        return jsonify({'success': False, 'message': 'Trabajo no encontrado.'}), 404
+    return jsonify({'success': True, **trabajo})
+
 @transferencias_bp.route('/historial_archivos')
 @login_required
 def historial_archivos():
@@ -0,0 +1,316 @@
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from flask_caching.backends.base import BaseCache
+
+try:
+    import fcntl
+except ImportError:  # Windows: los bloqueos quedan limitados al proceso
+    fcntl = None
+
+# -----------------------------------------------------------------------------
+# Cache compartido entre los workers de gunicorn
+# CACHE_BACKEND elige el backend sin servicios externos:
+#   filesystem (por defecto) -> FileSystemCache en CACHE_DIR
+#   sqlite                   -> SQLiteCache en CACHE_SQLITE_PATH
+#   simple                   -> SimpleCache (memoria de cada proceso)
+# Si se define CACHE_TYPE (por ejemplo RedisCache) se usa tal cual.
+# Los bloqueos de bloqueo() son archivos en CACHE_LOCK_DIR (mismo servidor).
+# -----------------------------------------------------------------------------
+
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'webfinal_cache'))
+CACHE_SQLITE_PATH = os.getenv('CACHE_SQLITE_PATH', os.path.join(tempfile.gettempdir(), 'webfinal_cache.sqlite3'))
+CACHE_LOCK_DIR = os.getenv('CACHE_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'webfinal_cache_locks'))
+# Estado que el cache no puede purgar (índice de etiquetas, versiones): junto a CACHE_DIR
+CACHE_ESTADO_DIR = os.getenv('CACHE_ESTADO_DIR', CACHE_DIR.rstrip(os.sep) + '_estado')
+CACHE_ESTADO_PATH = os.path.join(CACHE_ESTADO_DIR, 'estado.sqlite3')
+# Marcas de actualización: las leen la web y los procesos aparte (binance_updater_always)
+CACHE_MARCAS_DIR = os.path.join(CACHE_ESTADO_DIR, 'marcas')
+# Sin CACHE_DIR / CACHE_ESTADO_DIR cada proceso usa su propio directorio temporal
+ESTADO_CONFIGURADO = bool(os.getenv('CACHE_ESTADO_DIR') or os.getenv('CACHE_DIR'))
+
+# Escrituras entre purgas de filas vencidas en SQLiteCache
+PURGAR_CADA = 200
+
+def configuracion_cache():
+    """
+    Devuelve la configuración de Flask-Caching según CACHE_BACKEND / CACHE_TYPE.
+    Returns:
+        dict: Configuración para cache.init_app
+    """
+    config = {
+        "CACHE_DEFAULT_TIMEOUT": int(os.getenv('CACHE_DEFAULT_TIMEOUT', 300)),
+        # delete_many no se detiene en la primera clave inexistente
+        "CACHE_IGNORE_ERRORS": True
+    }
+    if os.getenv('CACHE_TYPE'):
+        config["CACHE_TYPE"] = os.getenv('CACHE_TYPE')
+        return config
+
+    backend = os.getenv('CACHE_BACKEND', 'filesystem').lower()
+    if backend == 'sqlite':
+        config["CACHE_TYPE"] = "mi_app.mi_app.cache_compartido.SQLiteCache"
+        config["CACHE_SQLITE_PATH"] = CACHE_SQLITE_PATH
+    elif backend == 'simple':
+        config["CACHE_TYPE"] = "SimpleCache"
+    else:
+        config["CACHE_TYPE"] = "FileSystemCache"
+        config["CACHE_DIR"] = CACHE_DIR
+        config["CACHE_THRESHOLD"] = int(os.getenv('CACHE_THRESHOLD', 2000))
+    return config
+
+class SQLiteCache(BaseCache):
+    """
+    Backend de Flask-Caching en un archivo SQLite, compartido por todos los
+    procesos del servidor. Los valores se guardan con pickle.
+    """
+
+    def __init__(self, path, default_timeout=300):
+        super().__init__(default_timeout=default_timeout)
+        self.path = path
+        self.ignore_errors = True
+        self._escrituras = 0
+        directorio = os.path.dirname(path)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with self._conexion() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "clave TEXT PRIMARY KEY, valor BLOB NOT NULL, expira REAL NOT NULL)"
+            )
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        return cls(config.get("CACHE_SQLITE_PATH", CACHE_SQLITE_PATH), default_timeout=config["CACHE_DEFAULT_TIMEOUT"])
+
+    @contextmanager
+    def _conexion(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _expira(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout else float("inf")
+
+    def get(self, key):
+        with self._conexion() as conn:
+            fila = conn.execute("SELECT valor, expira FROM cache WHERE clave = ?", (key,)).fetchone()
+        if fila is None or fila[1] <= time.time():
+            return None
+        try:
+            return pickle.loads(fila[0])
+        except Exception:
+            return None
+
+    def set(self, key, value, timeout=None):
+        # Purga periódica de filas vencidas
+        self._escrituras += 1
+        if self._escrituras % PURGAR_CADA == 0:
+            self.purgar_expirados()
+        with self._conexion() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (clave, valor, expira) VALUES (?, ?, ?)",
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expira(timeout))
+            )
+        return True
+
+    def add(self, key, value, timeout=None):
+        with self._conexion() as conn:
+            conn.execute("DELETE FROM cache WHERE clave = ? AND expira <= ?", (key, time.time()))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO cache (clave, valor, expira) VALUES (?, ?, ?)",
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expira(timeout))
+            )
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        with self._conexion() as conn:
+            cursor = conn.execute("DELETE FROM cache WHERE clave = ?", (key,))
+        return cursor.rowcount == 1
+
+    def has(self, key):
+        with self._conexion() as conn:
+            fila = conn.execute("SELECT 1 FROM cache WHERE clave = ? AND expira > ?", (key, time.time())).fetchone()
+        return fila is not None
+
+    def clear(self):
+        with self._conexion() as conn:
+            conn.execute("DELETE FROM cache")
+        return True
+
+    def purgar_expirados(self):
+        """Elimina las filas vencidas (las lecturas ya las ignoran)"""
+        with self._conexion() as conn:
+            cursor = conn.execute("DELETE FROM cache WHERE expira <= ?", (time.time(),))
+        return cursor.rowcount
+
+# -----------------------------------------------------------------------------
+# Estado compartido persistente
+# Datos de coordinación entre procesos que no pueden desaparecer cuando el
+# cache se llena (FileSystemCache borra primero las entradas con timeout=0):
+# un archivo SQLite en CACHE_ESTADO_DIR, separado del backend del cache.
+# -----------------------------------------------------------------------------
+_estado_creado = False
+
+@contextmanager
+def estado_compartido(escritura=False):
+    """
+    Conexión al archivo de estado compartido.
+    Args:
+        escritura: Si es True abre una transacción exclusiva (BEGIN IMMEDIATE) que se
+                   confirma al salir; las demás escrituras esperan a que termine
+    Yields:
+        sqlite3.Connection
+    """
+    global _estado_creado
+    if not _estado_creado:
+        os.makedirs(CACHE_ESTADO_DIR, exist_ok=True)
+    conn = sqlite3.connect(CACHE_ESTADO_PATH, timeout=30, isolation_level=None)
+    try:
+        if not _estado_creado:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS etiquetas ("
+                "clave TEXT PRIMARY KEY, cliente TEXT, desde TEXT, hasta TEXT, "
+                "expira REAL NOT NULL, generacion INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS versiones ("
+                "nombre TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+            )
+            _estado_creado = True
+        if not escritura:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+def leer_version(nombre):
+    """Versión actual de 'nombre' (0 si nunca se incrementó)"""
+    with estado_compartido() as conn:
+        fila = conn.execute("SELECT version FROM versiones WHERE nombre = ?", (nombre,)).fetchone()
+    return fila[0] if fila else 0
+
+def incrementar_version(nombre):
+    """Incrementa la versión de 'nombre' para todos los procesos y la devuelve"""
+    with estado_compartido(escritura=True) as conn:
+        conn.execute(
+            "INSERT INTO versiones (nombre, version) VALUES (?, 1) "
+            "ON CONFLICT(nombre) DO UPDATE SET version = version + 1",
+            (nombre,)
+        )
+        return conn.execute("SELECT version FROM versiones WHERE nombre = ?", (nombre,)).fetchone()[0]
+
+# -----------------------------------------------------------------------------
+# Bloqueos entre procesos
+# -----------------------------------------------------------------------------
+_locks_locales = {}
+_locks_locales_lock = threading.Lock()
+
+def _lock_local(nombre):
+    with _locks_locales_lock:
+        return _locks_locales.setdefault(nombre, threading.Lock())
+
+@contextmanager
+def bloqueo(nombre, esperar=True, timeout=30):
+    """
+    Bloqueo exclusivo por nombre, compartido entre los procesos del servidor.
+    Args:
+        nombre: Nombre del recurso (por ejemplo la clave del cache)
+        esperar: Si es False no espera; entrega False si otro lo tiene
+        timeout: Segundos máximos de espera
+    Yields:
+        bool: True si se obtuvo el bloqueo
+    """
+    if fcntl is None:
+        lock = _lock_local(nombre)
+        obtenido = lock.acquire(timeout=timeout) if esperar else lock.acquire(blocking=False)
+        try:
+            yield obtenido
+        finally:
+            if obtenido:
+                lock.release()
+        return
+
+    os.makedirs(CACHE_LOCK_DIR, exist_ok=True)
+    ruta = os.path.join(CACHE_LOCK_DIR, hashlib.md5(nombre.encode("utf-8")).hexdigest() + ".lock")
+    archivo = open(ruta, "a")
+    obtenido = False
+    try:
+        limite = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                obtenido = True
+                break
+            except BlockingIOError:
+                if not esperar or time.monotonic() >= limite:
+                    break
+                time.sleep(0.05)
+        if not obtenido:
+            logging.info(f"[CACHE] Bloqueo ocupado: {nombre}")
+        yield obtenido
+    finally:
+        if obtenido:
+            fcntl.flock(archivo.fileno(), fcntl.LOCK_UN)
+        archivo.close()
+
+# -----------------------------------------------------------------------------
+# Marcas de actualización entre procesos
+# Los procesos sin aplicación Flask (binance_updater_always) no pueden invalidar
+# el cache: avisan que cambiaron datos tocando una marca en CACHE_MARCAS_DIR, y
+# quien cachea valores derivados incluye la marca en la clave para recalcular
+# en cuanto cambia. Todos los procesos deben tener el mismo CACHE_DIR (o
+# CACHE_ESTADO_DIR) en el .env del proyecto para ver las mismas marcas.
+# -----------------------------------------------------------------------------
+_aviso_marcas = False
+
+def _avisar_sin_configurar():
+    global _aviso_marcas
+    if not ESTADO_CONFIGURADO and not _aviso_marcas:
+        _aviso_marcas = True
+        logging.warning(
+            f"[CACHE] CACHE_DIR/CACHE_ESTADO_DIR no configurado: las marcas quedan en {CACHE_MARCAS_DIR} "
+            f"y otros procesos (web, binance_updater_always) pueden no verlas"
+        )
+
+def _ruta_marca(nombre):
+    return os.path.join(CACHE_MARCAS_DIR, hashlib.md5(nombre.encode("utf-8")).hexdigest() + ".marca")
+
+def tocar_marca(nombre):
+    """Registra que los datos de 'nombre' cambiaron en este momento"""
+    _avisar_sin_configurar()
+    os.makedirs(CACHE_MARCAS_DIR, exist_ok=True)
+    ruta = _ruta_marca(nombre)
+    temporal = f"{ruta}.{os.getpid()}"
+    with open(temporal, "w") as archivo:
+        archivo.write(repr(time.time()))
+    # Reemplazo atómico: quien lee nunca ve la marca a medio escribir
+    os.replace(temporal, ruta)
+
+def leer_marca(nombre):
+    """Devuelve el momento del último tocar_marca(nombre) (0.0 si nunca se tocó)"""
+    _avisar_sin_configurar()
+    try:
+        with open(_ruta_marca(nombre)) as archivo:
+            return float(archivo.read() or 0)
+    except (OSError, ValueError):
+        return 0.0
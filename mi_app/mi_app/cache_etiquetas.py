@@ -0,0 +1,198 @@
+import logging
+import time
+
+from mi_app.mi_app.cache_compartido import bloqueo, estado_compartido
+from mi_app.mi_app.extensions import cache
+
+# -----------------------------------------------------------------------------
+# Invalidación dirigida del cache por cliente y fecha
+# Cada entrada guardada con guardar() queda registrada en la tabla etiquetas
+# del estado compartido (cache_compartido.estado_compartido, que el cache no
+# purga) con el cliente y el rango de fechas del que depende. Un pedido o pago
+# de un cliente en una fecha solo elimina las entradas que lo incluyen; el
+# resto sigue vigente.
+# Cada clave tiene una generación que invalidar() incrementa: un cálculo que
+# empezó antes de una invalidación no guarda su resultado (ver generacion()).
+# obtener_o_calcular() agrega single-flight: un solo proceso recalcula una
+# clave vencida mientras los demás esperan o entregan el valor anterior.
+# -----------------------------------------------------------------------------
+
+# Segundos máximos que un proceso espera a que otro termine de calcular una clave
+ESPERA_CALCULO = 30
+
+# Segundos que se conserva la etiqueta (y su generación) de una clave ya vencida
+CONSERVAR_ETIQUETAS = 86400
+
+def _registrar(conn, clave, expira, cliente, fecha_desde, fecha_hasta):
+    conn.execute(
+        "INSERT INTO etiquetas (clave, cliente, desde, hasta, expira) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT(clave) DO UPDATE SET cliente = excluded.cliente, desde = excluded.desde, "
+        "hasta = excluded.hasta, expira = MAX(etiquetas.expira, excluded.expira)",
+        (clave, cliente, fecha_desde, fecha_hasta, expira)
+    )
+
+def _generacion_actual(conn, clave):
+    fila = conn.execute("SELECT generacion FROM etiquetas WHERE clave = ?", (clave,)).fetchone()
+    return fila[0] if fila else 0
+
+def obtener(clave):
+    """Lee una entrada del cache (None si no existe o si el cache falla)"""
+    try:
+        return cache.get(clave)
+    except Exception as e:
+        logging.error(f"[CACHE] Error al leer {clave}: {e}")
+        return None
+
+def generacion(clave, timeout, cliente=None, fecha_desde=None, fecha_hasta=None):
+    """
+    Registra las etiquetas de una clave antes de calcularla y devuelve su generación.
+    Pasarla a guardar() descarta el resultado si la clave se invalidó durante el cálculo.
+    Args:
+        clave: Clave del cache
+        timeout: Segundos de vigencia que tendrá la entrada
+        cliente, fecha_desde, fecha_hasta: Etiquetas (ver guardar)
+    Returns:
+        int: Generación actual (None si el estado compartido falla)
+    """
+    try:
+        with estado_compartido(escritura=True) as conn:
+            _registrar(conn, clave, time.time() + timeout if timeout else float("inf"),
+                       cliente, fecha_desde, fecha_hasta)
+            return _generacion_actual(conn, clave)
+    except Exception as e:
+        logging.error(f"[CACHE] Error al registrar {clave}: {e}")
+        return None
+
+def guardar(clave, valor, timeout, cliente=None, fecha_desde=None, fecha_hasta=None, generacion=None):
+    """
+    Guarda una entrada y registra de qué movimientos depende.
+    Args:
+        clave: Clave del cache
+        valor: Valor a guardar
+        timeout: Segundos de vigencia
+        cliente: Cliente del que depende (None = depende de todos los clientes)
+        fecha_desde: Primer día que afecta la entrada (None = sin límite)
+        fecha_hasta: Último día que afecta la entrada (None = sin límite)
+        generacion: Generación leída con generacion() antes de calcular el valor;
+                    si cambió (hubo una invalidación) el valor no se guarda
+    Returns:
+        bool: True si se guardó
+    """
+    ahora = time.time()
+    try:
+        # La transacción excluye a invalidar(): nadie invalida entre la revisión y el guardado
+        with estado_compartido(escritura=True) as conn:
+            if generacion is not None and _generacion_actual(conn, clave) != generacion:
+                logging.info(f"[CACHE] {clave} invalidado durante el cálculo, no se guarda")
+                return False
+            cache.set(clave, valor, timeout=timeout)
+            _registrar(conn, clave, ahora + timeout if timeout else float("inf"),
+                       cliente, fecha_desde, fecha_hasta)
+            # Descartar las etiquetas vencidas hace tiempo
+            conn.execute("DELETE FROM etiquetas WHERE expira < ?", (ahora - CONSERVAR_ETIQUETAS,))
+        return True
+    except Exception as e:
+        logging.error(f"[CACHE] Error al guardar {clave}: {e}")
+        return False
+
+def _afectada(etiqueta, cliente, fecha):
+    if cliente is not None and etiqueta["cliente"] is not None and etiqueta["cliente"] != cliente:
+        return False
+    if fecha is not None:
+        if etiqueta["desde"] is not None and fecha < etiqueta["desde"]:
+            return False
+        if etiqueta["hasta"] is not None and fecha > etiqueta["hasta"]:
+            return False
+    return True
+
+def invalidar(cliente=None, fecha=None, prefijo=None):
+    """
+    Elimina las entradas que dependen de un movimiento del cliente en la fecha.
+    Args:
+        cliente: Cliente del movimiento (None = todos)
+        fecha: Fecha del movimiento YYYY-MM-DD (None = todas)
+        prefijo: Limitar a las claves que empiezan con este prefijo
+    Returns:
+        int: Número de entradas eliminadas
+    """
+    fecha = fecha[:10] if fecha else None
+    ahora = time.time()
+    try:
+        with estado_compartido(escritura=True) as conn:
+            etiquetas = conn.execute(
+                "SELECT clave, cliente, desde, hasta, expira FROM etiquetas "
+                "WHERE ? IS NULL OR substr(clave, 1, length(?)) = ?",
+                (prefijo, prefijo, prefijo)
+            ).fetchall()
+            afectadas = [
+                (clave, expira) for clave, cliente_e, desde, hasta, expira in etiquetas
+                if _afectada({"cliente": cliente_e, "desde": desde, "hasta": hasta}, cliente, fecha)
+            ]
+            if not afectadas:
+                return 0
+            # También las que se están calculando: su resultado se descarta en guardar()
+            conn.executemany("UPDATE etiquetas SET generacion = generacion + 1, expira = MIN(expira, ?) WHERE clave = ?",
+                             [(ahora, clave) for clave, _ in afectadas])
+            claves = [clave for clave, expira in afectadas if expira > ahora]
+            for c in claves:
+                # Una por una: delete_many se detiene en la primera clave ya vencida
+                try:
+                    cache.delete(c)
+                except Exception as e:
+                    logging.error(f"[CACHE] Error al eliminar {c}: {e}")
+    except Exception as e:
+        logging.error(f"[CACHE] Error al invalidar (cliente={cliente}, fecha={fecha}): {e}")
+        return 0
+    logging.info(f"[CACHE] Invalidadas {len(claves)} entradas (cliente={cliente}, fecha={fecha})")
+    return len(claves)
+
+def invalidar_movimiento(cliente, fecha):
+    """Invalida lo afectado por un pedido o pago de un cliente en una fecha (YYYY-MM-DD o ISO)"""
+    if not cliente or not fecha:
+        return invalidar()
+    return invalidar(cliente=cliente, fecha=fecha)
+
+def obtener_o_calcular(clave, calcular, timeout, gracia=None, cliente=None, fecha_desde=None, fecha_hasta=None):
+    """
+    Devuelve el valor de la clave, calculándolo una sola vez entre todos los procesos.
+    - Vigente: se entrega sin consultar nada.
+    - Vencido (dentro de la gracia): un proceso recalcula; los demás entregan el valor anterior.
+    - Inexistente (o invalidado): un proceso calcula y los demás esperan su resultado.
+    Args:
+        clave: Clave del cache
+        calcular: Función sin argumentos que produce el valor (si falla, no se guarda nada)
+        timeout: Segundos que el valor se considera vigente
+        gracia: Segundos extra en que se puede entregar el valor vencido (por defecto = timeout)
+        cliente, fecha_desde, fecha_hasta: Etiquetas para invalidar (ver guardar)
+    """
+    gracia = timeout if gracia is None else gracia
+
+    def _calcular_y_guardar():
+        inicio = time.perf_counter()
+        vigente = generacion(clave, timeout + gracia, cliente=cliente, fecha_desde=fecha_desde, fecha_hasta=fecha_hasta)
+        valor = calcular()
+        guardar(clave, {"valor": valor, "vigente_hasta": time.time() + timeout}, timeout + gracia,
+                cliente=cliente, fecha_desde=fecha_desde, fecha_hasta=fecha_hasta, generacion=vigente)
+        logging.info(f"[CACHE] {clave} calculado en {time.perf_counter() - inicio:.2f}s")
+        return valor
+
+    entrada = obtener(clave)
+    if entrada is not None and entrada["vigente_hasta"] > time.time():
+        return entrada["valor"]
+
+    if entrada is not None:
+        # Vencido: recalcula solo quien obtiene el bloqueo, el resto entrega el valor anterior
+        with bloqueo(clave, esperar=False) as obtenido:
+            if not obtenido:
+                return entrada["valor"]
+            actual = obtener(clave)
+            if actual is not None and actual["vigente_hasta"] > time.time():
+                return actual["valor"]
+            return _calcular_y_guardar()
+
+    # Inexistente: esperar a quien lo esté calculando y reutilizar su resultado
+    with bloqueo(clave, timeout=ESPERA_CALCULO):
+        actual = obtener(clave)
+        if actual is not None:
+            return actual["valor"]
+        return _calcular_y_guardar()
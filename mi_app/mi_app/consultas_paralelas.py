@@ -0,0 +1,68 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+
+# -----------------------------------------------------------------------------
+# Consultas independientes en paralelo
+# Las páginas que arman sus datos con varias consultas a Supabase que no
+# dependen entre sí las declaran juntas y las ejecutan en un pool de hilos:
+# la página espera lo que tarda la consulta más lenta y no la suma de todas.
+# Cada consulta registra su tiempo en el log con la etiqueta de la página.
+# -----------------------------------------------------------------------------
+
+# Hilos del pool compartido por todas las páginas del proceso
+MAX_HILOS = int(os.getenv('CONSULTAS_MAX_HILOS', 8))
+
+_pool = ThreadPoolExecutor(max_workers=MAX_HILOS, thread_name_prefix="consulta")
+
+def _ejecutar(consulta, app=None):
+    inicio = time.perf_counter()
+    try:
+        if hasattr(consulta, "execute"):
+            resultado = consulta.execute()
+        elif app is not None:
+            # Las funciones pueden usar el cache: corren con el contexto de la aplicación
+            with app.app_context():
+                resultado = consulta()
+        else:
+            resultado = consulta()
+        return resultado, None, time.perf_counter() - inicio
+    except Exception as e:
+        return None, e, time.perf_counter() - inicio
+
+def consultar_en_paralelo(consultas, etiqueta="CONSULTAS", tolerar_errores=False):
+    """
+    Ejecuta un conjunto de consultas independientes al mismo tiempo.
+    Args:
+        consultas: dict nombre -> consulta de Supabase sin ejecutar (se llama .execute())
+                   o función sin argumentos. Las funciones corren con el contexto de
+                   la aplicación (cache, current_app) pero sin request ni session.
+        etiqueta: Nombre de la página para el log de tiempos
+        tolerar_errores: Si es True, una consulta que falla entrega None en su nombre;
+                         si es False, se relanza el primer error (después de esperar todas)
+    Returns:
+        dict nombre -> respuesta de execute() o valor devuelto por la función
+    """
+    inicio = time.perf_counter()
+    app = current_app._get_current_object() if has_app_context() else None
+    futuros = {nombre: _pool.submit(_ejecutar, consulta, app) for nombre, consulta in consultas.items()}
+
+    resultados = {}
+    tiempos = []
+    primer_error = None
+    for nombre, futuro in futuros.items():
+        resultado, error, segundos = futuro.result()
+        tiempos.append(f"{nombre}={segundos:.2f}s")
+        if error is not None:
+            logging.error(f"[{etiqueta}] Error en la consulta {nombre}: {error}")
+            if primer_error is None:
+                primer_error = error
+        resultados[nombre] = resultado
+
+    logging.info(f"[{etiqueta}] {len(consultas)} consultas en {time.perf_counter() - inicio:.2f}s ({', '.join(tiempos)})")
+    if primer_error is not None and not tolerar_errores:
+        raise primer_error
+    return resultados
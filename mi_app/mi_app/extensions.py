@@ -1,9 +1,12 @@
 from flask_caching import Cache
 from functools import wraps
-from flask import session, flash, redirect, url_for
+from flask import session, flash, redirect, url_for, g
 from supabase import create_client
 import os
+import time
+import logging
 import pytz
+from mi_app.mi_app.cache_compartido import incrementar_version, leer_version
 
 cache = Cache() 
 
@@ -13,6 +16,84 @@ supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 chile_tz = pytz.timezone('America/Santiago')
 
+# -----------------------------------------------------------------------------
+# Permisos de usuario (superusuarios / allowed_users)
+# Se cargan una vez por sesión y se guardan en session["permisos"] con un TTL.
+# Al cambiar superusuarios se incrementa una versión en el estado compartido
+# (cache_compartido.estado_compartido: un archivo que todos los workers leen y
+# que el cache no purga) para forzar la recarga en las demás sesiones.
+# -----------------------------------------------------------------------------
+PERMISOS_TTL = int(os.getenv('PERMISOS_TTL', '300'))
+PERMISOS_VERSION_KEY = "permisos_version"
+
+def _version_permisos():
+    try:
+        return leer_version(PERMISOS_VERSION_KEY)
+    except Exception as e:
+        # Sin versión legible las sesiones recargan los permisos en cada request
+        logging.error("Error al leer la versión de permisos: %s", e)
+        return None
+
+def _consultar_permisos(email):
+    """Consulta superusuarios y allowed_users para el email dado"""
+    superuser_response = supabase.table("superusuarios").select("email").eq("email", email).execute()
+    allowed_response = supabase.table("allowed_users").select("email").eq("email", email).execute()
+    return {
+        "is_superuser": bool(superuser_response.data),
+        "is_allowed": bool(allowed_response.data)
+    }
+
+def obtener_permisos():
+    """
+    Devuelve los permisos del usuario de la sesión, consultando la base de datos
+    solo si no están en la sesión, expiró el TTL o cambió la versión.
+    Returns:
+        dict: {"is_superuser": bool, "is_allowed": bool, "error": bool}
+    """
+    if "permisos" in g:
+        return g.permisos
+    email = session.get("email")
+    permisos = {"is_superuser": False, "is_allowed": False, "error": False}
+    if email:
+        version = _version_permisos()
+        guardados = session.get("permisos")
+        vigentes = (
+            guardados
+            and guardados.get("email") == email
+            and version is not None
+            and guardados.get("version") == version
+            and time.time() - guardados.get("cargado_en", 0) < PERMISOS_TTL
+        )
+        if vigentes:
+            permisos["is_superuser"] = guardados["is_superuser"]
+            permisos["is_allowed"] = guardados["is_allowed"]
+        else:
+            try:
+                permisos.update(_consultar_permisos(email))
+                session["permisos"] = {
+                    "email": email,
+                    "is_superuser": permisos["is_superuser"],
+                    "is_allowed": permisos["is_allowed"],
+                    "version": version,
+                    "cargado_en": time.time()
+                }
+            except Exception as e:
+                logging.error("Error al verificar permisos de usuario: %s", e)
+                permisos["error"] = True
+    g.permisos = permisos
+    g.is_superuser = permisos["is_superuser"]
+    g.is_allowed = permisos["is_allowed"]
+    return permisos
+
+def invalidar_permisos():
+    """Fuerza la recarga de permisos en todas las sesiones (llamar al cambiar superusuarios)"""
+    session.pop("permisos", None)
+    g.pop("permisos", None)
+    try:
+        incrementar_version(PERMISOS_VERSION_KEY)
+    except Exception as e:
+        logging.error("Error al invalidar permisos: %s", e)
+
 def user_allowed(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
@@ -20,14 +101,13 @@ def user_allowed(f):
         if not email:
             flash("Debes iniciar sesión.")
             return redirect(url_for("login"))
-        try:
-            response = supabase.table("allowed_users").select("email").eq("email", email).execute()
-            if not response.data:
-                flash("No tienes permisos para acceder a este módulo.")
-                return redirect(url_for("index"))
-        except Exception as e:
+        permisos = obtener_permisos()
+        if permisos["error"]:
             flash("Error interno al verificar permisos.")
             return redirect(url_for("index"))
+        if not permisos["is_allowed"]:
+            flash("No tienes permisos para acceder a este módulo.")
+            return redirect(url_for("index"))
         return f(*args, **kwargs)
     return wrapper
 
@@ -0,0 +1,225 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+
+from mi_app.mi_app.extensions import supabase, chile_tz
+from mi_app.ingesta_transferencias import procesar_archivo_bancario, detectar_banco
+
+# -----------------------------------------------------------------------------
+# Worker de ingesta de cartolas bancarias (BCI / Santander)
+# Un solo hilo por proceso consume una cola de trabajos y procesa cada archivo
+# en el mismo intérprete, sin lanzar bci.py / Santander.py como subprocesos.
+# El estado de cada trabajo queda en memoria y en archivos_subidos.estado.
+# Un trabajo que insertó filas descarta los conteos y el catálogo de empresas
+# cacheados del listado de transferencias.
+# La cola no sobrevive a un reinicio: los archivos que quedan en_proceso sin un
+# trabajo vivo se marcan con error pasado MINUTOS_TRABAJO_HUERFANO.
+# -----------------------------------------------------------------------------
+
+# Trabajos terminados que se conservan en memoria para consultar su estado
+MAX_TRABAJOS_GUARDADOS = 200
+# Minutos tras los que un archivo en_proceso sin trabajo en memoria se da por perdido
+MINUTOS_TRABAJO_HUERFANO = 30
+MENSAJE_TRABAJO_HUERFANO = "Procesamiento interrumpido (reinicio del servidor). Vuelve a subir el archivo."
+
+_cola = queue.Queue()
+_trabajos = {}
+_lock = threading.Lock()
+_hilo = None
+_huerfanos_revisados = False
+# Aplicación Flask del proceso (el hilo del worker no tiene contexto propio para el cache)
+_app = None
+
+def _ahora():
+    return datetime.now(chile_tz).isoformat()
+
+def _actualizar_trabajo(job_id, **campos):
+    with _lock:
+        if job_id in _trabajos:
+            _trabajos[job_id].update(campos)
+
+def _purgar_trabajos():
+    """Elimina los trabajos terminados más antiguos si se supera el máximo"""
+    with _lock:
+        terminados = [j for j, t in _trabajos.items() if t["estado"] in ("procesado", "error")]
+        for job_id in terminados[:max(0, len(terminados) - MAX_TRABAJOS_GUARDADOS)]:
+            del _trabajos[job_id]
+
+def _invalidar_cache_transferencias(nombre):
+    if _app is None:
+        return
+    try:
+        # Importación diferida: el blueprint de transferencias importa este módulo
+        from mi_app.mi_app.blueprints.transferencias import invalidar_tras_ingesta
+        with _app.app_context():
+            invalidar_tras_ingesta()
+    except Exception as e:
+        logging.error(f"[INGESTA] Error al invalidar el cache de transferencias tras {nombre}: {e}")
+
+def _ejecutar_trabajo(job_id):
+    with _lock:
+        trabajo = dict(_trabajos[job_id])
+    _actualizar_trabajo(job_id, estado="en_proceso", iniciado_en=_ahora())
+    inicio = time.perf_counter()
+    try:
+        exito, mensaje, resultado = procesar_archivo_bancario(trabajo["ruta_archivo"], trabajo["nombre_original"])
+    except Exception as e:
+        logging.error(f"[INGESTA] Error procesando {trabajo['nombre_original']}: {e}")
+        exito, mensaje, resultado = False, f"Error procesando archivo: {str(e)}", None
+
+    estado = "procesado" if exito else "error"
+    _actualizar_trabajo(
+        job_id,
+        estado=estado,
+        mensaje=mensaje,
+        resultado=resultado,
+        terminado_en=_ahora(),
+        segundos=round(time.perf_counter() - inicio, 2)
+    )
+    logging.info(f"[INGESTA] Trabajo {job_id} ({trabajo['nombre_original']}): {estado} - {mensaje}")
+
+    # También con carga parcial: las filas ya insertadas deben verse en el listado
+    if resultado and resultado.get("insertados"):
+        _invalidar_cache_transferencias(trabajo['nombre_original'])
+
+    # Reflejar el resultado en el historial de archivos subidos
+    if trabajo.get("archivo_id"):
+        try:
+            supabase.table('archivos_subidos').update({
+                'estado': estado,
+                'mensaje_error': mensaje
+            }).eq('id', trabajo["archivo_id"]).execute()
+        except Exception as e:
+            logging.error(f"[INGESTA] Error al actualizar archivos_subidos {trabajo['archivo_id']}: {e}")
+
+def _limite_huerfanos():
+    return (datetime.now(chile_tz) - timedelta(minutes=MINUTOS_TRABAJO_HUERFANO)).isoformat()
+
+def _marcar_huerfanos():
+    """
+    Marca con error los archivos que quedaron en_proceso de un worker anterior
+    (la cola en memoria se pierde al reiniciar gunicorn). Solo se tocan los
+    subidos hace más de MINUTOS_TRABAJO_HUERFANO, para no pisar trabajos vivos
+    de otros procesos.
+    """
+    try:
+        response = supabase.table('archivos_subidos').select('id') \
+            .eq('estado', 'en_proceso').lt('fecha_subida', _limite_huerfanos()).execute()
+        with _lock:
+            ids = [a['id'] for a in (response.data or []) if str(a['id']) not in _trabajos]
+        if ids:
+            supabase.table('archivos_subidos').update({
+                'estado': 'error',
+                'mensaje_error': MENSAJE_TRABAJO_HUERFANO
+            }).in_('id', ids).eq('estado', 'en_proceso').execute()
+            logging.warning(f"[INGESTA] {len(ids)} archivo(s) en_proceso sin trabajo activo marcados con error: {ids}")
+    except Exception as e:
+        logging.error(f"[INGESTA] Error al revisar archivos en_proceso huérfanos: {e}")
+
+def _bucle_worker():
+    while True:
+        job_id = _cola.get()
+        try:
+            _ejecutar_trabajo(job_id)
+        except Exception as e:
+            logging.error(f"[INGESTA] Error inesperado en el worker: {e}")
+        finally:
+            _cola.task_done()
+            _purgar_trabajos()
+
+def _asegurar_worker():
+    """Inicia el hilo del worker en este proceso si aún no está corriendo"""
+    global _hilo, _huerfanos_revisados
+    with _lock:
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_bucle_worker, name="ingesta-transferencias", daemon=True)
+            _hilo.start()
+        revisar_huerfanos = not _huerfanos_revisados
+        _huerfanos_revisados = True
+    if revisar_huerfanos:
+        _marcar_huerfanos()
+
+def encolar_archivo(ruta_archivo, nombre_original, archivo_id=None):
+    """
+    Encola una cartola para procesarla en segundo plano.
+    Args:
+        ruta_archivo: Ruta del archivo guardado en uploads
+        nombre_original: Nombre con el que se subió (define el banco)
+        archivo_id: ID en archivos_subidos, si existe (se usa como id del trabajo)
+    Returns:
+        str: ID del trabajo
+    """
+    global _app
+    job_id = str(archivo_id) if archivo_id else uuid.uuid4().hex
+    if has_app_context():
+        _app = current_app._get_current_object()
+    with _lock:
+        _trabajos[job_id] = {
+            "job_id": job_id,
+            "archivo_id": archivo_id,
+            "ruta_archivo": ruta_archivo,
+            "nombre_original": nombre_original,
+            "tipo_banco": detectar_banco(nombre_original) or "No reconocido",
+            "estado": "en_cola",
+            "mensaje": None,
+            "resultado": None,
+            "creado_en": _ahora(),
+            "iniciado_en": None,
+            "terminado_en": None,
+            "segundos": None
+        }
+    _asegurar_worker()
+    _cola.put(job_id)
+    return job_id
+
+def estado_trabajo(job_id):
+    """
+    Devuelve el estado de un trabajo. Si no está en la memoria de este proceso
+    (por ejemplo, otro worker web lo encoló), se consulta archivos_subidos; un
+    archivo en_proceso más antiguo que MINUTOS_TRABAJO_HUERFANO se marca con error.
+    Returns:
+        dict o None si no existe
+    """
+    with _lock:
+        trabajo = _trabajos.get(job_id)
+        if trabajo:
+            datos = dict(trabajo)
+            datos.pop("ruta_archivo", None)
+            datos["en_cola"] = _cola.qsize()
+            return datos
+
+    if not str(job_id).isdigit():
+        return None
+    try:
+        response = supabase.table('archivos_subidos').select('id, nombre_original, estado, mensaje_error').eq('id', int(job_id)).execute()
+    except Exception as e:
+        logging.error(f"[INGESTA] Error al consultar archivos_subidos {job_id}: {e}")
+        return None
+    if not response.data:
+        return None
+    archivo = response.data[0]
+    if archivo.get("estado") == "en_proceso":
+        try:
+            cerrado = supabase.table('archivos_subidos').update({
+                'estado': 'error',
+                'mensaje_error': MENSAJE_TRABAJO_HUERFANO
+            }).eq('id', archivo["id"]).eq('estado', 'en_proceso').lt('fecha_subida', _limite_huerfanos()).execute()
+            if cerrado.data:
+                archivo["estado"] = "error"
+                archivo["mensaje_error"] = MENSAJE_TRABAJO_HUERFANO
+        except Exception as e:
+            logging.error(f"[INGESTA] Error al revisar el archivo {job_id} en_proceso: {e}")
+    return {
+        "job_id": str(job_id),
+        "archivo_id": archivo["id"],
+        "nombre_original": archivo.get("nombre_original"),
+        "tipo_banco": detectar_banco(archivo.get("nombre_original") or "") or "No reconocido",
+        "estado": archivo.get("estado"),
+        "mensaje": archivo.get("mensaje_error"),
+        "resultado": None
+    }
@@ -0,0 +1,255 @@
+import logging
+import time
+from datetime import datetime, timedelta
+
+from mi_app.mi_app.consultas_paralelas import consultar_en_paralelo
+from mi_app.mi_app.extensions import supabase
+from mi_app.mi_app.totales_diarios import compras_por_dia, pedidos_por_dia
+
+# -----------------------------------------------------------------------------
+# Recálculo del flujo de capital por rango de fechas
+# Lee una sola vez pedidos, compras, stock_diario y las filas de flujo_capital
+# del rango, calcula los días en orden llevando capital_final en memoria hacia
+# el capital_inicial del día siguiente y escribe las filas que cambiaron con
+# un único upsert. Devuelve las diferencias por día respecto de lo guardado.
+# Los días siguientes que no se recalculan se encadenan: conservan sus
+# resultados y solo desplazan su capital.
+# -----------------------------------------------------------------------------
+
+# Capital inicial cuando no hay fila del día anterior
+CAPITAL_INICIAL_POR_DEFECTO = 32000000
+# Gastos en BRS cuando stock_diario no tiene la fecha
+GASTOS_POR_DEFECTO = 15330
+PAGO_MOVIL_POR_DEFECTO = 7190
+ENVIOS_AL_DETAL_POR_DEFECTO = 170984
+
+# Columnas de flujo_capital que escribe el recálculo
+CAMPOS_FLUJO = (
+    "capital_inicial", "ganancias", "costo_gastos", "gastos_manuales", "capital_final",
+    "margen_neto", "ponderado_ves_clp", "gastos_brs", "pago_movil_brs", "envios_al_detal_brs"
+)
+
+def _numero(valor, por_defecto=0.0):
+    return float(valor) if valor is not None else float(por_defecto)
+
+def _dia_anterior(fecha):
+    return (datetime.strptime(fecha, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+
+def calcular_dia(fecha, capital_inicial, stock, pedidos, compras, gastos_manuales):
+    """
+    Fila de flujo_capital de un día, con la misma lógica de márgenes de la página principal.
+    Args:
+        fecha: Fecha YYYY-MM-DD
+        capital_inicial: capital_final del día anterior
+        stock: Fila de stock_diario de la fecha (o None)
+        pedidos: Totales de pedidos del día (ver totales_diarios.pedidos_del_dia)
+        compras: Totales de compras del día (ver totales_diarios.compras_del_dia)
+        gastos_manuales: Gastos manuales ya registrados para el día
+    Returns:
+        dict con la fila a guardar
+    """
+    stock = stock or {}
+    gastos = _numero(stock.get("gastos"), GASTOS_POR_DEFECTO)
+    pago_movil = _numero(stock.get("pago_movil"), PAGO_MOVIL_POR_DEFECTO)
+    envios_al_detal = _numero(stock.get("envios_al_detal"), ENVIOS_AL_DETAL_POR_DEFECTO)
+
+    brs_comprados = compras["brs_comprados"]
+    usdt_vendidos = compras["usdt_vendidos"]
+    usdt_comprados = compras["usdt_comprados"]
+    clp_invertidos = compras["clp_invertidos"]
+    usdt_vendidos_clp = compras["usdt_vendidos_clp"]
+
+    tasa_usdt_clp_actual = clp_invertidos / usdt_comprados if usdt_comprados > 0 else 0
+
+    brs_anterior = _numero(stock.get("brs_stock"))
+    usdt_anterior = _numero(stock.get("usdt_stock"))
+    tasa_usdt_clp_anterior = _numero(stock.get("usdt_tasa"))
+    tasa_ves_clp_anterior = _numero(stock.get("tasa_ves_clp"))
+
+    total_brs = brs_anterior + brs_comprados
+    total_usdt = usdt_anterior + usdt_comprados - usdt_vendidos_clp
+    tasa_usdt_clp_general = 0
+    if total_usdt > 0:
+        tasa_usdt_clp_general = (usdt_anterior * tasa_usdt_clp_anterior + usdt_comprados * tasa_usdt_clp_actual) / total_usdt
+
+    clp_por_usdt_vendido = usdt_vendidos * tasa_usdt_clp_general
+    tasa_ves_clp_actual = brs_comprados / clp_por_usdt_vendido if clp_por_usdt_vendido > 0 else 0
+    ponderado_ves_clp = 0
+    if total_brs > 0:
+        ponderado_ves_clp = (brs_anterior * tasa_ves_clp_anterior + brs_comprados * tasa_ves_clp_actual) / total_brs
+
+    if ponderado_ves_clp > 0:
+        margen_mayor = pedidos["clp_mayor"] - (pedidos["brs_mayor"] / ponderado_ves_clp)
+        margen_detal = pedidos["clp_detal"] - (pedidos["brs_detal"] / ponderado_ves_clp)
+        costo_pago_movil = pago_movil / ponderado_ves_clp
+        costo_gastos = gastos / ponderado_ves_clp
+    else:
+        margen_mayor = 0
+        margen_detal = 0
+        costo_pago_movil = 0
+        costo_gastos = 0
+
+    margen_neto = margen_mayor + margen_detal - costo_pago_movil
+    ganancias = margen_neto
+    return {
+        "fecha": fecha,
+        "capital_inicial": capital_inicial,
+        "ganancias": ganancias,
+        "costo_gastos": costo_gastos,
+        "gastos_manuales": gastos_manuales,
+        "capital_final": capital_inicial + ganancias - costo_gastos - gastos_manuales,
+        "margen_neto": margen_neto,
+        "ponderado_ves_clp": ponderado_ves_clp,
+        "gastos_brs": gastos,
+        "pago_movil_brs": pago_movil,
+        "envios_al_detal_brs": envios_al_detal
+    }
+
+def _diferencias(anterior, nueva):
+    """Campos que cambian entre la fila guardada y la recalculada (a centésimas)"""
+    cambios = {}
+    for campo in CAMPOS_FLUJO:
+        antes = anterior.get(campo) if anterior else None
+        despues = nueva[campo]
+        if anterior is not None and antes is None and despues is None:
+            continue
+        if antes is None or despues is None or round(float(antes), 2) != round(float(despues), 2):
+            cambios[campo] = {"antes": antes, "despues": despues}
+    return cambios
+
+def _guardar(filas):
+    """Un solo upsert por fecha; sin índice único en fecha se guarda fila por fila"""
+    if not filas:
+        return []
+    try:
+        return supabase.table("flujo_capital").upsert(filas, on_conflict="fecha").execute().data or []
+    except Exception as e:
+        logging.error(f"[FLUJO] Error en el upsert de {len(filas)} filas, se guardan una por una: {e}")
+    guardadas = []
+    for fila in filas:
+        existente = supabase.table("flujo_capital").select("fecha").eq("fecha", fila["fecha"]).execute().data
+        if existente:
+            response = supabase.table("flujo_capital").update(fila).eq("fecha", fila["fecha"]).execute()
+        else:
+            response = supabase.table("flujo_capital").insert(fila).execute()
+        guardadas.extend(response.data or [])
+    return guardadas
+
+def _encadenar(guardada, capital_inicial):
+    """Día que no se recalcula: conserva sus resultados y desplaza el capital"""
+    fila = {"fecha": guardada["fecha"][:10]}
+    fila.update({campo: guardada.get(campo) for campo in CAMPOS_FLUJO})
+    desplazamiento = capital_inicial - _numero(guardada.get("capital_inicial"))
+    fila["capital_inicial"] = capital_inicial
+    fila["capital_final"] = _numero(guardada.get("capital_final")) + desplazamiento
+    return fila
+
+def recalcular_flujo(fechas, encadenar_hasta=None):
+    """
+    Recalcula el flujo de capital de las fechas dadas en una sola pasada.
+    El capital_inicial de cada día es el capital_final recién calculado del día
+    anterior, o el guardado si ese día no se recalcula.
+    Args:
+        fechas: Fechas YYYY-MM-DD a recalcular (en cualquier orden)
+        encadenar_hasta: Si se indica, los días guardados posteriores a un día
+                         recalculado (hasta esta fecha) no se recalculan pero
+                         reciben el nuevo capital_inicial y desplazan su capital_final
+    Returns:
+        dict con:
+            calculadas: todas las filas recalculadas o encadenadas, en orden de fecha
+            filas: filas guardadas (solo las que cambiaron o no existían)
+            diferencias: lista de {fecha, nueva, cambios: {campo: {antes, despues}}}
+    """
+    fechas = sorted(set(fechas))
+    if not fechas:
+        return {"calculadas": [], "filas": [], "diferencias": []}
+    inicio = time.perf_counter()
+    fecha_inicio, fecha_fin = fechas[0], fechas[-1]
+    hasta_flujo = max(fecha_fin, encadenar_hasta or fecha_fin)
+
+    datos = consultar_en_paralelo({
+        "flujo": supabase.table("flujo_capital").select("fecha, " + ", ".join(CAMPOS_FLUJO))
+            .gte("fecha", _dia_anterior(fecha_inicio)).lte("fecha", hasta_flujo),
+        "stock": supabase.table("stock_diario")
+            .select("fecha, gastos, pago_movil, envios_al_detal, brs_stock, usdt_stock, tasa_ves_clp, usdt_tasa")
+            .gte("fecha", fecha_inicio).lte("fecha", fecha_fin),
+        "pedidos": lambda: pedidos_por_dia(fecha_inicio, fecha_fin),
+        "compras": lambda: compras_por_dia(fecha_inicio, fecha_fin),
+    }, etiqueta="FLUJO")
+    guardadas = {f["fecha"][:10]: f for f in datos["flujo"].data or []}
+    stock = {s["fecha"][:10]: s for s in datos["stock"].data or []}
+
+    a_recalcular = set(fechas)
+    encadenables = {f for f in guardadas if fecha_inicio < f <= hasta_flujo} if encadenar_hasta else set()
+    calculadas = {}
+    diferencias = []
+    for fecha in sorted(a_recalcular | encadenables):
+        ayer = _dia_anterior(fecha)
+        if ayer in calculadas:
+            capital_inicial = calculadas[ayer]["capital_final"]
+        elif fecha not in a_recalcular:
+            # Día intermedio sin cambios previos en esta pasada: queda como está
+            continue
+        elif ayer in guardadas:
+            capital_inicial = _numero(guardadas[ayer].get("capital_final"))
+        else:
+            capital_inicial = CAPITAL_INICIAL_POR_DEFECTO
+        anterior = guardadas.get(fecha)
+        if fecha in a_recalcular:
+            gastos_manuales = _numero(anterior.get("gastos_manuales")) if anterior else 0
+            fila = calcular_dia(fecha, capital_inicial, stock.get(fecha),
+                                datos["pedidos"][fecha], datos["compras"][fecha], gastos_manuales)
+        else:
+            fila = _encadenar(anterior, capital_inicial)
+        calculadas[fecha] = fila
+        cambios = _diferencias(anterior, fila)
+        if cambios:
+            diferencias.append({"fecha": fecha, "nueva": anterior is None, "cambios": cambios})
+
+    cambiadas = [calculadas[d["fecha"]] for d in diferencias]
+    filas = _guardar(cambiadas)
+    logging.info(f"[FLUJO] {len(fechas)} días recalculados ({fecha_inicio} a {fecha_fin}), "
+                 f"{len(calculadas) - len(fechas)} encadenados, {len(cambiadas)} con cambios, "
+                 f"en {time.perf_counter() - inicio:.2f}s")
+    return {"calculadas": list(calculadas.values()), "filas": filas, "diferencias": diferencias}
+
+# -----------------------------------------------------------------------------
+# Marcas de cambio por fecha (ver scripts/CREAR_CAMBIOS_POR_FECHA.sql)
+# Los triggers de pedidos, compras y stock_diario registran en cambios_por_fecha
+# cuándo cambió cada día; el recálculo guarda hasta qué cambio quedó al día.
+# Un rango se revisa con una sola consulta a la vista flujo_fechas_pendientes.
+# -----------------------------------------------------------------------------
+
+def fechas_pendientes(fecha_inicio, fecha_fin):
+    """
+    Fechas del rango con cambios posteriores al último recálculo.
+    Returns:
+        dict fecha -> cambiado_en leído (para marcar_recalculadas), o None si
+        la vista no está disponible (no se puede saber qué días cambiaron)
+    """
+    try:
+        filas = (supabase.table("flujo_fechas_pendientes")
+                 .select("fecha, cambiado_en")
+                 .gte("fecha", fecha_inicio)
+                 .lte("fecha", fecha_fin)
+                 .execute().data or [])
+        return {f["fecha"][:10]: f["cambiado_en"] for f in filas}
+    except Exception as e:
+        logging.error(f"[FLUJO] Error al leer flujo_fechas_pendientes: {e}")
+        return None
+
+def marcar_recalculadas(marcas):
+    """
+    Registra que las fechas quedaron al día hasta el cambio leído en fechas_pendientes.
+    Un cambio ocurrido durante el recálculo tiene una marca posterior y sigue pendiente.
+    """
+    if not marcas:
+        return
+    fechas = list(marcas)
+    try:
+        supabase.rpc("marcar_flujo_recalculado", {
+            "p_fechas": fechas,
+            "p_marcas": [marcas[f] for f in fechas]
+        }).execute()
+    except Exception as e:
+        logging.error(f"[FLUJO] Error al marcar {len(fechas)} fechas como recalculadas: {e}")
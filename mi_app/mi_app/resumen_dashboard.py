@@ -0,0 +1,117 @@
+import logging
+from datetime import datetime, timedelta
+
+from mi_app.mi_app import cache_etiquetas
+from mi_app.mi_app.extensions import chile_tz
+from mi_app.mi_app.saldos_clientes import obtener_resumen_clientes
+
+# -----------------------------------------------------------------------------
+# Resumen por cliente del dashboard (HTML, JSON y CSV)
+# Se calcula una vez por (fecha, dias, filtro) y se guarda en el cache
+# compartido; las tres vistas leen la misma entrada. Las entradas quedan
+# etiquetadas por cliente y fecha (ver cache_etiquetas.py).
+# -----------------------------------------------------------------------------
+
+RESUMEN_TIMEOUT = 300
+RESUMEN_PREFIJO = "resumen_dashboard"
+
+# Detalle por cliente (dashboard.detalle)
+DETALLE_PREFIJO = "detalle_cliente"
+DETALLE_TIMEOUT = 60
+
+class ResumenService:
+    def __init__(self, timeout=RESUMEN_TIMEOUT):
+        self.timeout = timeout
+
+    def clave(self, fecha, dias, cliente_filtro=""):
+        return f"{RESUMEN_PREFIJO}:{fecha}:{dias}:{cliente_filtro or ''}"
+
+    def _calcular(self, fecha, dias):
+        """Consulta el resumen sin filtro de cliente"""
+        fecha_inicio = (datetime.strptime(fecha, "%Y-%m-%d") - timedelta(days=dias)).strftime("%Y-%m-%d")
+        resumen = obtener_resumen_clientes(fecha_inicio, fecha)
+        logging.info(f"[DASHBOARD] Resumen de {fecha} ({dias} días) calculado: {len(resumen)} clientes")
+        return {
+            "fecha": fecha,
+            "dias": dias,
+            "resumen": resumen,
+            "calculado_en": datetime.now(chile_tz).isoformat()
+        }
+
+    @staticmethod
+    def filtrar(resumen, cliente_filtro=""):
+        """
+        Deja los clientes con algún valor distinto de cero y aplica el filtro de cliente.
+        Returns:
+            tuple: (lista de filas a mostrar, lista ordenada de clientes para el selector)
+        """
+        clientes_filtrados = sorted([
+            r["cliente"] for r in resumen.values()
+            if r["brs"] != 0 or r["clp"] != 0 or r["pagos"] != 0 or r["diferencia"] != 0 or r["deuda_anterior"] != 0
+        ])
+        if cliente_filtro:
+            resumen_list = [resumen[cliente_filtro]] if cliente_filtro in resumen else []
+        else:
+            resumen_list = [resumen[c] for c in clientes_filtrados]
+        return resumen_list, clientes_filtrados
+
+    def obtener(self, fecha, dias=30, cliente_filtro=""):
+        """
+        Devuelve el resumen del dashboard para la fecha, desde el cache si existe.
+        Una entrada filtrada se arma a partir de la entrada sin filtro de la misma
+        fecha y ventana, así cambiar de cliente no vuelve a consultar la base.
+        Si varios workers piden la misma clave vencida, solo uno la recalcula.
+        Args:
+            fecha: Fecha consultada (YYYY-MM-DD)
+            dias: Días hacia atrás que definen qué clientes aparecen
+            cliente_filtro: Cliente a mostrar ("" para todos)
+        Returns:
+            dict: {fecha, dias, cliente_filtro, resumen (lista), clientes, calculado_en}
+        """
+        # Una entrada filtrada solo depende de su cliente (la lista del selector
+        # puede tardar hasta el timeout en mostrar un cliente nuevo)
+        return cache_etiquetas.obtener_o_calcular(
+            self.clave(fecha, dias, cliente_filtro),
+            lambda: self._filtrar_base(fecha, dias, cliente_filtro),
+            self.timeout,
+            cliente=cliente_filtro or None,
+            fecha_hasta=fecha
+        )
+
+    def _filtrar_base(self, fecha, dias, cliente_filtro):
+        # El saldo anterior depende de todo el historial hasta la fecha
+        base = cache_etiquetas.obtener_o_calcular(
+            f"{self.clave(fecha, dias)}:base",
+            lambda: self._calcular(fecha, dias),
+            self.timeout,
+            fecha_hasta=fecha
+        )
+        resumen_list, clientes_filtrados = self.filtrar(base["resumen"], cliente_filtro)
+        return {
+            "fecha": fecha,
+            "dias": dias,
+            "cliente_filtro": cliente_filtro or "",
+            "resumen": resumen_list,
+            "clientes": clientes_filtrados,
+            "calculado_en": base["calculado_en"]
+        }
+
+    def invalidar(self, cliente=None, fecha=None):
+        """
+        Elimina los resúmenes afectados por un movimiento del cliente en la fecha:
+        los de fechas iguales o posteriores, sin filtro o filtrados por ese cliente.
+        Sin argumentos elimina todos los resúmenes.
+        """
+        return cache_etiquetas.invalidar(cliente=cliente, fecha=fecha, prefijo=RESUMEN_PREFIJO)
+
+resumen_service = ResumenService()
+
+def invalidar_dashboard(cliente=None, fecha=None):
+    """
+    Elimina los resúmenes y detalles del dashboard afectados por un pedido o pago
+    del cliente en la fecha. Sin argumentos elimina todos los del dashboard.
+    """
+    return (
+        resumen_service.invalidar(cliente, fecha)
+        + cache_etiquetas.invalidar(cliente=cliente, fecha=fecha, prefijo=DETALLE_PREFIJO)
+    )
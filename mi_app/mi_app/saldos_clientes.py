@@ -0,0 +1,256 @@
+import logging
+import time
+from datetime import datetime, timedelta
+
+from mi_app.mi_app.cache_compartido import leer_marca, tocar_marca
+from mi_app.mi_app.extensions import supabase
+
+# -----------------------------------------------------------------------------
+# Libro diario de saldos por cliente (tabla saldos_clientes_diarios)
+# Ver scripts/CREAR_SALDOS_CLIENTES_DIARIOS.sql
+# Si un delta no se puede aplicar, el libro queda marcado como pendiente de
+# reparación (marca compartida entre procesos) hasta que se reconstruye desde
+# Admin > Configuración Inicial (reparar_saldos_clientes).
+# -----------------------------------------------------------------------------
+
+MARCA_PENDIENTE = "saldos_clientes:pendiente"
+MARCA_REPARADO = "saldos_clientes:reparado"
+
+# Códigos de PostgREST/Postgres cuando la función no está instalada
+FUNCION_INEXISTENTE = ("PGRST202", "42883")
+
+# Fecha posterior a cualquier movimiento: saldos_clientes_al entrega el saldo final
+FECHA_FINAL = "9999-12-31"
+
+def fecha_de_registro(fecha_registro):
+    """Extrae la fecha (YYYY-MM-DD) de un fecha_registro ISO de pagos_realizados"""
+    return (fecha_registro or "")[:10]
+
+def _delta(cliente, fecha, clp=0, pagos=0):
+    return {"cliente": cliente, "fecha": (fecha or "")[:10], "clp": float(clp or 0), "pagos": float(pagos or 0)}
+
+def aplicar_deltas_saldo(deltas):
+    """
+    Aplica varios deltas al libro diario en una sola transacción (función
+    aplicar_deltas_saldo_cliente): o se aplican todos o ninguno.
+    Args:
+        deltas: Lista de dicts {cliente, fecha (YYYY-MM-DD), clp, pagos}; se omiten
+                los que no tienen cliente, fecha o monto
+    Returns:
+        bool: True si los deltas se aplicaron
+    """
+    deltas = [_delta(**d) for d in deltas]
+    deltas = [d for d in deltas if d["cliente"] and d["fecha"] and (d["clp"] or d["pagos"])]
+    if not deltas:
+        return False
+    try:
+        try:
+            supabase.rpc("aplicar_deltas_saldo_cliente", {"p_deltas": deltas}).execute()
+        except Exception as e:
+            if getattr(e, "code", None) not in FUNCION_INEXISTENTE:
+                raise
+            logging.warning(f"[SALDOS] aplicar_deltas_saldo_cliente no disponible, se aplican uno por uno: {e}")
+            for d in deltas:
+                supabase.rpc("aplicar_delta_saldo_cliente", {
+                    "p_cliente": d["cliente"],
+                    "p_fecha": d["fecha"],
+                    "p_clp": d["clp"],
+                    "p_pagos": d["pagos"]
+                }).execute()
+        return True
+    except Exception as e:
+        # No interrumpir la operación principal: el libro queda marcado para reconstruirlo
+        logging.error(f"[SALDOS] Error al aplicar deltas {deltas}: {e}")
+        try:
+            tocar_marca(MARCA_PENDIENTE)
+        except Exception as error_marca:
+            logging.error(f"[SALDOS] Error al marcar el libro como pendiente de reparación: {error_marca}")
+        return False
+
+def registrar_delta_saldo(cliente, fecha, clp=0, pagos=0):
+    """
+    Aplica un delta al saldo diario de un cliente y a los acumulados posteriores.
+    Args:
+        cliente: Nombre del cliente
+        fecha: Fecha del movimiento (YYYY-MM-DD)
+        clp: CLP de pedidos a sumar (negativo para revertir)
+        pagos: Monto de pagos a sumar (negativo para revertir)
+    Returns:
+        bool: True si el delta se aplicó
+    """
+    return aplicar_deltas_saldo([_delta(cliente, fecha, clp, pagos)])
+
+def mover_saldo(anterior, nuevo):
+    """
+    Revierte un movimiento y aplica su versión editada en una sola transacción.
+    Args:
+        anterior: dict {cliente, fecha, clp, pagos} del movimiento antes de editar
+        nuevo: dict {cliente, fecha, clp, pagos} después de editar
+    Returns:
+        bool: True si se aplicó
+    """
+    anterior = _delta(**anterior)
+    return aplicar_deltas_saldo([
+        {**anterior, "clp": -anterior["clp"], "pagos": -anterior["pagos"]},
+        _delta(**nuevo)
+    ])
+
+def obtener_deuda_anterior(fecha):
+    """
+    Obtiene la deuda de cada cliente al cierre del día anterior a la fecha.
+    Args:
+        fecha: Fecha de consulta (YYYY-MM-DD)
+    Returns:
+        dict: {cliente: clp acumulado - pagos acumulados}
+    """
+    fecha_anterior = (datetime.strptime(fecha, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+    try:
+        filas = supabase.rpc("saldos_clientes_al", {"p_fecha": fecha_anterior}).execute().data or []
+        return {f["cliente"]: float(f["saldo"] or 0) for f in filas if f.get("cliente")}
+    except Exception as e:
+        logging.warning(f"[SALDOS] saldos_clientes_al no disponible, calculando desde el historial: {e}")
+        return deuda_anterior_desde_historial(fecha_anterior)
+
+def deuda_anterior_desde_historial(fecha_anterior):
+    """
+    Calcula la deuda por cliente hasta fecha_anterior recorriendo todo el historial.
+    Se usa como respaldo si el libro diario no está disponible.
+    """
+    deuda_por_cliente = {}
+    offset = 0
+    limit = 1000
+    while True:
+        pedidos_batch = supabase.table("pedidos").select("cliente, clp").eq("eliminado", False).lte("fecha", fecha_anterior).order("id").range(offset, offset + limit - 1).execute().data or []
+        for p in pedidos_batch:
+            if p.get("cliente") and p.get("clp") is not None:
+                deuda_por_cliente[p["cliente"]] = deuda_por_cliente.get(p["cliente"], 0) + float(p["clp"])
+        offset += limit
+        if len(pedidos_batch) < limit:
+            break
+    offset = 0
+    while True:
+        pagos_batch = supabase.table("pagos_realizados").select("cliente, monto_total").eq("eliminado", False).lte("fecha_registro", fecha_anterior + "T23:59:59").order("id").range(offset, offset + limit - 1).execute().data or []
+        for p in pagos_batch:
+            if p.get("cliente") and p.get("monto_total") is not None:
+                deuda_por_cliente[p["cliente"]] = deuda_por_cliente.get(p["cliente"], 0) - float(p["monto_total"])
+        offset += limit
+        if len(pagos_batch) < limit:
+            break
+    return deuda_por_cliente
+
+def _fila_resumen(cliente):
+    return {
+        "cliente": cliente,
+        "brs": 0,
+        "clp": 0,
+        "pagos": 0,
+        "deuda_anterior": 0,
+        "diferencia": 0
+    }
+
+def obtener_resumen_clientes(fecha_inicio, fecha):
+    """
+    Obtiene el resumen del dashboard por cliente con la función resumen_clientes
+    (ver scripts/CREAR_RESUMEN_CLIENTES.sql): una fila por cliente en vez de
+    todos los pedidos y pagos de la ventana.
+    Args:
+        fecha_inicio: Primer día de la ventana (YYYY-MM-DD); define qué clientes aparecen
+        fecha: Fecha consultada (YYYY-MM-DD)
+    Returns:
+        dict: {cliente: {cliente, brs, clp, pagos, deuda_anterior, diferencia}}
+    """
+    try:
+        filas = supabase.rpc("resumen_clientes", {"p_fecha_inicio": fecha_inicio, "p_fecha": fecha}).execute().data or []
+    except Exception as e:
+        logging.warning(f"[SALDOS] resumen_clientes no disponible, calculando desde pedidos y pagos: {e}")
+        return resumen_clientes_desde_historial(fecha_inicio, fecha)
+
+    resumen = {}
+    for f in filas:
+        if not f.get("cliente"):
+            continue
+        fila = _fila_resumen(f["cliente"])
+        fila["brs"] = float(f.get("brs") or 0)
+        fila["clp"] = float(f.get("clp_hoy") or 0)
+        fila["pagos"] = float(f.get("pagos_hoy") or 0)
+        fila["deuda_anterior"] = float(f.get("saldo_anterior") or 0)
+        fila["diferencia"] = fila["deuda_anterior"] + fila["clp"] - fila["pagos"]
+        resumen[f["cliente"]] = fila
+    return resumen
+
+def resumen_clientes_desde_historial(fecha_inicio, fecha):
+    """
+    Calcula el mismo resumen que resumen_clientes descargando los pedidos y pagos
+    de la ventana. Se usa como respaldo si la función no está instalada.
+    """
+    pedidos = supabase.table("pedidos").select("cliente, fecha, clp, brs").eq("eliminado", False).gte("fecha", fecha_inicio).lte("fecha", fecha).execute().data or []
+    pagos = supabase.table("pagos_realizados").select("cliente, monto_total, fecha_registro").eq("eliminado", False).gte("fecha_registro", fecha_inicio + "T00:00:00").lte("fecha_registro", fecha + "T23:59:59").execute().data or []
+
+    resumen = {}
+    for p in pedidos:
+        if p.get("cliente") and p.get("fecha") and p.get("clp") is not None:
+            fila = resumen.setdefault(p["cliente"], _fila_resumen(p["cliente"]))
+            if p["fecha"] == fecha:
+                fila["brs"] += float(p.get("brs") or 0)
+                fila["clp"] += float(p["clp"])
+    for p in pagos:
+        if p.get("cliente") and p.get("monto_total") is not None:
+            fila = resumen.setdefault(p["cliente"], _fila_resumen(p["cliente"]))
+            if fecha_de_registro(p.get("fecha_registro")) == fecha:
+                fila["pagos"] += float(p["monto_total"])
+
+    deuda_anterior_por_cliente = obtener_deuda_anterior(fecha)
+    for cliente, fila in resumen.items():
+        fila["deuda_anterior"] = deuda_anterior_por_cliente.get(cliente, 0)
+        fila["diferencia"] = fila["deuda_anterior"] + fila["clp"] - fila["pagos"]
+    return resumen
+
+def reconstruir_saldos_clientes():
+    """
+    Reconstruye el libro diario completo desde pedidos y pagos_realizados.
+    Returns:
+        int: Número de filas generadas (o None si falla)
+    """
+    try:
+        return supabase.rpc("reconstruir_saldos_clientes", {}).execute().data
+    except Exception as e:
+        logging.error(f"[SALDOS] Error al reconstruir saldos de clientes: {e}")
+        return None
+
+def _saldos_finales():
+    filas = supabase.rpc("saldos_clientes_al", {"p_fecha": FECHA_FINAL}).execute().data or []
+    return {f["cliente"]: float(f["saldo"] or 0) for f in filas if f.get("cliente")}
+
+def reparacion_pendiente():
+    """True si algún delta falló después de la última reconstrucción del libro"""
+    return leer_marca(MARCA_PENDIENTE) > leer_marca(MARCA_REPARADO)
+
+def reparar_saldos_clientes():
+    """
+    Reconstruye el libro diario y lo compara con el saldo final que tenía cada cliente.
+    Returns:
+        dict: {'filas': filas generadas, 'diferencias': [{cliente, antes, despues}]}
+              o None si la reconstrucción falla
+    """
+    inicio = time.time()
+    try:
+        antes = _saldos_finales()
+    except Exception as e:
+        logging.error(f"[SALDOS] Error al leer los saldos antes de reconstruir: {e}")
+        antes = {}
+    filas = reconstruir_saldos_clientes()
+    if filas is None:
+        return None
+    despues = _saldos_finales()
+
+    diferencias = []
+    for cliente in sorted(set(antes) | set(despues)):
+        saldo_antes, saldo_despues = antes.get(cliente, 0.0), despues.get(cliente, 0.0)
+        if abs(saldo_despues - saldo_antes) >= 0.01:
+            diferencias.append({"cliente": cliente, "antes": saldo_antes, "despues": saldo_despues})
+            logging.warning(f"[SALDOS] Saldo de {cliente} corregido: {saldo_antes:,.2f} -> {saldo_despues:,.2f}")
+    # Un delta fallido durante la reconstrucción mantiene el libro pendiente
+    if leer_marca(MARCA_PENDIENTE) <= inicio:
+        tocar_marca(MARCA_REPARADO)
+    logging.info(f"[SALDOS] Libro reconstruido: {filas} filas, {len(diferencias)} clientes corregidos")
+    return {"filas": filas, "diferencias": diferencias}
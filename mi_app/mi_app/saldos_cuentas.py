@@ -0,0 +1,267 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mi_app.mi_app.consultas_paralelas import consultar_en_paralelo
+from mi_app.mi_app.extensions import supabase
+
+# -----------------------------------------------------------------------------
+# Saldos de cuentas_activas por deltas (tabla movimientos_cuenta)
+# Ver scripts/CREAR_SALDOS_CUENTAS_INCREMENTALES.sql
+# Cada movimiento se inserta o elimina junto con el ajuste de saldo_actual en
+# una función de Postgres (misma transacción), sin releer el historial de la
+# cuenta. La suma completa de movimientos queda como revisión en segundo plano
+# que informa la deriva entre saldo_actual y el historial.
+# -----------------------------------------------------------------------------
+
+# Efecto de cada tipo de movimiento sobre el saldo (mismo criterio que signo_movimiento en SQL)
+SIGNO_MOVIMIENTO = {
+    "COMPRA": 1,
+    "AJUSTE": 1,
+    "AJUSTE_MANUAL": 1,
+    "TRANS_ENTRADA": 1,
+    "PEDIDO": -1,
+    "COMISION_PEDIDO": -1,
+    "COMISION_TRANS": -1,
+    "TRANS_SALIDA": -1,
+}
+
+# Segundos mínimos entre revisiones de una misma cuenta
+REVISAR_CADA = 600
+# Filas por consulta al sumar el historial de una cuenta
+TAMANO_PAGINA = 1000
+
+# Códigos de PostgREST/Postgres cuando la función no está instalada
+FUNCION_INEXISTENTE = ("PGRST202", "42883")
+# Código de Postgres cuando la columna no existe (ultimo_movimiento sin el script)
+COLUMNA_INEXISTENTE = "42703"
+
+_revisiones = ThreadPoolExecutor(max_workers=1, thread_name_prefix="saldos")
+_ultima_revision = {}
+_revision_lock = threading.Lock()
+
+def _funcion_inexistente(error):
+    return getattr(error, "code", None) in FUNCION_INEXISTENTE
+
+def saldo_de_movimientos(movimientos):
+    """Suma los movimientos ({'tipo_movimiento', 'monto_brs'}) con su signo"""
+    return sum(SIGNO_MOVIMIENTO.get(m["tipo_movimiento"], 0) * (m["monto_brs"] or 0) for m in movimientos)
+
+def saldo_desde_historial(cuenta_id):
+    """Saldo de la cuenta sumando todo su historial de movimientos (por páginas)"""
+    movimientos = []
+    while True:
+        pagina = (supabase.table("movimientos_cuenta")
+                  .select("id, tipo_movimiento, monto_brs")
+                  .eq("cuenta_id", cuenta_id)
+                  .order("id")
+                  .range(len(movimientos), len(movimientos) + TAMANO_PAGINA - 1)
+                  .execute().data or [])
+        movimientos.extend(pagina)
+        if len(pagina) < TAMANO_PAGINA:
+            return saldo_de_movimientos(movimientos)
+
+def recalcular_saldo(cuenta_id):
+    """
+    Reemplaza saldo_actual por la suma completa del historial de la cuenta.
+    Returns:
+        Saldo guardado
+    """
+    saldo = saldo_desde_historial(cuenta_id)
+    supabase.table("cuentas_activas").update({"saldo_actual": saldo}).eq("id", cuenta_id).execute()
+    return saldo
+
+def _saldos_desde_movimientos():
+    """
+    Saldo de cada cuenta leyendo todos los movimientos en un solo recorrido por páginas,
+    acumulado por (cuenta_id, tipo_movimiento)
+    """
+    por_tipo = {}
+    leidos = 0
+    while True:
+        pagina = (supabase.table("movimientos_cuenta")
+                  .select("cuenta_id, tipo_movimiento, monto_brs")
+                  .order("id")
+                  .range(leidos, leidos + TAMANO_PAGINA - 1)
+                  .execute().data or [])
+        for m in pagina:
+            clave = (m["cuenta_id"], m["tipo_movimiento"])
+            por_tipo[clave] = por_tipo.get(clave, 0) + (m["monto_brs"] or 0)
+        leidos += len(pagina)
+        if len(pagina) < TAMANO_PAGINA:
+            break
+    saldos = {}
+    for (cuenta, tipo), total in por_tipo.items():
+        saldos[cuenta] = saldos.get(cuenta, 0) + SIGNO_MOVIMIENTO.get(tipo, 0) * total
+    return saldos
+
+def recalcular_saldos_cuentas():
+    """
+    Recalcula saldo_actual de todas las cuentas activas desde sus movimientos.
+    Returns:
+        list: [{'cuenta_id', 'nombre_titular', 'saldo_antes', 'saldo_despues'}] por cuenta
+    """
+    try:
+        filas = supabase.rpc("recalcular_saldos_cuentas", {}).execute().data or []
+        return [{
+            "cuenta_id": f["cuenta_id"],
+            "nombre_titular": f.get("nombre_titular"),
+            "saldo_antes": float(f["saldo_antes"] or 0),
+            "saldo_despues": float(f["saldo_despues"] or 0)
+        } for f in filas]
+    except Exception as e:
+        if not _funcion_inexistente(e):
+            raise
+        logging.warning(f"[SALDOS] recalcular_saldos_cuentas no disponible, se suma en Python: {e}")
+
+    cuentas = (supabase.table("cuentas_activas").select("id, nombre_titular, saldo_actual")
+               .eq("activa", True).order("nombre_titular").execute().data or [])
+    saldos = _saldos_desde_movimientos()
+    resultado = []
+    for cuenta in cuentas:
+        antes = float(cuenta.get("saldo_actual") or 0)
+        despues = float(saldos.get(cuenta["id"], 0))
+        if despues != antes:
+            # Sin la función solo se escriben las cuentas que cambiaron
+            supabase.table("cuentas_activas").update({"saldo_actual": despues}).eq("id", cuenta["id"]).execute()
+        resultado.append({
+            "cuenta_id": cuenta["id"],
+            "nombre_titular": cuenta.get("nombre_titular"),
+            "saldo_antes": antes,
+            "saldo_despues": despues
+        })
+    return resultado
+
+def insertar_movimiento(movimiento):
+    """
+    Inserta un movimiento y aplica su efecto a saldo_actual en una sola transacción.
+    Args:
+        movimiento: dict con cuenta_id, tipo_movimiento, monto_brs, referencia_id,
+                    referencia_tipo, usuario, descripcion y fecha
+    Returns:
+        dict: Fila insertada (None si no se insertó)
+    """
+    try:
+        filas = supabase.rpc("registrar_movimiento_con_saldo", {"p_movimiento": movimiento}).execute().data or []
+        fila = filas[0] if filas else None
+    except Exception as e:
+        # Solo sin la función se repite la inserción; otro error puede haber insertado ya
+        if not _funcion_inexistente(e):
+            raise
+        logging.warning(f"[SALDOS] registrar_movimiento_con_saldo no disponible, se recalcula la cuenta: {e}")
+        result = supabase.table("movimientos_cuenta").insert(movimiento).execute()
+        fila = result.data[0] if result.data else None
+        if fila:
+            recalcular_saldo(movimiento["cuenta_id"])
+    if fila:
+        programar_revision(movimiento["cuenta_id"])
+    return fila
+
+def eliminar_movimientos(referencia_id, referencia_tipo, cuenta_id=None, tipo_movimiento=None):
+    """
+    Elimina los movimientos de una referencia y revierte su efecto en saldo_actual
+    en una sola transacción.
+    Args:
+        referencia_id: ID del pedido o compra
+        referencia_tipo: 'pedido', 'compra'
+        cuenta_id: Limitar a una cuenta (None = todas)
+        tipo_movimiento: Limitar a un tipo (None = todos)
+    Returns:
+        dict: {cuenta_id: delta aplicado al saldo}
+    """
+    try:
+        filas = supabase.rpc("eliminar_movimientos_con_saldo", {
+            "p_referencia_id": referencia_id,
+            "p_referencia_tipo": referencia_tipo,
+            "p_cuenta_id": cuenta_id,
+            "p_tipo_movimiento": tipo_movimiento
+        }).execute().data or []
+        deltas = {f["cuenta_id"]: float(f["delta"] or 0) for f in filas}
+    except Exception as e:
+        if not _funcion_inexistente(e):
+            raise
+        logging.warning(f"[SALDOS] eliminar_movimientos_con_saldo no disponible, se recalculan las cuentas: {e}")
+        query = (supabase.table("movimientos_cuenta").select("id, cuenta_id, tipo_movimiento, monto_brs")
+                 .eq("referencia_id", referencia_id).eq("referencia_tipo", referencia_tipo))
+        if cuenta_id is not None:
+            query = query.eq("cuenta_id", cuenta_id)
+        if tipo_movimiento is not None:
+            query = query.eq("tipo_movimiento", tipo_movimiento)
+        movimientos = query.execute().data or []
+        deltas = {}
+        for m in movimientos:
+            supabase.table("movimientos_cuenta").delete().eq("id", m["id"]).execute()
+            deltas[m["cuenta_id"]] = deltas.get(m["cuenta_id"], 0) - saldo_de_movimientos([m])
+        for cuenta in deltas:
+            recalcular_saldo(cuenta)
+    for cuenta in deltas:
+        programar_revision(cuenta)
+    return deltas
+
+def revisar_saldo(cuenta_id):
+    """
+    Compara saldo_actual con la suma del historial e informa la deriva (no la corrige:
+    para eso está recalcular_saldos en flujo de caja).
+    Returns:
+        Deriva (saldo_actual - historial), 0 si coincide o None si la cuenta cambió durante la revisión
+    """
+    def leer_saldo():
+        filas = supabase.table("cuentas_activas").select("saldo_actual").eq("id", cuenta_id).execute().data
+        return float(filas[0].get("saldo_actual") or 0) if filas else 0.0
+
+    antes = leer_saldo()
+    historial = saldo_desde_historial(cuenta_id)
+    if leer_saldo() != antes:
+        # Un movimiento entró durante la revisión: se revisará en la próxima
+        return None
+    deriva = antes - historial
+    if abs(deriva) >= 0.5:
+        logging.warning(f"[SALDOS] Deriva en cuenta {cuenta_id}: saldo_actual={antes}, movimientos={historial}, diferencia={deriva}")
+    return deriva
+
+def _revisar(cuenta_id):
+    try:
+        revisar_saldo(cuenta_id)
+    except Exception as e:
+        logging.error(f"[SALDOS] Error al revisar el saldo de la cuenta {cuenta_id}: {e}")
+
+def programar_revision(cuenta_id):
+    """Revisa la cuenta en segundo plano, a lo más una vez cada REVISAR_CADA segundos"""
+    ahora = time.monotonic()
+    # El id llega como texto desde los formularios y como número desde la base
+    clave = str(cuenta_id)
+    with _revision_lock:
+        if clave in _ultima_revision and ahora - _ultima_revision[clave] < REVISAR_CADA:
+            return
+        _ultima_revision[clave] = ahora
+    _revisiones.submit(_revisar, cuenta_id)
+
+def cuentas_con_ultimo_movimiento():
+    """
+    Cuentas activas con su saldo y la fecha de su último movimiento
+    (ver scripts/CREAR_ULTIMO_MOVIMIENTO_CUENTAS.sql).
+    Returns:
+        list: Cuentas ordenadas por nombre_titular, con 'ultimo_movimiento' (None si no tiene)
+    """
+    campos = "id, numero_cuenta, nombre_titular, saldo_actual"
+    try:
+        return (supabase.table("cuentas_activas").select(f"{campos}, ultimo_movimiento")
+                .eq("activa", True).order("nombre_titular").execute().data or [])
+    except Exception as e:
+        if getattr(e, "code", None) != COLUMNA_INEXISTENTE:
+            raise
+        logging.warning(f"[SALDOS] cuentas_activas.ultimo_movimiento no disponible, se consulta por cuenta: {e}")
+
+    cuentas = (supabase.table("cuentas_activas").select(campos)
+               .eq("activa", True).order("nombre_titular").execute().data or [])
+    # Sin la columna: una fila por cuenta (la más reciente) en lugar de todo el historial
+    ultimos = consultar_en_paralelo({
+        cuenta["id"]: supabase.table("movimientos_cuenta").select("fecha")
+                      .eq("cuenta_id", cuenta["id"]).order("fecha", desc=True).limit(1)
+        for cuenta in cuentas
+    }, etiqueta="ULTIMO_MOVIMIENTO", tolerar_errores=True)
+    for cuenta in cuentas:
+        respuesta = ultimos.get(cuenta["id"])
+        cuenta["ultimo_movimiento"] = respuesta.data[0]["fecha"] if respuesta and respuesta.data else None
+    return cuentas
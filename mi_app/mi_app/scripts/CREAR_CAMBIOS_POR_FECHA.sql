@@ -0,0 +1,109 @@
+-- Script para crear las marcas de cambio por fecha del flujo de capital
+-- Ejecutar en Supabase SQL Editor
+--
+-- Triggers en pedidos, compras y stock_diario registran en cambios_por_fecha
+-- cuándo cambió cada día (cambiado_en). El recálculo del flujo de capital
+-- (recalculo_flujo.py) guarda en recalculado_en la marca que leyó, así que un
+-- cambio ocurrido durante el recálculo sigue pendiente. La página de flujo de
+-- capital revisa todo su rango con una consulta a flujo_fechas_pendientes y
+-- recalcula solo esos días, en lugar de una consulta a pedidos por día.
+
+CREATE TABLE IF NOT EXISTS cambios_por_fecha (
+    fecha DATE PRIMARY KEY,
+    cambiado_en TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    recalculado_en TIMESTAMP WITH TIME ZONE
+);
+
+COMMENT ON TABLE cambios_por_fecha IS 'Último cambio de pedidos/compras/stock_diario por fecha y último recálculo del flujo de capital';
+
+-- Registra un cambio del día (una sola escritura por fecha y transacción)
+CREATE OR REPLACE FUNCTION marcar_cambio_fecha(p_fecha DATE)
+RETURNS VOID AS $$
+    INSERT INTO cambios_por_fecha (fecha, cambiado_en)
+    VALUES (p_fecha, NOW())
+    ON CONFLICT (fecha) DO UPDATE
+       SET cambiado_en = EXCLUDED.cambiado_en
+     WHERE cambios_por_fecha.cambiado_en < EXCLUDED.cambiado_en;
+$$ LANGUAGE sql;
+
+-- pedidos: fecha del pedido (la anterior y la nueva si cambia)
+CREATE OR REPLACE FUNCTION trg_cambio_fecha_pedidos()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM marcar_cambio_fecha(OLD.fecha::date);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND (TG_OP = 'INSERT' OR NEW.fecha IS DISTINCT FROM OLD.fecha) THEN
+        PERFORM marcar_cambio_fecha(NEW.fecha::date);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_cambio_fecha_pedidos ON pedidos;
+CREATE TRIGGER trg_cambio_fecha_pedidos
+    AFTER INSERT OR UPDATE OR DELETE ON pedidos
+    FOR EACH ROW EXECUTE FUNCTION trg_cambio_fecha_pedidos();
+
+-- compras: día de createtime (incluye las órdenes que sube binance_updater_always)
+CREATE OR REPLACE FUNCTION trg_cambio_fecha_compras()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM marcar_cambio_fecha(OLD.createtime::date);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND (TG_OP = 'INSERT' OR NEW.createtime::date IS DISTINCT FROM OLD.createtime::date) THEN
+        PERFORM marcar_cambio_fecha(NEW.createtime::date);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_cambio_fecha_compras ON compras;
+CREATE TRIGGER trg_cambio_fecha_compras
+    AFTER INSERT OR UPDATE OR DELETE ON compras
+    FOR EACH ROW EXECUTE FUNCTION trg_cambio_fecha_compras();
+
+-- stock_diario: gastos y saldos del día
+CREATE OR REPLACE FUNCTION trg_cambio_fecha_stock_diario()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM marcar_cambio_fecha(OLD.fecha::date);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND (TG_OP = 'INSERT' OR NEW.fecha IS DISTINCT FROM OLD.fecha) THEN
+        PERFORM marcar_cambio_fecha(NEW.fecha::date);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_cambio_fecha_stock_diario ON stock_diario;
+CREATE TRIGGER trg_cambio_fecha_stock_diario
+    AFTER INSERT OR UPDATE OR DELETE ON stock_diario
+    FOR EACH ROW EXECUTE FUNCTION trg_cambio_fecha_stock_diario();
+
+-- Días con cambios posteriores al último recálculo
+CREATE OR REPLACE VIEW flujo_fechas_pendientes AS
+SELECT fecha, cambiado_en, recalculado_en
+  FROM cambios_por_fecha
+ WHERE recalculado_en IS NULL
+    OR cambiado_en > recalculado_en;
+
+-- Marca los días como recalculados hasta la marca leída (nunca retrocede)
+CREATE OR REPLACE FUNCTION marcar_flujo_recalculado(p_fechas DATE[], p_marcas TIMESTAMP WITH TIME ZONE[])
+RETURNS VOID AS $$
+    UPDATE cambios_por_fecha c
+       SET recalculado_en = GREATEST(COALESCE(c.recalculado_en, m.marca), m.marca)
+      FROM unnest(p_fechas, p_marcas) AS m(fecha, marca)
+     WHERE c.fecha = m.fecha;
+$$ LANGUAGE sql;
+
+-- Carga inicial: los días ya existentes en flujo_capital quedan al día
+INSERT INTO cambios_por_fecha (fecha, cambiado_en, recalculado_en)
+SELECT fecha, NOW(), NOW()
+  FROM flujo_capital
+ON CONFLICT (fecha) DO NOTHING;
+
+-- Verificar: días pendientes de recálculo
+SELECT * FROM flujo_fechas_pendientes ORDER BY fecha DESC LIMIT 20;
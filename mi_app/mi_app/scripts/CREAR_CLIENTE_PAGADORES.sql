@@ -0,0 +1,88 @@
+-- Script para crear la tabla normalizada de pagadores por cliente y migrar
+-- los RUT de las columnas pagador1..pagador200 de la tabla pagadores
+-- Ejecutar en Supabase SQL Editor (una sola vez; se puede repetir sin duplicar)
+--
+-- La tabla pagadores se mantiene: pedidos, pagos y transferencias leen de ella
+-- la lista de clientes. Las columnas pagadorN dejan de usarse desde la app.
+-- Si alguna función o trigger de la base lee pagadorN, debe pasar a leer cliente_pagadores.
+
+CREATE TABLE IF NOT EXISTS cliente_pagadores (
+    id BIGSERIAL PRIMARY KEY,
+    cliente TEXT NOT NULL,
+    rut TEXT NOT NULL,
+    creado_en TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE (cliente, rut)
+);
+
+-- Búsqueda de cliente por RUT (una consulta indexada)
+CREATE INDEX IF NOT EXISTS idx_cliente_pagadores_rut ON cliente_pagadores(rut);
+
+COMMENT ON TABLE cliente_pagadores IS 'RUT de pagadores autorizados por cliente (reemplaza pagadores.pagador1..pagador200)';
+COMMENT ON COLUMN cliente_pagadores.rut IS 'RUT normalizado: número sin puntos, guion y dígito verificador en mayúscula';
+
+-- El trigger de validación (más abajo) se crea después de migrar: al repetir el
+-- script, un RUT que ya estaba en dos clientes haría fallar la migración
+DROP TRIGGER IF EXISTS trg_validar_rut_cliente_pagadores ON cliente_pagadores;
+
+-- Migración desde las columnas anchas (se omiten vacíos y 'EMPTY')
+INSERT INTO cliente_pagadores (cliente, rut)
+SELECT cliente, rut
+  FROM (
+        SELECT p.cliente,
+               UPPER(REPLACE(TRIM(c.value), '.', '')) AS rut,
+               MIN(SUBSTRING(c.key FROM 8)::INTEGER) AS posicion
+          FROM pagadores p
+         CROSS JOIN LATERAL jsonb_each_text(to_jsonb(p)) c
+         WHERE c.key ~ '^pagador[0-9]+$'
+           AND p.cliente IS NOT NULL
+           AND c.value IS NOT NULL
+           AND TRIM(c.value) NOT IN ('', 'EMPTY')
+         GROUP BY p.cliente, UPPER(REPLACE(TRIM(c.value), '.', ''))
+       ) migrados
+ ORDER BY cliente, posicion
+ON CONFLICT (cliente, rut) DO NOTHING;
+
+-- Cantidad de pagadores por cliente (listado de clientes)
+CREATE OR REPLACE VIEW cliente_pagadores_conteo AS
+SELECT cliente, COUNT(*) AS total_pagadores
+  FROM cliente_pagadores
+ GROUP BY cliente;
+
+-- Un RUT no puede quedar asociado a dos clientes (misma regla que en pagadores)
+CREATE OR REPLACE FUNCTION validar_rut_cliente_pagadores()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_otro_cliente TEXT;
+BEGIN
+    -- El mismo (cliente, rut) ya existe: lo resuelve ON CONFLICT o la restricción UNIQUE
+    IF EXISTS (SELECT 1 FROM cliente_pagadores
+                WHERE rut = NEW.rut AND cliente = NEW.cliente AND id <> NEW.id) THEN
+        RETURN NEW;
+    END IF;
+    SELECT cliente INTO v_otro_cliente
+      FROM cliente_pagadores
+     WHERE rut = NEW.rut AND cliente <> NEW.cliente AND id <> NEW.id
+     LIMIT 1;
+    IF v_otro_cliente IS NOT NULL THEN
+        RAISE EXCEPTION 'El RUT % ya está asociado al cliente %', NEW.rut, v_otro_cliente;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_validar_rut_cliente_pagadores ON cliente_pagadores;
+CREATE TRIGGER trg_validar_rut_cliente_pagadores
+    BEFORE INSERT OR UPDATE OF rut, cliente ON cliente_pagadores
+    FOR EACH ROW EXECUTE FUNCTION validar_rut_cliente_pagadores();
+
+-- RUT que ya estaban en más de un cliente antes de la migración (revisar a mano)
+SELECT rut, STRING_AGG(cliente, ', ' ORDER BY cliente) AS clientes
+FROM cliente_pagadores
+GROUP BY rut
+HAVING COUNT(*) > 1;
+
+-- Verificar la migración
+SELECT cliente, total_pagadores
+FROM cliente_pagadores_conteo
+ORDER BY total_pagadores DESC
+LIMIT 20;
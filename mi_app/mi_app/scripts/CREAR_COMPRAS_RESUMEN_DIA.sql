@@ -0,0 +1,72 @@
+-- Script para crear la función de totales diarios de compras
+-- Ejecutar en Supabase SQL Editor
+--
+-- Devuelve en una sola fila los totales de la tabla compras del día que usan
+-- margen.index, la actualización del flujo de capital, cierre.index y
+-- admin.tasa_actual (ver compras_del_dia en totales_diarios.py), en lugar de
+-- descargar las órdenes VES SELL, CLP BUY y CLP SELL y sumarlas en Python.
+-- Mismo rango que las consultas anteriores: createtime entre 00:00:00 y 23:59:59.
+
+CREATE OR REPLACE FUNCTION compras_resumen_dia(p_fecha DATE)
+RETURNS TABLE (
+    brs_comprados NUMERIC,
+    usdt_vendidos NUMERIC,
+    usdt_comprados NUMERIC,
+    clp_invertidos NUMERIC,
+    valor_clp_compras NUMERIC,
+    usdt_vendidos_clp NUMERIC,
+    clp_recibidos_usdt NUMERIC
+) AS $$
+    SELECT COALESCE(SUM(c.totalprice::numeric) FILTER (WHERE c.fiat = 'VES' AND c.tradetype = 'SELL'), 0),
+           COALESCE(SUM(COALESCE(c.amount::numeric, 0) + COALESCE(c.commission::numeric, 0))
+                        FILTER (WHERE c.fiat = 'VES' AND c.tradetype = 'SELL'), 0),
+           COALESCE(SUM(c.costo_real::numeric) FILTER (WHERE c.fiat = 'CLP' AND c.tradetype = 'BUY'), 0),
+           COALESCE(SUM(c.totalprice::numeric) FILTER (WHERE c.fiat = 'CLP' AND c.tradetype = 'BUY'), 0),
+           COALESCE(SUM(c.costo_real::numeric * c.unitprice::numeric) FILTER (WHERE c.fiat = 'CLP' AND c.tradetype = 'BUY'), 0),
+           COALESCE(SUM(c.amount::numeric) FILTER (WHERE c.fiat = 'CLP' AND c.tradetype = 'SELL'), 0),
+           COALESCE(SUM(c.totalprice::numeric) FILTER (WHERE c.fiat = 'CLP' AND c.tradetype = 'SELL'), 0)
+      FROM compras c
+     WHERE c.createtime >= p_fecha::timestamp
+       AND c.createtime <= p_fecha::timestamp + INTERVAL '23:59:59';
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION compras_resumen_dia(DATE) IS 'Totales diarios de compras: VES SELL, CLP BUY (con valor CLP) y CLP SELL';
+
+-- Índice por fecha de creación para la función (el día se lee por rango)
+CREATE INDEX IF NOT EXISTS idx_compras_createtime_fiat_tradetype ON compras(createtime, fiat, tradetype);
+
+-- Verificar con la fecha de hoy
+SELECT * FROM compras_resumen_dia(CURRENT_DATE);
+
+-- Mismos totales por día para un rango de fechas (recálculo del flujo de capital,
+-- ver recalculo_flujo.py): una fila por día con compras
+CREATE OR REPLACE FUNCTION compras_resumen_rango(p_desde DATE, p_hasta DATE)
+RETURNS TABLE (
+    fecha DATE,
+    brs_comprados NUMERIC,
+    usdt_vendidos NUMERIC,
+    usdt_comprados NUMERIC,
+    clp_invertidos NUMERIC,
+    valor_clp_compras NUMERIC,
+    usdt_vendidos_clp NUMERIC,
+    clp_recibidos_usdt NUMERIC
+) AS $$
+    SELECT c.createtime::date,
+           COALESCE(SUM(c.totalprice::numeric) FILTER (WHERE c.fiat = 'VES' AND c.tradetype = 'SELL'), 0),
+           COALESCE(SUM(COALESCE(c.amount::numeric, 0) + COALESCE(c.commission::numeric, 0))
+                        FILTER (WHERE c.fiat = 'VES' AND c.tradetype = 'SELL'), 0),
+           COALESCE(SUM(c.costo_real::numeric) FILTER (WHERE c.fiat = 'CLP' AND c.tradetype = 'BUY'), 0),
+           COALESCE(SUM(c.totalprice::numeric) FILTER (WHERE c.fiat = 'CLP' AND c.tradetype = 'BUY'), 0),
+           COALESCE(SUM(c.costo_real::numeric * c.unitprice::numeric) FILTER (WHERE c.fiat = 'CLP' AND c.tradetype = 'BUY'), 0),
+           COALESCE(SUM(c.amount::numeric) FILTER (WHERE c.fiat = 'CLP' AND c.tradetype = 'SELL'), 0),
+           COALESCE(SUM(c.totalprice::numeric) FILTER (WHERE c.fiat = 'CLP' AND c.tradetype = 'SELL'), 0)
+      FROM compras c
+     WHERE c.createtime >= p_desde::timestamp
+       AND c.createtime <= p_hasta::timestamp + INTERVAL '23:59:59'
+     GROUP BY c.createtime::date
+     ORDER BY c.createtime::date;
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION compras_resumen_rango(DATE, DATE) IS 'compras_resumen_dia para cada día del rango';
+
+SELECT * FROM compras_resumen_rango(CURRENT_DATE - 7, CURRENT_DATE);
@@ -0,0 +1,29 @@
+-- Script para crear el catálogo de empresas de transferencias
+-- Ejecutar en Supabase SQL Editor
+--
+-- transferencias.index lo usa para el filtro de empresas (cacheado con TTL)
+-- en lugar de leer la columna empresa de toda la tabla.
+
+-- Índice por empresa: cada empresa distinta se obtiene con un salto en el índice
+CREATE INDEX IF NOT EXISTS idx_transferencias_empresa ON transferencias(empresa);
+
+-- Empresas distintas con un recorrido "skip scan" (una búsqueda en el índice por empresa,
+-- no una lectura de todas las filas)
+CREATE OR REPLACE FUNCTION empresas_transferencias()
+RETURNS TABLE (empresa TEXT) AS $$
+    WITH RECURSIVE distintas AS (
+        (SELECT t.empresa FROM transferencias t WHERE t.empresa IS NOT NULL ORDER BY t.empresa LIMIT 1)
+        UNION ALL
+        SELECT (SELECT t.empresa FROM transferencias t
+                 WHERE t.empresa > d.empresa
+                 ORDER BY t.empresa LIMIT 1)
+          FROM distintas d
+         WHERE d.empresa IS NOT NULL
+    )
+    SELECT empresa FROM distintas WHERE empresa IS NOT NULL;
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION empresas_transferencias() IS 'Empresas distintas de transferencias, ordenadas (catálogo del filtro del listado)';
+
+-- Verificar el catálogo
+SELECT * FROM empresas_transferencias();
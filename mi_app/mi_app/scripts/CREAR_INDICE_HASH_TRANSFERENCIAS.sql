@@ -0,0 +1,27 @@
+-- Script para asegurar los índices de deduplicación de transferencias (hash y fecha)
+-- Ejecutar en Supabase SQL Editor
+--
+-- La carga de BCI y Santander inserta en lotes con upsert on_conflict=hash,
+-- que requiere una restricción o índice único sobre la columna hash.
+
+-- Revisar si hay hashes repetidos antes de crear el índice (debe devolver 0 filas)
+SELECT hash, COUNT(*) AS repeticiones
+FROM transferencias
+WHERE hash IS NOT NULL
+GROUP BY hash
+HAVING COUNT(*) > 1
+ORDER BY repeticiones DESC;
+
+-- Crear índice único para la deduplicación por hash
+CREATE UNIQUE INDEX IF NOT EXISTS idx_transferencias_hash_unico ON transferencias(hash);
+
+-- Índice por fecha: la deduplicación solo consulta los hashes del rango de fechas del archivo
+CREATE INDEX IF NOT EXISTS idx_transferencias_fecha ON transferencias(fecha);
+
+COMMENT ON INDEX idx_transferencias_hash_unico IS 'Evita transferencias duplicadas en la carga de cartolas (upsert on_conflict=hash)';
+
+-- Verificar que los índices existen
+SELECT indexname, indexdef
+FROM pg_indexes
+WHERE tablename = 'transferencias'
+AND indexname IN ('idx_transferencias_hash_unico', 'idx_transferencias_fecha');
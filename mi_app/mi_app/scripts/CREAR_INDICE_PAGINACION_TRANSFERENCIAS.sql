@@ -0,0 +1,16 @@
+-- Script para crear el índice de la paginación por cursor del listado de transferencias
+-- Ejecutar en Supabase SQL Editor
+--
+-- transferencias.index lee cada página desde la última fila mostrada
+-- (fecha_detec, id) en lugar de saltar offset filas; con este índice
+-- la página N cuesta lo mismo que la primera.
+
+CREATE INDEX IF NOT EXISTS idx_transferencias_fecha_detec_id ON transferencias(fecha_detec DESC, id DESC);
+
+COMMENT ON INDEX idx_transferencias_fecha_detec_id IS 'Paginación por cursor (fecha_detec, id) del listado de transferencias';
+
+-- Verificar que el índice existe
+SELECT indexname, indexdef
+FROM pg_indexes
+WHERE tablename = 'transferencias'
+AND indexname = 'idx_transferencias_fecha_detec_id';
@@ -0,0 +1,19 @@
+-- Script para crear el índice de asignaciones por transferencia
+-- Ejecutar en Supabase SQL Editor
+--
+-- transferencias.index consulta solo las asignaciones de las transferencias
+-- de la página (transferencia_id IN (...)) y asignar_pago revisa si la
+-- transferencia ya tiene pago; ambas búsquedas usan este índice.
+
+CREATE INDEX IF NOT EXISTS idx_transferencias_pagos_transferencia ON transferencias_pagos(transferencia_id);
+
+-- Índice por pago: pagos.eliminar borra la relación por pago_id
+CREATE INDEX IF NOT EXISTS idx_transferencias_pagos_pago ON transferencias_pagos(pago_id);
+
+COMMENT ON INDEX idx_transferencias_pagos_transferencia IS 'Marca de asignado en el listado de transferencias (solo ids de la página)';
+
+-- Verificar que los índices existen
+SELECT indexname, indexdef
+FROM pg_indexes
+WHERE tablename = 'transferencias_pagos'
+AND indexname IN ('idx_transferencias_pagos_transferencia', 'idx_transferencias_pagos_pago');
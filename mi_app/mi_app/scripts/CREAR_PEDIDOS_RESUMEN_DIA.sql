@@ -0,0 +1,61 @@
+-- Script para crear la función de totales diarios de pedidos (DETAL y mayor)
+-- Ejecutar en Supabase SQL Editor
+--
+-- Devuelve en una sola fila los BRS y CLP de los pedidos no eliminados del día,
+-- separados entre el cliente DETAL y el resto (mayor). La usan margen.index,
+-- la actualización del flujo de capital y cierre.index (ver totales_diarios.py)
+-- en lugar de cuatro consultas a pedidos por fecha.
+
+CREATE OR REPLACE FUNCTION pedidos_resumen_dia(p_fecha DATE)
+RETURNS TABLE (
+    brs_total NUMERIC,
+    clp_total NUMERIC,
+    brs_detal NUMERIC,
+    clp_detal NUMERIC,
+    cantidad BIGINT
+) AS $$
+    SELECT COALESCE(SUM(p.brs::numeric), 0),
+           COALESCE(SUM(p.clp::numeric), 0),
+           COALESCE(SUM(p.brs::numeric) FILTER (WHERE p.cliente = 'DETAL'), 0),
+           COALESCE(SUM(p.clp::numeric) FILTER (WHERE p.cliente = 'DETAL'), 0),
+           COUNT(*)
+      FROM pedidos p
+     WHERE p.fecha = p_fecha
+       AND p.eliminado = FALSE;
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION pedidos_resumen_dia(DATE) IS 'Totales BRS/CLP de pedidos del día, DETAL y total (mayor = total - DETAL)';
+
+-- Índice por fecha para la función (y los listados de pedidos por día)
+CREATE INDEX IF NOT EXISTS idx_pedidos_fecha_eliminado ON pedidos(fecha, eliminado);
+
+-- Verificar con la fecha de hoy
+SELECT * FROM pedidos_resumen_dia(CURRENT_DATE);
+
+-- Mismos totales por día para un rango de fechas (recálculo del flujo de capital,
+-- ver recalculo_flujo.py): una fila por día con pedidos
+CREATE OR REPLACE FUNCTION pedidos_resumen_rango(p_desde DATE, p_hasta DATE)
+RETURNS TABLE (
+    fecha DATE,
+    brs_total NUMERIC,
+    clp_total NUMERIC,
+    brs_detal NUMERIC,
+    clp_detal NUMERIC,
+    cantidad BIGINT
+) AS $$
+    SELECT p.fecha,
+           COALESCE(SUM(p.brs::numeric), 0),
+           COALESCE(SUM(p.clp::numeric), 0),
+           COALESCE(SUM(p.brs::numeric) FILTER (WHERE p.cliente = 'DETAL'), 0),
+           COALESCE(SUM(p.clp::numeric) FILTER (WHERE p.cliente = 'DETAL'), 0),
+           COUNT(*)
+      FROM pedidos p
+     WHERE p.fecha BETWEEN p_desde AND p_hasta
+       AND p.eliminado = FALSE
+     GROUP BY p.fecha
+     ORDER BY p.fecha;
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION pedidos_resumen_rango(DATE, DATE) IS 'pedidos_resumen_dia para cada día del rango';
+
+SELECT * FROM pedidos_resumen_rango(CURRENT_DATE - 7, CURRENT_DATE);
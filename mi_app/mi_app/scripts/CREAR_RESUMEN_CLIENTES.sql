@@ -0,0 +1,67 @@
+-- Script para crear la función de resumen diario por cliente del dashboard
+-- Ejecutar en Supabase SQL Editor (requiere CREAR_SALDOS_CLIENTES_DIARIOS.sql)
+--
+-- Devuelve una fila por cliente con movimientos entre p_fecha_inicio y p_fecha:
+-- BRS y CLP de pedidos del día p_fecha, pagos registrados ese día y el saldo
+-- al cierre del día anterior (libro saldos_clientes_diarios).
+-- Reemplaza la descarga de todos los pedidos y pagos de la ventana al dashboard.
+
+CREATE OR REPLACE FUNCTION resumen_clientes(
+    p_fecha_inicio DATE,
+    p_fecha DATE
+)
+RETURNS TABLE (
+    cliente TEXT,
+    brs NUMERIC,
+    clp_hoy NUMERIC,
+    pagos_hoy NUMERIC,
+    saldo_anterior NUMERIC
+) AS $$
+    WITH pedidos_ventana AS (
+        SELECT p.cliente,
+               SUM(CASE WHEN p.fecha::date = p_fecha THEN COALESCE(p.brs, 0) ELSE 0 END)::numeric AS brs,
+               SUM(CASE WHEN p.fecha::date = p_fecha THEN p.clp ELSE 0 END)::numeric AS clp_hoy
+          FROM pedidos p
+         WHERE p.eliminado = FALSE
+           AND p.cliente IS NOT NULL
+           AND p.clp IS NOT NULL
+           AND p.fecha::date BETWEEN p_fecha_inicio AND p_fecha
+         GROUP BY p.cliente
+    ),
+    pagos_ventana AS (
+        SELECT pr.cliente,
+               SUM(CASE WHEN pr.fecha_registro::date = p_fecha THEN pr.monto_total ELSE 0 END)::numeric AS pagos_hoy
+          FROM pagos_realizados pr
+         WHERE pr.eliminado = FALSE
+           AND pr.cliente IS NOT NULL
+           AND pr.monto_total IS NOT NULL
+           AND pr.fecha_registro::date BETWEEN p_fecha_inicio AND p_fecha
+         GROUP BY pr.cliente
+    ),
+    clientes AS (
+        SELECT pv.cliente FROM pedidos_ventana pv
+        UNION
+        SELECT pg.cliente FROM pagos_ventana pg
+    )
+    SELECT c.cliente,
+           COALESCE(pv.brs, 0) AS brs,
+           COALESCE(pv.clp_hoy, 0) AS clp_hoy,
+           COALESCE(pg.pagos_hoy, 0) AS pagos_hoy,
+           COALESCE(s.saldo, 0) AS saldo_anterior
+      FROM clientes c
+      LEFT JOIN pedidos_ventana pv ON pv.cliente = c.cliente
+      LEFT JOIN pagos_ventana pg ON pg.cliente = c.cliente
+      LEFT JOIN saldos_clientes_al(p_fecha - 1) s ON s.cliente = c.cliente
+     ORDER BY c.cliente;
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION resumen_clientes(DATE, DATE) IS 'Resumen del dashboard: BRS, CLP y pagos del día más saldo anterior, una fila por cliente con movimientos en la ventana';
+
+-- Índices para filtrar la ventana de fechas
+CREATE INDEX IF NOT EXISTS idx_pedidos_fecha_cliente ON pedidos(fecha, cliente) WHERE eliminado = FALSE;
+CREATE INDEX IF NOT EXISTS idx_pagos_realizados_fecha_registro ON pagos_realizados(fecha_registro) WHERE eliminado = FALSE;
+
+-- Verificar el resultado
+SELECT *
+FROM resumen_clientes(CURRENT_DATE - 30, CURRENT_DATE)
+LIMIT 20;
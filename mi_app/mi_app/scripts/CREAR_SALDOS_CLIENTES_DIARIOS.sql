@@ -0,0 +1,155 @@
+-- Script para crear el libro diario de saldos por cliente
+-- Ejecutar en Supabase SQL Editor
+--
+-- Cada fila guarda los totales de un cliente para un día y los acumulados
+-- históricos hasta ese día inclusive. La deuda anterior de una fecha es
+-- clp_acumulado - pagos_acumulado de la última fila anterior a esa fecha.
+
+CREATE TABLE IF NOT EXISTS saldos_clientes_diarios (
+    cliente TEXT NOT NULL,
+    fecha DATE NOT NULL,
+    clp_dia NUMERIC NOT NULL DEFAULT 0,
+    pagos_dia NUMERIC NOT NULL DEFAULT 0,
+    clp_acumulado NUMERIC NOT NULL DEFAULT 0,
+    pagos_acumulado NUMERIC NOT NULL DEFAULT 0,
+    actualizado_en TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (cliente, fecha)
+);
+
+-- Índices para buscar el último saldo por cliente y los saldos de una fecha
+CREATE INDEX IF NOT EXISTS idx_saldos_clientes_diarios_cliente_fecha ON saldos_clientes_diarios(cliente, fecha DESC);
+CREATE INDEX IF NOT EXISTS idx_saldos_clientes_diarios_fecha ON saldos_clientes_diarios(fecha);
+
+COMMENT ON TABLE saldos_clientes_diarios IS 'Saldo diario acumulado por cliente (CLP pedido y pagado)';
+COMMENT ON COLUMN saldos_clientes_diarios.clp_dia IS 'CLP de pedidos no eliminados del día';
+COMMENT ON COLUMN saldos_clientes_diarios.pagos_dia IS 'Pagos no eliminados registrados en el día';
+COMMENT ON COLUMN saldos_clientes_diarios.clp_acumulado IS 'CLP pedido desde el inicio hasta el día inclusive';
+COMMENT ON COLUMN saldos_clientes_diarios.pagos_acumulado IS 'Pagos desde el inicio hasta el día inclusive';
+
+-- Aplica un delta (positivo o negativo) a un cliente en una fecha y
+-- propaga el cambio a los acumulados de los días posteriores
+CREATE OR REPLACE FUNCTION aplicar_delta_saldo_cliente(
+    p_cliente TEXT,
+    p_fecha DATE,
+    p_clp NUMERIC DEFAULT 0,
+    p_pagos NUMERIC DEFAULT 0
+)
+RETURNS VOID AS $$
+DECLARE
+    v_clp_previo NUMERIC := 0;
+    v_pagos_previo NUMERIC := 0;
+BEGIN
+    -- Serializar los cambios del mismo cliente
+    PERFORM pg_advisory_xact_lock(hashtext('saldos_clientes_diarios:' || p_cliente));
+
+    IF NOT EXISTS (
+        SELECT 1 FROM saldos_clientes_diarios WHERE cliente = p_cliente AND fecha = p_fecha
+    ) THEN
+        SELECT clp_acumulado, pagos_acumulado
+          INTO v_clp_previo, v_pagos_previo
+          FROM saldos_clientes_diarios
+         WHERE cliente = p_cliente AND fecha < p_fecha
+         ORDER BY fecha DESC
+         LIMIT 1;
+
+        INSERT INTO saldos_clientes_diarios (cliente, fecha, clp_acumulado, pagos_acumulado)
+        VALUES (p_cliente, p_fecha, COALESCE(v_clp_previo, 0), COALESCE(v_pagos_previo, 0));
+    END IF;
+
+    UPDATE saldos_clientes_diarios
+       SET clp_dia = clp_dia + p_clp,
+           pagos_dia = pagos_dia + p_pagos,
+           actualizado_en = NOW()
+     WHERE cliente = p_cliente AND fecha = p_fecha;
+
+    UPDATE saldos_clientes_diarios
+       SET clp_acumulado = clp_acumulado + p_clp,
+           pagos_acumulado = pagos_acumulado + p_pagos
+     WHERE cliente = p_cliente AND fecha >= p_fecha;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Devuelve el último saldo acumulado de cada cliente hasta la fecha dada (inclusive)
+CREATE OR REPLACE FUNCTION saldos_clientes_al(p_fecha DATE)
+RETURNS TABLE (
+    cliente TEXT,
+    clp_acumulado NUMERIC,
+    pagos_acumulado NUMERIC,
+    saldo NUMERIC
+) AS $$
+    SELECT DISTINCT ON (s.cliente)
+           s.cliente,
+           s.clp_acumulado,
+           s.pagos_acumulado,
+           s.clp_acumulado - s.pagos_acumulado AS saldo
+      FROM saldos_clientes_diarios s
+     WHERE s.fecha <= p_fecha
+     ORDER BY s.cliente, s.fecha DESC;
+$$ LANGUAGE sql STABLE;
+
+-- Reconstruye el libro completo desde pedidos y pagos_realizados.
+-- Usar para la carga inicial o si se detecta una diferencia.
+CREATE OR REPLACE FUNCTION reconstruir_saldos_clientes()
+RETURNS INTEGER AS $$
+DECLARE
+    v_filas INTEGER;
+BEGIN
+    DELETE FROM saldos_clientes_diarios;
+
+    INSERT INTO saldos_clientes_diarios (cliente, fecha, clp_dia, pagos_dia, clp_acumulado, pagos_acumulado)
+    SELECT cliente,
+           fecha,
+           clp_dia,
+           pagos_dia,
+           SUM(clp_dia) OVER (PARTITION BY cliente ORDER BY fecha),
+           SUM(pagos_dia) OVER (PARTITION BY cliente ORDER BY fecha)
+      FROM (
+            SELECT cliente, fecha, SUM(clp) AS clp_dia, SUM(pagos) AS pagos_dia
+              FROM (
+                    SELECT cliente, fecha::date AS fecha, clp::numeric AS clp, 0::numeric AS pagos
+                      FROM pedidos
+                     WHERE eliminado = FALSE AND cliente IS NOT NULL AND clp IS NOT NULL
+                    UNION ALL
+                    SELECT cliente, fecha_registro::date AS fecha, 0::numeric AS clp, monto_total::numeric AS pagos
+                      FROM pagos_realizados
+                     WHERE eliminado = FALSE AND cliente IS NOT NULL AND monto_total IS NOT NULL
+                   ) movimientos
+             GROUP BY cliente, fecha
+           ) diarios;
+
+    GET DIAGNOSTICS v_filas = ROW_COUNT;
+    RETURN v_filas;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Carga inicial
+SELECT reconstruir_saldos_clientes();
+
+-- Verificar el resultado
+SELECT cliente, fecha, clp_acumulado, pagos_acumulado
+FROM saldos_clientes_diarios
+ORDER BY fecha DESC, cliente
+LIMIT 20;
+
+-- Aplica varios deltas en una sola transacción: al editar un pedido o pago se
+-- revierte el movimiento anterior y se aplica el nuevo sin riesgo de que quede
+-- solo uno de los dos (ver aplicar_deltas_saldo en saldos_clientes.py).
+-- p_deltas: [{"cliente": ..., "fecha": "YYYY-MM-DD", "clp": ..., "pagos": ...}]
+-- Los clientes se procesan en orden para que dos ediciones no se bloqueen entre sí.
+CREATE OR REPLACE FUNCTION aplicar_deltas_saldo_cliente(p_deltas JSONB)
+RETURNS VOID AS $$
+DECLARE
+    v_delta RECORD;
+BEGIN
+    FOR v_delta IN
+        SELECT d.cliente, d.fecha, COALESCE(d.clp, 0) AS clp, COALESCE(d.pagos, 0) AS pagos
+          FROM jsonb_to_recordset(p_deltas) AS d(cliente TEXT, fecha DATE, clp NUMERIC, pagos NUMERIC)
+         WHERE d.cliente IS NOT NULL AND d.fecha IS NOT NULL
+         ORDER BY d.cliente, d.fecha
+    LOOP
+        PERFORM aplicar_delta_saldo_cliente(v_delta.cliente, v_delta.fecha, v_delta.clp, v_delta.pagos);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION aplicar_deltas_saldo_cliente(JSONB) IS 'Aplica varios deltas de saldo de clientes en una sola transacción';
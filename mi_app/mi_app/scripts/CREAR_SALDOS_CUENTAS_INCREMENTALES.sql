@@ -0,0 +1,130 @@
+-- Script para crear las funciones de saldo incremental de cuentas_activas
+-- Ejecutar en Supabase SQL Editor
+--
+-- Cada movimiento de movimientos_cuenta se inserta o elimina junto con el
+-- ajuste de cuentas_activas.saldo_actual en la misma transacción (ver
+-- saldos_cuentas.py). Guardar un pedido ya no relee el historial de la cuenta:
+-- el costo no crece con la cantidad de movimientos acumulados.
+
+-- Efecto de cada tipo de movimiento sobre el saldo
+CREATE OR REPLACE FUNCTION signo_movimiento(p_tipo TEXT)
+RETURNS INTEGER AS $$
+    SELECT CASE
+               WHEN p_tipo IN ('COMPRA', 'AJUSTE', 'AJUSTE_MANUAL', 'TRANS_ENTRADA') THEN 1
+               WHEN p_tipo IN ('PEDIDO', 'COMISION_PEDIDO', 'COMISION_TRANS', 'TRANS_SALIDA') THEN -1
+               ELSE 0
+           END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Inserta un movimiento (recibido como JSON) y suma su efecto al saldo de la cuenta
+CREATE OR REPLACE FUNCTION registrar_movimiento_con_saldo(p_movimiento JSONB)
+RETURNS SETOF movimientos_cuenta AS $$
+DECLARE
+    v_movimiento movimientos_cuenta;
+BEGIN
+    INSERT INTO movimientos_cuenta (cuenta_id, tipo_movimiento, monto_brs, referencia_id,
+                                    referencia_tipo, usuario, descripcion, fecha)
+    SELECT r.cuenta_id, r.tipo_movimiento, r.monto_brs, r.referencia_id,
+           r.referencia_tipo, r.usuario, r.descripcion, r.fecha
+      FROM jsonb_populate_record(NULL::movimientos_cuenta, p_movimiento) r
+    RETURNING * INTO v_movimiento;
+
+    UPDATE cuentas_activas
+       SET saldo_actual = COALESCE(saldo_actual, 0)
+                          + signo_movimiento(v_movimiento.tipo_movimiento) * COALESCE(v_movimiento.monto_brs, 0)
+     WHERE id = v_movimiento.cuenta_id;
+
+    RETURN NEXT v_movimiento;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Elimina los movimientos de una referencia (opcionalmente de una cuenta y tipo)
+-- y revierte su efecto; devuelve el delta aplicado a cada cuenta
+CREATE OR REPLACE FUNCTION eliminar_movimientos_con_saldo(
+    p_referencia_id BIGINT,
+    p_referencia_tipo TEXT,
+    p_cuenta_id BIGINT DEFAULT NULL,
+    p_tipo_movimiento TEXT DEFAULT NULL
+)
+RETURNS TABLE (cuenta_id BIGINT, delta NUMERIC) AS $$
+    WITH eliminados AS (
+        DELETE FROM movimientos_cuenta m
+         WHERE m.referencia_id = p_referencia_id
+           AND m.referencia_tipo = p_referencia_tipo
+           AND (p_cuenta_id IS NULL OR m.cuenta_id = p_cuenta_id)
+           AND (p_tipo_movimiento IS NULL OR m.tipo_movimiento = p_tipo_movimiento)
+        RETURNING m.cuenta_id, signo_movimiento(m.tipo_movimiento) * COALESCE(m.monto_brs, 0) AS efecto
+    ),
+    por_cuenta AS (
+        SELECT e.cuenta_id, -SUM(e.efecto) AS delta
+          FROM eliminados e
+         GROUP BY e.cuenta_id
+    ),
+    actualizadas AS (
+        UPDATE cuentas_activas c
+           SET saldo_actual = COALESCE(c.saldo_actual, 0) + p.delta
+          FROM por_cuenta p
+         WHERE c.id = p.cuenta_id
+        RETURNING c.id
+    )
+    SELECT p.cuenta_id::BIGINT, p.delta
+      FROM por_cuenta p;
+$$ LANGUAGE sql;
+
+COMMENT ON FUNCTION registrar_movimiento_con_saldo(JSONB) IS 'Inserta un movimiento de cuenta y ajusta saldo_actual en la misma transacción';
+COMMENT ON FUNCTION eliminar_movimientos_con_saldo(BIGINT, TEXT, BIGINT, TEXT) IS 'Elimina movimientos de una referencia y revierte su efecto en saldo_actual';
+
+-- Búsqueda de movimientos por referencia (eliminación al editar o borrar pedidos)
+CREATE INDEX IF NOT EXISTS idx_movimientos_cuenta_referencia ON movimientos_cuenta(referencia_id, referencia_tipo);
+
+-- Verificar: cuentas cuyo saldo_actual no coincide con la suma de sus movimientos
+SELECT c.id, c.nombre_titular, c.saldo_actual,
+       COALESCE(SUM(signo_movimiento(m.tipo_movimiento) * m.monto_brs), 0) AS saldo_movimientos
+  FROM cuentas_activas c
+  LEFT JOIN movimientos_cuenta m ON m.cuenta_id = c.id
+ GROUP BY c.id, c.nombre_titular, c.saldo_actual
+HAVING c.saldo_actual IS DISTINCT FROM COALESCE(SUM(signo_movimiento(m.tipo_movimiento) * m.monto_brs), 0);
+
+-- Recálculo completo de todas las cuentas activas (botón "Recalcular saldos" del
+-- flujo de caja): agrupa los movimientos por (cuenta_id, tipo_movimiento) en
+-- una sola consulta, escribe los saldos que cambiaron en un solo UPDATE y
+-- devuelve el saldo anterior y el nuevo de cada cuenta.
+-- Las cuentas se bloquean antes de sumar: un movimiento registrado en paralelo
+-- espera y suma su delta sobre el saldo ya corregido.
+CREATE OR REPLACE FUNCTION recalcular_saldos_cuentas()
+RETURNS TABLE (cuenta_id BIGINT, nombre_titular TEXT, saldo_antes NUMERIC, saldo_despues NUMERIC) AS $$
+BEGIN
+    PERFORM 1 FROM cuentas_activas c WHERE c.activa FOR UPDATE;
+
+    RETURN QUERY
+    WITH por_tipo AS (
+        SELECT m.cuenta_id, m.tipo_movimiento, SUM(COALESCE(m.monto_brs, 0)) AS total
+          FROM movimientos_cuenta m
+         GROUP BY m.cuenta_id, m.tipo_movimiento
+    ),
+    saldos AS (
+        SELECT c.id, c.nombre_titular, c.saldo_actual AS antes,
+               COALESCE(SUM(signo_movimiento(p.tipo_movimiento) * p.total), 0) AS despues
+          FROM cuentas_activas c
+          LEFT JOIN por_tipo p ON p.cuenta_id = c.id
+         WHERE c.activa
+         GROUP BY c.id, c.nombre_titular, c.saldo_actual
+    ),
+    actualizadas AS (
+        UPDATE cuentas_activas c
+           SET saldo_actual = s.despues
+          FROM saldos s
+         WHERE c.id = s.id
+           AND c.saldo_actual IS DISTINCT FROM s.despues
+        RETURNING c.id
+    )
+    SELECT s.id::BIGINT, s.nombre_titular::TEXT, s.antes::NUMERIC, s.despues::NUMERIC
+      FROM saldos s
+     ORDER BY s.nombre_titular;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION recalcular_saldos_cuentas() IS 'Recalcula saldo_actual de todas las cuentas activas desde sus movimientos y devuelve antes/después';
+
+-- Índice para agrupar los movimientos por cuenta y tipo
+CREATE INDEX IF NOT EXISTS idx_movimientos_cuenta_cuenta_tipo ON movimientos_cuenta(cuenta_id, tipo_movimiento);
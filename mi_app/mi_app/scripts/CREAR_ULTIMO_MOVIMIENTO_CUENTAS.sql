@@ -0,0 +1,61 @@
+-- Script para mantener la fecha del último movimiento de cada cuenta
+-- Ejecutar en Supabase SQL Editor
+--
+-- La página de flujo de caja ordena las cuentas por su último movimiento.
+-- Antes descargaba cuenta_id y fecha de toda la tabla movimientos_cuenta para
+-- quedarse con la primera fila de cada cuenta. Con la columna
+-- cuentas_activas.ultimo_movimiento, que mantiene un trigger, la fecha llega
+-- en la misma consulta de las cuentas (ver saldos_cuentas.py).
+
+ALTER TABLE cuentas_activas ADD COLUMN IF NOT EXISTS ultimo_movimiento TIMESTAMP WITH TIME ZONE;
+
+COMMENT ON COLUMN cuentas_activas.ultimo_movimiento IS 'Fecha del movimiento más reciente de la cuenta en movimientos_cuenta (mantenida por trigger)';
+
+-- Último movimiento de una cuenta (usa el índice por cuenta y fecha)
+CREATE INDEX IF NOT EXISTS idx_movimientos_cuenta_cuenta_fecha ON movimientos_cuenta(cuenta_id, fecha DESC);
+
+CREATE OR REPLACE FUNCTION trg_ultimo_movimiento_cuenta()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Un movimiento nuevo solo puede adelantar la fecha
+    IF TG_OP = 'INSERT' THEN
+        UPDATE cuentas_activas
+           SET ultimo_movimiento = NEW.fecha
+         WHERE id = NEW.cuenta_id
+           AND (ultimo_movimiento IS NULL OR ultimo_movimiento < NEW.fecha);
+        RETURN NULL;
+    END IF;
+
+    -- Al eliminar o mover un movimiento se vuelve a buscar el más reciente de la cuenta anterior
+    UPDATE cuentas_activas
+       SET ultimo_movimiento = (SELECT MAX(m.fecha) FROM movimientos_cuenta m WHERE m.cuenta_id = OLD.cuenta_id)
+     WHERE id = OLD.cuenta_id;
+
+    IF TG_OP = 'UPDATE' AND NEW.cuenta_id IS DISTINCT FROM OLD.cuenta_id THEN
+        UPDATE cuentas_activas
+           SET ultimo_movimiento = (SELECT MAX(m.fecha) FROM movimientos_cuenta m WHERE m.cuenta_id = NEW.cuenta_id)
+         WHERE id = NEW.cuenta_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_ultimo_movimiento_cuenta ON movimientos_cuenta;
+CREATE TRIGGER trg_ultimo_movimiento_cuenta
+    AFTER INSERT OR UPDATE OF cuenta_id, fecha OR DELETE ON movimientos_cuenta
+    FOR EACH ROW EXECUTE FUNCTION trg_ultimo_movimiento_cuenta();
+
+-- Carga inicial desde el historial existente
+UPDATE cuentas_activas c
+   SET ultimo_movimiento = u.fecha
+  FROM (SELECT DISTINCT ON (m.cuenta_id) m.cuenta_id, m.fecha
+          FROM movimientos_cuenta m
+         ORDER BY m.cuenta_id, m.fecha DESC) u
+ WHERE c.id = u.cuenta_id;
+
+-- Verificar: cuentas cuyo ultimo_movimiento no coincide con el historial
+SELECT c.id, c.nombre_titular, c.ultimo_movimiento, MAX(m.fecha) AS fecha_movimientos
+  FROM cuentas_activas c
+  LEFT JOIN movimientos_cuenta m ON m.cuenta_id = c.id
+ GROUP BY c.id, c.nombre_titular, c.ultimo_movimiento
+HAVING c.ultimo_movimiento IS DISTINCT FROM MAX(m.fecha);
@@ -0,0 +1,19 @@
+-- Script para crear el índice único por fecha en flujo_capital
+-- Ejecutar en Supabase SQL Editor
+--
+-- El recálculo por rango (recalculo_flujo.py) guarda todos los días con un solo
+-- upsert ON CONFLICT (fecha), que necesita este índice. Sin él se guarda fila
+-- por fila como antes.
+
+-- Fechas repetidas (deben quedar en una sola fila antes de crear el índice)
+SELECT fecha, COUNT(*) AS filas
+FROM flujo_capital
+GROUP BY fecha
+HAVING COUNT(*) > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_flujo_capital_fecha_unica ON flujo_capital(fecha);
+
+-- Verificar el índice
+SELECT indexname, indexdef
+FROM pg_indexes
+WHERE tablename = 'flujo_capital';
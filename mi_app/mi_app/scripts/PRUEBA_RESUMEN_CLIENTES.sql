@@ -0,0 +1,83 @@
+-- Script de prueba de resumen_clientes contra un Postgres desechable (NO ejecutar en Supabase)
+-- Uso (desde esta carpeta):
+--   createdb prueba_resumen
+--   psql -v ON_ERROR_STOP=1 -d prueba_resumen -f PRUEBA_RESUMEN_CLIENTES.sql
+--   dropdb prueba_resumen
+--
+-- Crea versiones mínimas de pedidos y pagos_realizados, carga datos de ejemplo,
+-- instala el libro de saldos y la función, y compara con el resultado esperado.
+-- Si algo no coincide el script termina con error.
+
+CREATE TABLE pedidos (
+    id SERIAL PRIMARY KEY,
+    cliente TEXT,
+    fecha DATE,
+    clp NUMERIC,
+    brs NUMERIC,
+    eliminado BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE pagos_realizados (
+    id SERIAL PRIMARY KEY,
+    cliente TEXT,
+    monto_total NUMERIC,
+    fecha_registro TIMESTAMP,
+    eliminado BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+-- Fecha consultada: 2025-03-10, ventana desde 2025-02-08
+INSERT INTO pedidos (cliente, fecha, clp, brs, eliminado) VALUES
+    ('Cliente A', '2025-03-01', 1000, 100, FALSE),  -- deuda anterior
+    ('Cliente A', '2025-03-10', 500, 50, FALSE),    -- pedido del día
+    ('Cliente A', '2025-03-11', 800, 80, FALSE),    -- posterior a la fecha, no cuenta
+    ('Cliente B', '2025-01-01', 2000, 200, FALSE),  -- fuera de la ventana, solo deuda anterior
+    ('Cliente C', '2025-01-15', 300, 30, FALSE),    -- fuera de la ventana y sin pagos: no aparece
+    ('Cliente D', '2025-03-09', 100, NULL, FALSE),  -- BRS nulo
+    ('Cliente D', '2025-03-10', 999, 99, TRUE);     -- eliminado, no cuenta
+
+INSERT INTO pagos_realizados (cliente, monto_total, fecha_registro, eliminado) VALUES
+    ('Cliente A', 300, '2025-03-05 10:00:00', FALSE),
+    ('Cliente A', 200, '2025-03-10 23:59:59', FALSE),
+    ('Cliente A', 700, '2025-03-10 12:00:00', TRUE), -- eliminado, no cuenta
+    ('Cliente B', 500, '2025-03-10 09:30:00', FALSE);
+
+\ir CREAR_SALDOS_CLIENTES_DIARIOS.sql
+\ir CREAR_RESUMEN_CLIENTES.sql
+
+CREATE TEMP TABLE resumen_esperado (
+    cliente TEXT,
+    brs NUMERIC,
+    clp_hoy NUMERIC,
+    pagos_hoy NUMERIC,
+    saldo_anterior NUMERIC
+);
+
+INSERT INTO resumen_esperado VALUES
+    ('Cliente A', 50, 500, 200, 700),
+    ('Cliente B', 0, 0, 500, 2000),
+    ('Cliente D', 0, 0, 0, 100);
+
+DO $$
+DECLARE
+    v_diferencias INTEGER;
+BEGIN
+    SELECT COUNT(*) INTO v_diferencias
+      FROM (
+            (SELECT * FROM resumen_clientes('2025-02-08', '2025-03-10')
+             EXCEPT
+             SELECT * FROM resumen_esperado)
+            UNION ALL
+            (SELECT * FROM resumen_esperado
+             EXCEPT
+             SELECT * FROM resumen_clientes('2025-02-08', '2025-03-10'))
+           ) diferencias;
+
+    IF v_diferencias > 0 THEN
+        RAISE EXCEPTION 'resumen_clientes no coincide con el resultado esperado (% filas distintas)', v_diferencias;
+    END IF;
+    RAISE NOTICE 'resumen_clientes OK';
+END;
+$$;
+
+-- Resultado obtenido
+SELECT * FROM resumen_clientes('2025-02-08', '2025-03-10');
@@ -6,7 +6,8 @@ SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 if __name__ == '__main__':
-    response = supabase.table('transferencias').select('empresa').execute()
+    # Catálogo de empresas distintas (ver CREAR_EMPRESAS_TRANSFERENCIAS.sql)
+    response = supabase.rpc('empresas_transferencias').execute()
     empresas = set()
     if response.data:
         for row in response.data:
@@ -0,0 +1,211 @@
+import logging
+from datetime import datetime, timedelta
+
+from mi_app.mi_app import cache_etiquetas
+from mi_app.mi_app.cache_compartido import leer_marca, tocar_marca
+from mi_app.mi_app.extensions import supabase
+
+# -----------------------------------------------------------------------------
+# Totales diarios compartidos por márgenes, flujo de capital, cierre y admin
+# Cada total se calcula una vez por fecha (en Postgres si la función existe)
+# y se guarda en el cache compartido etiquetado con la fecha; las escrituras
+# de pedidos lo invalidan con invalidar_pedidos_dia(fecha).
+# Las compras las escribe además binance_updater_always, que corre fuera de
+# Flask: toca la marca "compras:<fecha>" y la clave del cache la incluye.
+# -----------------------------------------------------------------------------
+
+PEDIDOS_DIA_PREFIJO = "pedidos_dia"
+COMPRAS_DIA_PREFIJO = "compras_dia"
+TOTALES_TIMEOUT = 300
+# Filas por consulta al leer un rango de fechas sin las funciones de Postgres
+TAMANO_PAGINA = 1000
+
+def _numero(valor):
+    return float(valor) if valor is not None else 0.0
+
+def _fechas_rango(fecha_inicio, fecha_fin):
+    dia = datetime.strptime(fecha_inicio, "%Y-%m-%d")
+    fin = datetime.strptime(fecha_fin, "%Y-%m-%d")
+    fechas = []
+    while dia <= fin:
+        fechas.append(dia.strftime("%Y-%m-%d"))
+        dia += timedelta(days=1)
+    return fechas
+
+def _leer_por_paginas(consulta):
+    """Lee todas las filas de consulta() (un builder nuevo por página, ordenado por id)"""
+    filas = []
+    while True:
+        pagina = consulta().range(len(filas), len(filas) + TAMANO_PAGINA - 1).execute().data or []
+        filas.extend(pagina)
+        if len(pagina) < TAMANO_PAGINA:
+            return filas
+
+def _resumen_pedidos(brs_total, clp_total, brs_detal, clp_detal, cantidad):
+    return {
+        "brs_total": brs_total,
+        "clp_total": clp_total,
+        "brs_detal": brs_detal,
+        "clp_detal": clp_detal,
+        "brs_mayor": brs_total - brs_detal,
+        "clp_mayor": clp_total - clp_detal,
+        "cantidad": cantidad
+    }
+
+def _consultar_pedidos_dia(fecha):
+    try:
+        filas = supabase.rpc("pedidos_resumen_dia", {"p_fecha": fecha}).execute().data or []
+        fila = filas[0] if filas else {}
+        return _resumen_pedidos(
+            _numero(fila.get("brs_total")), _numero(fila.get("clp_total")),
+            _numero(fila.get("brs_detal")), _numero(fila.get("clp_detal")),
+            int(fila.get("cantidad") or 0)
+        )
+    except Exception as e:
+        # Sin la función en la base: una sola consulta y se agrupa aquí
+        logging.error(f"[TOTALES] Error en pedidos_resumen_dia({fecha}), se agrupa en Python: {e}")
+    pedidos = supabase.table("pedidos").select("brs, clp, cliente").eq("fecha", fecha).eq("eliminado", False).execute().data or []
+    detal = [p for p in pedidos if p.get("cliente") == "DETAL"]
+    return _resumen_pedidos(
+        sum(_numero(p["brs"]) for p in pedidos), sum(_numero(p["clp"]) for p in pedidos),
+        sum(_numero(p["brs"]) for p in detal), sum(_numero(p["clp"]) for p in detal),
+        len(pedidos)
+    )
+
+def pedidos_por_dia(fecha_inicio, fecha_fin):
+    """
+    Totales de pedidos de cada día del rango (los mismos de pedidos_del_dia) en una sola consulta.
+    No pasa por el cache: lo usa el recálculo del flujo de capital, que necesita datos frescos.
+    Returns:
+        dict fecha -> totales (todas las fechas del rango, en cero si no hubo pedidos)
+    """
+    totales = {fecha: _resumen_pedidos(0.0, 0.0, 0.0, 0.0, 0) for fecha in _fechas_rango(fecha_inicio, fecha_fin)}
+    try:
+        filas = supabase.rpc("pedidos_resumen_rango", {"p_desde": fecha_inicio, "p_hasta": fecha_fin}).execute().data or []
+        for fila in filas:
+            totales[fila["fecha"][:10]] = _resumen_pedidos(
+                _numero(fila.get("brs_total")), _numero(fila.get("clp_total")),
+                _numero(fila.get("brs_detal")), _numero(fila.get("clp_detal")),
+                int(fila.get("cantidad") or 0)
+            )
+        return totales
+    except Exception as e:
+        logging.error(f"[TOTALES] Error en pedidos_resumen_rango({fecha_inicio}, {fecha_fin}), se agrupa en Python: {e}")
+    pedidos = _leer_por_paginas(
+        lambda: supabase.table("pedidos").select("id, fecha, brs, clp, cliente")
+        .gte("fecha", fecha_inicio).lte("fecha", fecha_fin).eq("eliminado", False).order("id")
+    )
+    acumulados = {}
+    for p in pedidos:
+        dia = acumulados.setdefault(p["fecha"][:10], [0.0, 0.0, 0.0, 0.0, 0])
+        dia[0] += _numero(p["brs"])
+        dia[1] += _numero(p["clp"])
+        if p.get("cliente") == "DETAL":
+            dia[2] += _numero(p["brs"])
+            dia[3] += _numero(p["clp"])
+        dia[4] += 1
+    for fecha, dia in acumulados.items():
+        totales[fecha] = _resumen_pedidos(*dia)
+    return totales
+
+def pedidos_del_dia(fecha):
+    """
+    Totales de los pedidos no eliminados de la fecha, DETAL y mayor (resto de clientes).
+    Returns:
+        dict con brs_total, clp_total, brs_detal, clp_detal, brs_mayor, clp_mayor y cantidad
+    """
+    return cache_etiquetas.obtener_o_calcular(
+        f"{PEDIDOS_DIA_PREFIJO}:{fecha}", lambda: _consultar_pedidos_dia(fecha), TOTALES_TIMEOUT,
+        gracia=0, fecha_desde=fecha, fecha_hasta=fecha
+    )
+
+def invalidar_pedidos_dia(fecha=None):
+    """Descarta los totales de pedidos de la fecha (None = todas)"""
+    return cache_etiquetas.invalidar(fecha=fecha, prefijo=PEDIDOS_DIA_PREFIJO)
+
+def marca_compras(fecha):
+    """Nombre de la marca que tocan quienes escriben compras de la fecha"""
+    return f"compras:{fecha[:10]}"
+
+def _resumen_compras(filas):
+    resumen = dict.fromkeys((
+        "brs_comprados", "usdt_vendidos", "usdt_comprados", "clp_invertidos",
+        "valor_clp_compras", "usdt_vendidos_clp", "clp_recibidos_usdt"
+    ), 0.0)
+    for c in filas:
+        tipo = (c.get("fiat"), c.get("tradetype"))
+        if tipo == ("VES", "SELL"):
+            resumen["brs_comprados"] += _numero(c.get("totalprice"))
+            resumen["usdt_vendidos"] += _numero(c.get("amount")) + _numero(c.get("commission"))
+        elif tipo == ("CLP", "BUY"):
+            resumen["usdt_comprados"] += _numero(c.get("costo_real"))
+            resumen["clp_invertidos"] += _numero(c.get("totalprice"))
+            resumen["valor_clp_compras"] += _numero(c.get("costo_real")) * _numero(c.get("unitprice"))
+        elif tipo == ("CLP", "SELL"):
+            resumen["usdt_vendidos_clp"] += _numero(c.get("amount"))
+            resumen["clp_recibidos_usdt"] += _numero(c.get("totalprice"))
+    return resumen
+
+def _consultar_compras_dia(fecha):
+    try:
+        filas = supabase.rpc("compras_resumen_dia", {"p_fecha": fecha}).execute().data or []
+        fila = filas[0] if filas else {}
+        return {clave: _numero(fila.get(clave)) for clave in _resumen_compras([])}
+    except Exception as e:
+        # Sin la función en la base: una sola consulta y se agrupa aquí
+        logging.error(f"[TOTALES] Error en compras_resumen_dia({fecha}), se agrupa en Python: {e}")
+    filas = (supabase.table("compras")
+             .select("fiat, tradetype, totalprice, amount, commission, costo_real, unitprice")
+             .gte("createtime", fecha + "T00:00:00")
+             .lte("createtime", fecha + "T23:59:59")
+             .execute().data or [])
+    return _resumen_compras(filas)
+
+def compras_por_dia(fecha_inicio, fecha_fin):
+    """
+    Totales de compras de cada día del rango (los mismos de compras_del_dia) en una sola consulta.
+    No pasa por el cache: lo usa el recálculo del flujo de capital, que necesita datos frescos.
+    Returns:
+        dict fecha -> totales (todas las fechas del rango, en cero si no hubo compras)
+    """
+    totales = {fecha: _resumen_compras([]) for fecha in _fechas_rango(fecha_inicio, fecha_fin)}
+    try:
+        filas = supabase.rpc("compras_resumen_rango", {"p_desde": fecha_inicio, "p_hasta": fecha_fin}).execute().data or []
+        for fila in filas:
+            totales[fila["fecha"][:10]] = {clave: _numero(fila.get(clave)) for clave in _resumen_compras([])}
+        return totales
+    except Exception as e:
+        logging.error(f"[TOTALES] Error en compras_resumen_rango({fecha_inicio}, {fecha_fin}), se agrupa en Python: {e}")
+    compras = _leer_por_paginas(
+        lambda: supabase.table("compras")
+        .select("id, createtime, fiat, tradetype, totalprice, amount, commission, costo_real, unitprice")
+        .gte("createtime", fecha_inicio + "T00:00:00").lte("createtime", fecha_fin + "T23:59:59").order("id")
+    )
+    por_fecha = {}
+    for c in compras:
+        por_fecha.setdefault(str(c["createtime"])[:10], []).append(c)
+    for fecha, filas in por_fecha.items():
+        totales[fecha] = _resumen_compras(filas)
+    return totales
+
+def compras_del_dia(fecha):
+    """
+    Totales de la tabla compras de la fecha:
+    - VES SELL: brs_comprados (totalprice) y usdt_vendidos (amount + commission)
+    - CLP BUY: usdt_comprados (costo_real), clp_invertidos (totalprice) y
+      valor_clp_compras (costo_real * unitprice)
+    - CLP SELL: usdt_vendidos_clp (amount) y clp_recibidos_usdt (totalprice)
+    Returns:
+        dict con los totales anteriores
+    """
+    # Una orden nueva de Binance cambia la marca y con ella la clave: se recalcula al instante
+    marca = leer_marca(marca_compras(fecha))
+    return cache_etiquetas.obtener_o_calcular(
+        f"{COMPRAS_DIA_PREFIJO}:{fecha}:{marca:.6f}", lambda: _consultar_compras_dia(fecha), TOTALES_TIMEOUT,
+        gracia=0, fecha_desde=fecha, fecha_hasta=fecha
+    )
+
+def invalidar_compras_dia(fecha):
+    """Descarta los totales de compras de la fecha (YYYY-MM-DD o ISO) en todos los procesos"""
+    tocar_marca(marca_compras(fecha))
+    return cache_etiquetas.invalidar(fecha=fecha, prefijo=COMPRAS_DIA_PREFIJO)
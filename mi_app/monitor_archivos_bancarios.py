@@ -1,18 +1,21 @@
 import os
+import sys
 import time
-import subprocess
 import logging
 
 # Directorio base del proyecto
-BASE_DIR = os.path.dirname(__file__)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Asegura que el path raíz esté en sys.path
+PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from mi_app.ingesta_transferencias import procesar_archivo_bancario, detectar_banco
 
 # Carpeta donde tu web deja los archivos subidos
 UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads', 'transferencias', 'uploads')
 
-# Palabras clave en nombre de archivo
-BCI_KEYWORD = 'Movimientos_Detallado_Cuenta'
-SANTANDER_KEYWORD = 'CartolaMovimiento-'
-
 # Intervalo de sondeo (en segundos)
 POLL_INTERVAL = 10
 
@@ -34,28 +37,18 @@ procesados = set()
 def procesar_archivo(ruta_completa):
     nombre = os.path.basename(ruta_completa)
     try:
-        # Obtener ruta del Python del entorno virtual
-        venv_python = '/home/sacristobalspa/webfinal/venv/bin/python'
-        
-        if BCI_KEYWORD in nombre:
-            logging.info(f"Archivo identificado como BCI: {nombre}")
-            # Ejecutar script BCI directamente (procesa desde uploads)
-            subprocess.run([venv_python, 'bci.py'], cwd=BASE_DIR, check=True, timeout=300)
-            logging.info("Ejecución de bci.py completada.")
-
-        elif SANTANDER_KEYWORD in nombre:
-            logging.info(f"Archivo identificado como Santander: {nombre}")
-            # Ejecutar script Santander directamente (procesa desde uploads)
-            subprocess.run([venv_python, 'Santander.py'], cwd=BASE_DIR, check=True, timeout=300)
-            logging.info("Ejecución de Santander.py completada.")
-
-        else:
+        banco = detectar_banco(nombre)
+        if banco is None:
             logging.warning(f"Archivo no reconocido, se omite: {nombre}")
+        else:
+            logging.info(f"Archivo identificado como {banco}: {nombre}")
+            # Procesar en este mismo proceso (los parsers quedan cargados entre archivos)
+            exito, mensaje, _ = procesar_archivo_bancario(ruta_completa)
+            if exito:
+                logging.info(mensaje)
+            else:
+                logging.error(f"Error al procesar {nombre}: {mensaje}")
 
-    except subprocess.TimeoutExpired:
-        logging.error(f"Script para {nombre} excedió el tiempo límite")
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Error al procesar {nombre}: {e}")
     except Exception as e:
         logging.error(f"Error inesperado al procesar {nombre}: {e}")
 
@@ -65,7 +58,7 @@ def procesar_archivo(ruta_completa):
 def main():
     logging.info("Iniciando monitor de archivos bancarios...")
     logging.info(f"Directorio de uploads: {UPLOAD_DIR}")
-    logging.info("Los scripts procesarán archivos directamente desde uploads")
+    logging.info("Los archivos se procesan directamente desde uploads")
     
     # Crear carpeta de uploads si no existe
     os.makedirs(UPLOAD_DIR, exist_ok=True)
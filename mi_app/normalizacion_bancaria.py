@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Normalización vectorizada de cartolas bancarias (BCI / Santander).
+Reemplaza los .apply(...) fila por fila de bci.py y Santander.py por operaciones
+sobre columnas completas, devolviendo los mismos valores (incluido el formato de
+los campos que entran al hash, para no romper la deduplicación).
+"""
+
+import hashlib
+import re
+
+import numpy as np
+import pandas as pd
+
+# Formatos de fecha conocidos en las cartolas; lo que no calce se resuelve como antes (dayfirst)
+FORMATOS_FECHA = ["%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M:%S"]
+
+# RUT dentro de la descripción de un movimiento Santander
+RUT_REGEX = re.compile(r'\b0*([1-9]\d{6,7})[-.]?([0-9Kk])\b')
+
+def _sin_nulos(serie):
+    """Convierte NaN/NaT en None (dtype object) para que los registros sean serializables"""
+    serie = serie.astype(object)
+    return serie.where(serie.notna(), None)
+
+def normalizar_fechas(serie):
+    """
+    Normaliza una columna de fechas al formato 'YYYY-MM-DD' (None si es inválida).
+    Equivale a aplicar pd.to_datetime(valor, errors='coerce', dayfirst=True) a cada celda,
+    pero parsea en bloque con formatos explícitos y solo deja celda a celda lo que no calza.
+    Diferencia: 'YYYY-MM-DD' se lee siempre como año-mes-día (con dayfirst=True algunas
+    versiones de pandas intercambiaban día y mes en esas fechas).
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return _sin_nulos(serie.dt.strftime("%Y-%m-%d"))
+
+    fechas = pd.Series(pd.NaT, index=serie.index, dtype="datetime64[ns]")
+    es_texto = serie.str.len().notna() if serie.dtype == object or pd.api.types.is_string_dtype(serie) else pd.Series(False, index=serie.index)
+
+    # Celdas que Excel ya entregó como fecha (o número)
+    otras = serie.notna() & ~es_texto
+    if otras.any():
+        fechas[otras] = pd.to_datetime(serie[otras], errors="coerce")
+
+    # Texto con formatos conocidos
+    texto = serie[es_texto].astype(str)
+    pendientes = texto.index
+    for formato in FORMATOS_FECHA:
+        if len(pendientes) == 0:
+            break
+        parseadas = pd.to_datetime(texto.loc[pendientes], format=formato, errors="coerce")
+        fechas[parseadas.index] = parseadas
+        pendientes = parseadas.index[parseadas.isna()]
+
+    # Lo que quede se parsea como antes, celda a celda
+    for i in pendientes:
+        fechas[i] = pd.to_datetime(texto[i], errors="coerce", dayfirst=True)
+
+    return _sin_nulos(fechas.dt.strftime("%Y-%m-%d"))
+
+def normalizar_montos(serie):
+    """
+    Valida montos enteros y positivos (equivale a normalizar_monto por celda).
+    Devuelve float64 con NaN en los montos inválidos.
+    """
+    numeros = pd.to_numeric(serie, errors="coerce").astype(float)
+    validos = numeros.notna() & (numeros > 0) & (np.floor(numeros) == numeros)
+    return numeros.where(validos)
+
+def montos_para_hash(montos, con_decimal):
+    """
+    Texto del monto tal como entra al hash: "1000.0" si con_decimal, "1000" si no.
+    Antes dependía del dtype que pandas infería para toda la columna del archivo;
+    se fija por banco para que no cambie al leer por bloques:
+    - Santander: con decimal (la columna MONTO siempre trae cargos negativos → float64)
+    - BCI: sin decimal (los ingresos vacíos se filtran antes de normalizar → int64)
+    """
+    if con_decimal:
+        return montos.astype(float).astype(str)
+    return montos.astype(np.int64).astype(str)
+
+def normalizar_ruts(serie):
+    """Elimina puntos, pasa a mayúsculas y quita espacios (equivale a str(rut).replace('.', '').upper().strip())"""
+    return serie.astype(str).str.replace(".", "", regex=False).str.upper().str.strip()
+
+def extraer_ruts(descripciones):
+    """
+    Extrae el primer RUT (numero-DV) de cada descripción de movimiento.
+    Devuelve None donde no se encuentra.
+    """
+    partes = descripciones.str.replace(".", "", regex=False).str.extract(RUT_REGEX)
+    ruts = partes[0].str.cat(partes[1].str.upper(), sep="-")
+    return _sin_nulos(ruts)
+
+def facturacion_por_numero(ruts, limite=50000000):
+    """Santander: 'empresa' si la parte numérica del RUT es >= limite, 'persona' en otro caso"""
+    numeros = pd.to_numeric(ruts.astype(str).str.split("-").str[0], errors="coerce")
+    return pd.Series(np.where(numeros >= limite, "empresa", "persona"), index=ruts.index)
+
+def facturacion_por_prefijo(ruts, prefijo="7"):
+    """BCI: 'empresa' si el RUT comienza con el prefijo, 'persona' en otro caso"""
+    return pd.Series(np.where(ruts.astype(str).str.startswith(prefijo), "empresa", "persona"), index=ruts.index)
+
+def calcular_fechas_detec(fechas, horas):
+    """
+    Combina fecha ('YYYY-MM-DD') y hora ('HH:MM' o 'HH:MM:SS') en 'YYYY-MM-DD HH:MM:SS'.
+    Igual que calcular_fecha_detec, solo acepta horas en texto; el resto queda en None.
+    """
+    separadores = horas.str.count(":") if horas.dtype == object or pd.api.types.is_string_dtype(horas) else pd.Series(np.nan, index=horas.index)
+    horas_texto = horas.where(separadores.notna()).astype(object)
+    sufijo = pd.Series(np.where(separadores == 1, ":00", ""), index=horas.index)
+    combinadas = fechas.astype(object).str.cat(horas_texto.str.cat(sufijo), sep=" ")
+    detec = pd.to_datetime(combinadas, format="%Y-%m-%d %H:%M:%S", errors="coerce")
+    return _sin_nulos(detec.dt.strftime("%Y-%m-%d %H:%M:%S"))
+
+def calcular_hashes(df, columnas):
+    """
+    Calcula el MD5 de las columnas unidas con '_' (mismo texto que el f-string por fila).
+    La cadena base se arma por columnas; solo el MD5 se calcula por fila.
+    """
+    textos = [df[c].astype(object).astype(str) for c in columnas]
+    base = textos[0].str.cat(textos[1:], sep="_")
+    return pd.Series([hashlib.md5(t.encode("utf-8")).hexdigest() for t in base], index=df.index, dtype=object)
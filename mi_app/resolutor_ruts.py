@@ -0,0 +1,170 @@
+import logging
+import sys
+import threading
+import time
+
+# -----------------------------------------------------------------------------
+# Resolución en memoria de RUT pagador -> cliente
+# Índice compacto {cuerpo del RUT (int): cliente} construido desde
+# cliente_pagadores (ver scripts/CREAR_CLIENTE_PAGADORES.sql). Se carga una vez
+# por proceso y se refresca por incrementos (id > último id leído); cada
+# RECARGA_COMPLETA segundos se recarga entero para reflejar eliminaciones y
+# cambios de nombre hechos en otros procesos. En el proceso que modifica los
+# pagadores, registrar()/invalidar() lo dejan al día de inmediato.
+# Un RUT asociado a más de un cliente no se asigna automáticamente.
+# -----------------------------------------------------------------------------
+
+# Segundos entre refrescos incrementales (solo RUT nuevos)
+REFRESCO_INCREMENTAL = 30
+# Segundos entre recargas completas
+RECARGA_COMPLETA = 300
+# Filas por consulta al cargar cliente_pagadores
+TAMANO_PAGINA = 1000
+
+AMBIGUO = object()
+
+def cuerpo_rut(rut):
+    """
+    Devuelve el cuerpo numérico del RUT ('12.345.678-9' -> 12345678).
+    El dígito verificador se descarta: depende solo del cuerpo.
+    Returns:
+        int o None si el RUT no tiene formato número-dv
+    """
+    if rut is None:
+        return None
+    numero, guion, _ = str(rut).replace(".", "").strip().partition("-")
+    if not guion or not numero.isdigit():
+        return None
+    return int(numero)
+
+class ResolutorRuts:
+    """Índice en memoria de RUT de pagadores a cliente"""
+
+    def __init__(self, supabase_client):
+        self.supabase = supabase_client
+        self._indice = {}
+        self._ultimo_id = 0
+        self._cargado_en = 0.0
+        self._refrescado_en = 0.0
+        self._reintentar_en = 0.0
+        self._lock = threading.Lock()
+
+    def _leer_desde(self, ultimo_id):
+        """Lee las filas de cliente_pagadores con id > ultimo_id, por páginas"""
+        filas = []
+        while True:
+            resp = (self.supabase.table("cliente_pagadores")
+                    .select("id, cliente, rut")
+                    .gt("id", ultimo_id)
+                    .order("id")
+                    .limit(TAMANO_PAGINA)
+                    .execute())
+            pagina = resp.data or []
+            filas.extend(pagina)
+            if len(pagina) < TAMANO_PAGINA:
+                return filas
+            ultimo_id = pagina[-1]["id"]
+
+    def _agregar(self, indice, cuerpo, cliente):
+        actual = indice.get(cuerpo)
+        if actual is None:
+            # Los nombres se repiten en muchas filas: una sola copia por cliente
+            indice[cuerpo] = sys.intern(cliente)
+        elif actual is not AMBIGUO and actual != cliente:
+            indice[cuerpo] = AMBIGUO
+
+    def _incorporar(self, indice, filas):
+        for fila in filas:
+            cuerpo = cuerpo_rut(fila.get("rut"))
+            if cuerpo is not None and fila.get("cliente"):
+                self._agregar(indice, cuerpo, fila["cliente"])
+            self._ultimo_id = max(self._ultimo_id, fila["id"])
+
+    def _refrescar(self):
+        ahora = time.monotonic()
+        if ahora < self._reintentar_en:
+            return
+        if ahora - self._cargado_en >= RECARGA_COMPLETA:
+            inicio = time.perf_counter()
+            self.cargar(self._leer_desde(0))
+            logging.info(f"[RUTS] Índice cargado: {len(self._indice)} RUT en {time.perf_counter() - inicio:.2f}s")
+        elif ahora - self._refrescado_en >= REFRESCO_INCREMENTAL:
+            nuevas = self._leer_desde(self._ultimo_id)
+            if nuevas:
+                indice = dict(self._indice)
+                self._incorporar(indice, nuevas)
+                self._indice = indice
+                logging.info(f"[RUTS] Índice actualizado con {len(nuevas)} RUT nuevos")
+            self._refrescado_en = ahora
+
+    def cargar(self, filas):
+        """Reemplaza el índice con las filas dadas ({'id', 'cliente', 'rut'}) y lo da por vigente"""
+        self._ultimo_id = 0
+        indice = {}
+        self._incorporar(indice, filas)
+        self._indice = indice
+        self._cargado_en = self._refrescado_en = time.monotonic()
+
+    def _indice_vigente(self):
+        with self._lock:
+            try:
+                self._refrescar()
+            except Exception as e:
+                # Sin base se sigue con el último índice leído y se reintenta más tarde
+                logging.error(f"[RUTS] Error al refrescar el índice de pagadores: {e}")
+                self._reintentar_en = time.monotonic() + REFRESCO_INCREMENTAL
+            return self._indice
+
+    def invalidar(self):
+        """Fuerza la recarga completa en la próxima consulta (eliminación o cambio de nombre)"""
+        with self._lock:
+            self._cargado_en = 0.0
+            self._reintentar_en = 0.0
+
+    def registrar(self, rut, cliente):
+        """Incorpora un RUT recién asociado sin esperar al refresco"""
+        cuerpo = cuerpo_rut(rut)
+        if cuerpo is None or not cliente:
+            return
+        with self._lock:
+            indice = dict(self._indice)
+            self._agregar(indice, cuerpo, cliente)
+            self._indice = indice
+
+    def resolver(self, rut):
+        """Devuelve el cliente del RUT (None si no está o si pertenece a varios clientes)"""
+        cliente = self._indice_vigente().get(cuerpo_rut(rut))
+        return None if cliente is AMBIGUO else cliente
+
+    def asignar_clientes(self, registros):
+        """
+        Completa 'cliente' en los registros que no lo tienen, según su 'rut'.
+        Args:
+            registros: Lista de dicts con 'rut' (se modifican en el lugar)
+        Returns:
+            int: Cantidad de registros a los que se asignó cliente
+        """
+        indice = self._indice_vigente()
+        asignados = 0
+        for registro in registros:
+            if registro.get("cliente"):
+                continue
+            cliente = indice.get(cuerpo_rut(registro.get("rut")))
+            if cliente is not None and cliente is not AMBIGUO:
+                registro["cliente"] = cliente
+                asignados += 1
+        return asignados
+
+_resolutor = None
+_resolutor_lock = threading.Lock()
+
+def obtener_resolutor(supabase_client):
+    """
+    Devuelve el resolutor único del proceso (los blueprints y la ingesta
+    comparten el mismo índice; se crea con el primer cliente de Supabase recibido).
+    """
+    global _resolutor
+    with _resolutor_lock:
+        if _resolutor is None:
+            _resolutor = ResolutorRuts(supabase_client)
+        return _resolutor